@@ -0,0 +1,156 @@
+"""
+Bounded memory capture of the output of long running commands.
+
+Only the most recent lines are kept in memory, in a ring of a configurable size.
+Lines that overflow the ring are appended to a file on disk,
+and are read back from that file only when they are accessed.
+"""
+
+import contextlib
+import os
+import tempfile
+import weakref
+from array import array
+from collections import deque
+from collections.abc import Sequence
+from itertools import islice
+from typing import Deque, Iterator, List, Optional, Union, overload
+
+from IPython.utils.text import SList
+from loguru import logger as log
+
+SPILL_PREFIX = "mpy_output_"
+
+
+class CaptureBuffer:
+    """Collect lines of output, keeping at most `ring_size` lines in memory.
+    A ring_size of 0 keeps all lines in memory.
+    """
+
+    def __init__(self, ring_size: int = 0, spill_dir: Optional[str] = None):
+        self.ring_size = max(0, ring_size)
+        self.spill_dir = spill_dir
+        self.ring: Deque[str] = deque()
+        # the offset of the start of each spilled line, and the end of the last line
+        self.offsets = array("Q", [0])
+        self._file = None
+        self._path = ""
+        self._finalizer: Optional[weakref.finalize] = None
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1 + len(self.ring)
+
+    def append(self, text: str):
+        """Add one or more lines of output"""
+        for line in text.splitlines():
+            self.ring.append(line)
+            if self.ring_size and len(self.ring) > self.ring_size:
+                self._spill(self.ring.popleft())
+
+    def _spill(self, line: str):
+        if not self._file:
+            fd, self._path = tempfile.mkstemp(
+                prefix=SPILL_PREFIX, suffix=".txt", dir=self.spill_dir
+            )
+            self._file = os.fdopen(fd, "ab")
+            # the file is removed if the output is not collected, such as after an error
+            self._finalizer = weakref.finalize(self, _discard, self._file, self._path)
+            log.debug(f"output exceeds {self.ring_size} lines, spilling to {self._path}")
+        data = line.encode("utf-8") + b"\n"
+        self._file.write(data)
+        self.offsets.append(self.offsets[-1] + len(data))
+
+    def result(self) -> Union[SList, "CapturedOutput"]:
+        """Return the captured lines.
+        Output that fitted in memory is returned as a SList, otherwise as a CapturedOutput.
+        """
+        if not self._file:
+            return SList(self.ring)
+        self._file.close()
+        if self._finalizer:
+            # the CapturedOutput removes the file
+            self._finalizer.detach()
+        return CapturedOutput(self._path, self.offsets, list(self.ring))
+
+    def close(self):
+        """Close and remove the spill file, unless it was handed to a CapturedOutput"""
+        if self._finalizer:
+            self._finalizer()
+
+
+class CapturedOutput(Sequence):
+    """A read-only sequence of lines of output, of which the oldest lines are stored on disk.
+    Spilled lines are read from the file on demand, so the output can be much larger than memory.
+    The file is removed when the CapturedOutput is no longer referenced.
+    """
+
+    def __init__(self, path: str, offsets: array, tail: List[str]):
+        self.path = path
+        self._offsets = offsets
+        self._tail = tail
+        self._finalizer = weakref.finalize(self, _remove, path)
+
+    @property
+    def spilled(self) -> int:
+        """The number of lines stored on disk"""
+        return len(self._offsets) - 1
+
+    def __len__(self) -> int:
+        return self.spilled + len(self._tail)
+
+    @overload
+    def __getitem__(self, index: int) -> str: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[str]: ...
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("CapturedOutput index out of range")
+        if index >= self.spilled:
+            return self._tail[index - self.spilled]
+        with open(self.path, "rb") as f:
+            f.seek(self._offsets[index])
+            return f.read(self._offsets[index + 1] - self._offsets[index])[:-1].decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        with open(self.path, "rb") as f:
+            for line in islice(f, self.spilled):
+                yield line[:-1].decode("utf-8")
+        yield from self._tail
+
+    def tail(self, n: int = 10) -> List[str]:
+        """The last n lines"""
+        return self[-n:] if n else []
+
+    # the same shortcuts as IPython's SList, note that these read all lines into memory
+    @property
+    def l(self) -> List[str]:
+        return list(self)
+
+    @property
+    def n(self) -> str:
+        return "\n".join(self)
+
+    nlstr = n
+
+    @property
+    def s(self) -> str:
+        return " ".join(self)
+
+    def __repr__(self) -> str:
+        return f"<CapturedOutput {len(self)} lines, {self.spilled} on disk in {self.path}>"
+
+
+def _discard(file, path: str):
+    file.close()
+    _remove(path)
+
+
+def _remove(path: str):
+    with contextlib.suppress(OSError):
+        os.remove(path)
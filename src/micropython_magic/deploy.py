@@ -0,0 +1,211 @@
+"""
+Deploy host files and folders to a fleet of MCUs.
+
+The files are copied to all devices at the same time, using a bounded pool of worker threads,
+one device per worker.
+Each device gets a single round trip to create the folders and to get the size and hash
+of all files, the files that are already identical on the device are skipped.
+The other files are copied in batches using a single mpremote command (or session) per batch,
+and a single round trip verifies the size and hash of the copied files.
+Files that are missing or differ after copying are copied again, up to `retries` times.
+"""
+
+import posixpath
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Union
+
+from loguru import logger as log
+
+from .mpr import MPRemote2
+from .render import _print_lock
+
+# the number of files copied by a single mpremote command
+BATCH_FILES = 20
+# files and folders that are not deployed
+IGNORE = {"__pycache__", ".git", ".ipynb_checkpoints"}
+
+MKDIR_CODE = """\
+import os
+for d in {folders}:
+    try:
+        os.mkdir(d)
+    except OSError:
+        pass
+"""
+
+
+@dataclass
+class DeployResult:
+    """The result of deploying files to a single device"""
+
+    port: str
+    files: int = 0  # number of files copied
+    skipped: int = 0  # number of files that were already identical on the device
+    size: int = 0  # number of bytes copied
+    seconds: float = 0.0
+    attempts: int = 0
+    failed: List[str] = field(default_factory=list)  # device paths that could not be copied
+    error: str = ""
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed and not self.error
+
+    @property
+    def throughput(self) -> float:
+        """bytes per second"""
+        return self.size / self.seconds if self.seconds else 0.0
+
+
+def collect_files(paths: Iterable[Union[str, Path]], dest: str = "") -> Dict[Path, str]:
+    """Map the host files to their path on the device.
+    Files are copied into `dest`, folders are copied recursively into `dest/<folder name>`.
+    """
+    dest = dest.lstrip(":").rstrip("/")
+    files: Dict[Path, str] = {}
+    for path in map(Path, paths):
+        if path.is_dir():
+            for f in sorted(path.rglob("*")):
+                rel = f.relative_to(path.parent)
+                if f.is_file() and not IGNORE.intersection(rel.parts):
+                    files[f] = posixpath.join(dest, *rel.parts)
+        elif path.is_file():
+            files[path] = posixpath.join(dest, path.name)
+        else:
+            raise FileNotFoundError(f"deploy: {path} not found")
+    return files
+
+
+def device_folders(files: Iterable[str]) -> List[str]:
+    """The folders to create on the device, parents before children"""
+    folders = set()
+    for f in files:
+        folder = posixpath.dirname(f)
+        while folder and folder != "/":
+            folders.add(folder)
+            folder = posixpath.dirname(folder)
+    return sorted(folders, key=lambda d: (d.count("/"), d))
+
+
+def deploy_to_device(
+    mcu: MPRemote2,
+    files: Dict[Path, str],
+    *,
+    retries: int = 2,
+    force: bool = False,
+    progress: Optional[Callable[[str], None]] = None,
+) -> DeployResult:
+    """Copy files to a single device, and retry the files that were not copied correctly"""
+    result = DeployResult(mcu.port)
+    sizes = {dest: src.stat().st_size for src, dest in files.items()}
+    todo = {str(src): dest for src, dest in files.items()}
+    start = time.perf_counter()
+    # allow for about 2KB/s on a slow serial connection
+    timeout = max(mcu.timeout, 60 + sum(sizes.values()) / 2000)
+    try:
+        folders = device_folders(files.values())
+        mkdir = MKDIR_CODE.format(folders=repr(folders)) if folders else ""
+        if force:
+            if mkdir:
+                mcu.run_cmd(["exec", mkdir], stream_out=False, timeout=timeout, store_output=False)
+        else:
+            # a single round trip creates the folders and gets the hashes of all files,
+            # the identical files are skipped
+            for src in mcu.unchanged_files(todo, timeout=timeout, setup=mkdir):
+                todo.pop(src)
+                result.skipped += 1
+        while todo and result.attempts <= retries:
+            result.attempts += 1
+            batch = list(todo.items())
+            for i in range(0, len(batch), BATCH_FILES):
+                chunk = dict(batch[i : i + BATCH_FILES])
+                try:
+                    mcu.copy_files_to_mcu(chunk, timeout=timeout, force=True)
+                except (OSError, ConnectionError) as e:
+                    log.warning(f"{mcu.port}: {e}")
+            # only the hashes of the copied files are unknown, and asked in a single round trip
+            for src in mcu.unchanged_files(todo, timeout=timeout):
+                dest = todo.pop(src)
+                result.files += 1
+                result.size += sizes[dest]
+            if progress:
+                progress(
+                    f"attempt {result.attempts}: {result.files + result.skipped}/{len(files)} files, "
+                    f"{result.skipped} unchanged, {result.size:,} bytes in "
+                    f"{time.perf_counter() - start:.1f}s"
+                )
+    except Exception as e:
+        log.error(f"{mcu.port}: {e}")
+        result.error = str(e)
+    result.failed = sorted(todo.values())
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+def deploy(
+    devices: List[MPRemote2],
+    paths: Iterable[Union[str, Path]],
+    dest: str = "",
+    *,
+    workers: int = 4,
+    retries: int = 2,
+    force: bool = False,
+    progress: bool = True,
+) -> Dict[str, DeployResult]:
+    """Copy host files and folders to multiple devices at the same time.
+    args:
+        devices: the devices to deploy to
+        paths: the host files and folders
+        dest: the device folder to copy to
+        workers: the maximum number of devices that are copied to at the same time
+        retries: the number of times files that failed to copy are retried
+        force: also copy the files that are already identical on the device
+        progress: print the progress of each device
+    Returns the DeployResult of each device by port.
+    """
+    files = collect_files(paths, dest)
+    width = max((len(mcu.port) for mcu in devices), default=0)
+
+    def report(port: str):
+        def printer(msg: str):
+            with _print_lock:
+                print(f"{port:<{width}} | {msg}", flush=True)
+
+        return printer if progress else None
+
+    results: Dict[str, DeployResult] = {}
+    if not files or not devices:
+        return results
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="deploy") as pool:
+        futures = {
+            pool.submit(
+                deploy_to_device,
+                mcu,
+                files,
+                retries=retries,
+                force=force,
+                progress=report(mcu.port),
+            ): mcu.port
+            for mcu in devices
+        }
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+    # in the order of the devices
+    return {mcu.port: results[mcu.port] for mcu in devices}
+
+
+def summary_table(results: Dict[str, DeployResult]) -> str:
+    """The results of a deploy as a text table, with one row per device"""
+    width = max([len("port")] + [len(port) for port in results])
+    columns = ["files", "skipped", "KB", "seconds", "KB/s", "attempts"]
+    lines = [f"{'port':<{width}}" + "".join(f"{c:>9}" for c in columns) + "  failed"]
+    for port, r in results.items():
+        failed = r.error or ", ".join(r.failed)
+        lines.append(
+            f"{port:<{width}}{r.files:>9}{r.skipped:>9}{r.size / 1024:>9.1f}{r.seconds:>9.1f}"
+            f"{r.throughput / 1024:>9.1f}{r.attempts:>9}  {failed}"
+        )
+    return "\n".join(lines)
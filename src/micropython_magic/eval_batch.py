@@ -0,0 +1,109 @@
+"""
+Evaluate several MicroPython expressions in a single execution on the MCU.
+
+Each expression is evaluated in its own try/except block in the globals of the MCU,
+so an error in one expression does not prevent the others from being evaluated.
+Each value is returned as json, or as its repr if it cannot be converted to json.
+"""
+
+import ast
+import json
+from typing import Any, Dict, List, Optional, Union
+
+from .logger import MCUException
+from .repr_parser import ReprError, parse_repr
+
+# the result of an expression: ok, a value that json cannot convert, or an error
+OK, REPR, ERROR = 1, 2, 0
+
+EXPRESSION = """\
+try:
+    _v = ({expr})
+    try:
+        _r[{key!r}] = [1, json.dumps(_v)]
+    except (TypeError, ValueError):
+        _r[{key!r}] = [2, repr(_v)]
+except Exception as e:
+    _r[{key!r}] = [0, type(e).__name__, str(e)]
+"""
+
+
+Expressions = Union[List[str], Dict[str, str]]
+
+
+def split_expressions(line: str) -> Optional[Expressions]:
+    """Split a tuple of expressions into a list, or a dict into a dict of name -> expression.
+    Returns None for a single expression.
+    """
+    try:
+        tree = ast.parse(line.strip(), mode="eval").body
+    except SyntaxError:
+        return None
+    if isinstance(tree, ast.Tuple) and tree.elts:
+        return [ast.get_source_segment(line.strip(), e) or "" for e in tree.elts]
+    if (
+        isinstance(tree, ast.Dict)
+        and tree.keys
+        and all(isinstance(k, ast.Constant) and isinstance(k.value, str) for k in tree.keys)
+    ):
+        return {
+            k.value: ast.get_source_segment(line.strip(), v) or ""  # type: ignore
+            for k, v in zip(tree.keys, tree.values)
+        }
+    return None
+
+
+def batch_code(expressions: Expressions, json_start: str, json_end: str) -> str:
+    """Return the MicroPython code that evaluates the expressions, and prints the results as json.
+    Expressions that are not valid syntax are not sent to the MCU.
+    """
+    lines = ["import json", "_r, _v = {}, None"]
+    for key, expr in _named(expressions).items():
+        if not _syntax_error(expr):
+            lines.append(EXPRESSION.format(expr=expr, key=key))
+    lines.append(f"print({json_start!r}, json.dumps(_r), {json_end!r})")
+    lines.append("del _r, _v")
+    return "\n".join(lines)
+
+
+def batch_result(expressions: Expressions, results: Dict[str, List]) -> Union[List, Dict]:
+    """Convert the results of the MCU to the value of each expression, in the same shape.
+    Expressions that failed are returned as a MCUException.
+    """
+    named = _named(expressions)
+    values = {}
+    for key, expr in named.items():
+        if error := _syntax_error(expr):
+            values[key] = MCUException(error)
+        elif key not in results:
+            values[key] = MCUException(f"no result for {expr}")
+        else:
+            values[key] = _value(*results[key])
+    if isinstance(expressions, dict):
+        return values
+    return list(values.values())
+
+
+def _named(expressions: Expressions) -> Dict[str, str]:
+    if isinstance(expressions, dict):
+        return dict(expressions)
+    return {str(i): expr for i, expr in enumerate(expressions)}
+
+
+def _syntax_error(expr: str) -> str:
+    try:
+        compile(expr, "<eval>", "eval")
+    except SyntaxError as e:
+        return f"SyntaxError: {e.msg}: {expr}"
+    return ""
+
+
+def _value(kind: int, payload: str, *message: str) -> Any:
+    if kind == OK:
+        return json.loads(payload)
+    if kind == REPR:
+        try:
+            return parse_repr(payload)
+        except ReprError:
+            return payload
+    return MCUException(f"{payload}: {message[0]}" if message and message[0] else payload)
@@ -0,0 +1,86 @@
+"""
+Compare files on the host with files on the MCU, without transferring them.
+
+The MCU reports the size and hash of a list of files in a single round trip.
+`hashlib.sha256` is used where the firmware has it, otherwise `binascii.crc32`.
+Files are hashed in small chunks, to avoid allocating the whole file on the MCU heap.
+"""
+
+import hashlib
+import zlib
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Union
+
+# returns the size, algorithm and hash of a file on the MCU
+HASH_FUNC = """\
+import binascii, json, os
+def _mpy_hash(f):
+    try:
+        size = os.stat(f)[6]
+    except OSError:
+        return [-1, "", ""]
+    try:
+        import hashlib
+        h, algo = hashlib.sha256(), "sha256"
+    except (ImportError, AttributeError):
+        h, algo = None, "crc32"
+        if not hasattr(binascii, "crc32"):
+            return [size, "", ""]
+    crc = 0
+    buf = bytearray(256)
+    mv = memoryview(buf)
+    with open(f, "rb") as fp:
+        while True:
+            n = fp.readinto(buf)
+            if not n:
+                break
+            if h:
+                h.update(mv[:n])
+            else:
+                crc = binascii.crc32(mv[:n], crc)
+    digest = binascii.hexlify(h.digest()).decode() if h else "%08x" % (crc & 0xFFFFFFFF)
+    return [size, algo, digest]
+"""
+
+# prints the size, algorithm and hash of each file as json, between the json markers
+HASH_CODE = HASH_FUNC + """\
+print("{json_start}", json.dumps([_mpy_hash(f) for f in {files}]), "{json_end}")
+del _mpy_hash
+"""
+
+
+class FileHash(NamedTuple):
+    """The size and hash of a file, size is -1 for a missing file, algo is empty if unknown"""
+
+    size: int
+    algo: str = ""
+    digest: str = ""
+
+    def __str__(self):
+        return f"{self.algo}:{self.digest}"
+
+
+def host_hash(path: Union[str, Path], algo: str = "sha256") -> FileHash:
+    """The FileHash of a host file, using the same algorithm as the MCU"""
+    data = Path(path).read_bytes()
+    if algo == "sha256":
+        digest = hashlib.sha256(data).hexdigest()
+    elif algo == "crc32":
+        digest = f"{zlib.crc32(data):08x}"
+    else:
+        return FileHash(len(data))
+    return FileHash(len(data), algo, digest)
+
+
+def same_file(path: Union[str, Path], on_device: FileHash) -> bool:
+    """Check if a host file has the same size and hash as a file on the device"""
+    if on_device.size < 0 or not on_device.algo:
+        return False
+    if Path(path).stat().st_size != on_device.size:
+        return False
+    return host_hash(path, on_device.algo) == on_device
+
+
+def parse_hashes(files: List[str], hashes: List[List]) -> Dict[str, FileHash]:
+    """Map the device files to their FileHash, as reported by the MCU"""
+    return {f: FileHash(*h) for f, h in zip(files, hashes)}
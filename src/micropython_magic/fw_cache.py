@@ -0,0 +1,87 @@
+"""
+Store of the firmware info of devices, kept on disk between kernel sessions.
+
+The firmware info is keyed by the unique id of the device ( `machine.unique_id()` ) and the port,
+so a different board on the same port, or the same board on a different port, is not confused.
+Reading the unique id of a device is a much shorter round trip than collecting its firmware info.
+"""
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+from loguru import logger as log
+
+from .script_access import CACHE_PATH
+
+# prints the unique id of the device as hex, or an empty line on a port without a unique id
+UNIQUE_ID_CODE = """\
+try:
+    import binascii, machine
+    print(binascii.hexlify(machine.unique_id()).decode())
+except Exception:
+    print()
+"""
+
+
+class FWInfoStore:
+    """A json file with the firmware info of devices, by unique id and port"""
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(unique_id: str, port: str) -> str:
+        return f"{unique_id}@{port}"
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            return json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, store: Dict[str, Dict[str, Any]]):
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(store, indent=1))
+            os.replace(tmp, self.path)
+        except OSError as e:
+            log.warning(f"Could not save the firmware info to {self.path}: {e}")
+
+    def get(self, unique_id: str, port: str) -> Optional[Dict[str, Any]]:
+        """The firmware info of a device, or None if not known"""
+        if not unique_id:
+            return None
+        with self._lock:
+            return self._load().get(self.key(unique_id, port))
+
+    def has_port(self, port: str) -> bool:
+        """Is the firmware info of any device on the port known"""
+        with self._lock:
+            return any(key.endswith(f"@{port}") for key in self._load())
+
+    def put(self, port: str, info: Dict[str, Any]):
+        """Store the firmware info of a device, that includes its unique id"""
+        if not info.get("unique_id"):
+            return
+        with self._lock:
+            store = self._load()
+            store[self.key(info["unique_id"], port)] = dict(info)
+            self._save(store)
+
+    def forget(self, port: str):
+        """Forget the firmware info of the devices on a port"""
+        with self._lock:
+            store = self._load()
+            keys = [key for key in store if key.endswith(f"@{port}")]
+            for key in keys:
+                del store[key]
+            if keys:
+                self._save(store)
+
+
+FW_INFO_STORE = FWInfoStore(CACHE_PATH / "fw_info.json")
@@ -1,22 +1,45 @@
 import contextlib
+import enum
 import os
+import queue
 import re
+import selectors
 import signal
 import subprocess
 import sys
-from dataclasses import dataclass
-from threading import Timer
-from typing import List, Optional, Union
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple, Union
 
 from IPython.core.getipython import get_ipython
 from IPython.core.interactiveshell import InteractiveShell
 from IPython.utils.text import SList
 from loguru import logger as log
 
+from .capture import CaptureBuffer, CapturedOutput
 from .logger import MCUException
-from .memoryinfo import RE_ALL
+from .memoryinfo_regex import RE_ALL
+from .render import FrameRenderer
+from .stats import STATS
 
 TIMEOUT = 300
+POLL_INTERVAL = 0.05  # seconds between checks for timeouts and interrupts
+CHUNK_SIZE = 4096
+REAP_TIMEOUT = 5  # seconds to wait for a process to exit after its output has ended
+
+
+class LineKind(enum.IntFlag):
+    """The categories a line of output can belong to"""
+
+    NONE = 0
+    RESET = enum.auto()
+    ERROR = enum.auto()
+    TRACE = enum.auto()
+    WARNING = enum.auto()
+    SUCCESS = enum.auto()
+    IGNORE = enum.auto()
+    MEMINFO = enum.auto()
 
 
 @dataclass
@@ -28,6 +51,64 @@ class LogTags:
     ignore_tags: List[str]
     trace_tags: List[str]
     trace_res: List[str]
+    _matchers: Dict[bool, "_TagMatcher"] = field(
+        default_factory=dict, init=False, repr=False, compare=False
+    )
+
+    def compile(self, meminfo: bool = False) -> "_TagMatcher":
+        """Compile the tags into a single matcher.
+        All tags are combined into one alternation that is searched for anywhere in a line,
+        and the trace and meminfo regexes into one alternation that is matched at the start of a line.
+        The matcher is cached, changes to the tags after the first use are not picked up.
+        """
+        if meminfo in self._matchers:
+            return self._matchers[meminfo]
+        kind_of_tag: Dict[str, LineKind] = {}
+        always = LineKind.NONE
+        for kind, tags in (
+            (LineKind.RESET, self.reset_tags),
+            (LineKind.ERROR, self.error_tags),
+            (LineKind.TRACE, self.trace_tags),
+            (LineKind.WARNING, self.warning_tags),
+            (LineKind.SUCCESS, self.success_tags),
+            (LineKind.IGNORE, self.ignore_tags),
+        ):
+            for tag in tags:
+                if tag:
+                    kind_of_tag[tag] = kind_of_tag.get(tag, LineKind.NONE) | kind
+                else:
+                    # an empty tag matches any line
+                    always |= kind
+        tags_rx = re.compile("|".join(map(re.escape, kind_of_tag))) if kind_of_tag else None
+        anchored = []
+        if self.trace_res:
+            anchored.append("(?P<trace>" + "|".join(f"(?:{rx})" for rx in self.trace_res) + ")")
+        if meminfo:
+            anchored.append("(?P<meminfo>" + "|".join(f"(?:{rx.pattern})" for rx in RE_ALL) + ")")
+        anchored_rx = re.compile("|".join(anchored)) if anchored else None
+        matcher = _TagMatcher(tags_rx, kind_of_tag, anchored_rx, always)
+        self._matchers[meminfo] = matcher
+        return matcher
+
+    def classify(self, output: str, meminfo: bool = False) -> LineKind:
+        """Return all categories of a line of output"""
+        tags_rx, kind_of_tag, anchored_rx, kind = self.compile(meminfo)
+        # usually a single search that finds nothing,
+        # only lines with a tag are checked for every tag, as tags of different kinds may overlap
+        if tags_rx and tags_rx.search(output):
+            for tag, tag_kind in kind_of_tag.items():
+                if tag in output:
+                    kind |= tag_kind
+        if anchored_rx and (match := anchored_rx.match(output)):
+            kind |= LineKind.TRACE if match.lastgroup == "trace" else LineKind.MEMINFO
+        return kind
+
+
+class _TagMatcher(NamedTuple):
+    tags_rx: Optional[re.Pattern]
+    kind_of_tag: Dict[str, LineKind]
+    anchored_rx: Optional[re.Pattern]
+    always: LineKind
 
 
 DEFAULT_LOG_TAGS = LogTags(
@@ -44,11 +125,14 @@ DEFAULT_LOG_TAGS = LogTags(
 # todo : pass in the to detect in the output
 def do_output(output: str, tags: LogTags, log_errors=True, hide_meminfo=False) -> bool:
     """Assess a line of output, return True if the output should be displayed"""
+    kind = tags.classify(output, meminfo=hide_meminfo and bool(output))
+    if not kind:
+        return True
     # detect board reset
-    if any(tag in output for tag in tags.reset_tags):
+    if kind & LineKind.RESET:
         raise RuntimeError(f"Board reset detected : {output}")
     # detect errors
-    if log_errors and any(tag in output for tag in tags.error_tags):
+    if log_errors and kind & LineKind.ERROR:
         # just log the error , rather than trying to re-raise the MCU exception
         log.error(output)
         raise MCUException(output)
@@ -58,24 +142,188 @@ def do_output(output: str, tags: LogTags, log_errors=True, hide_meminfo=False) -
         #     raise MCUException(output)
         # return False
     # detect tracebacks
-    if any(tag in output for tag in tags.trace_tags) or any(re.match(rx, output) for rx in tags.trace_res):
+    if kind & LineKind.TRACE:
         log.warning(output.rstrip())
         return False
     # detect warnings
-    if any(tag in output for tag in tags.warning_tags):
+    if kind & LineKind.WARNING:
         log.warning(output)
     # detect success
-    if any(tag in output for tag in tags.success_tags):
+    if kind & LineKind.SUCCESS:
         log.success(output)
     # ignore some tags
-    if any(tag in output for tag in tags.ignore_tags):
+    if kind & LineKind.IGNORE:
         return False
     # do not output the line that matched a meminfo regex
-    if hide_meminfo and output and any(rx.match(output) for rx in RE_ALL):
+    if kind & LineKind.MEMINFO:
         return False
     return True
 
 
+class OutputCollector:
+    """Collect the output of a command line by line, assess each line and stream it to the console.
+    Used for the output of the mpremote subprocess as well as the output of a device session.
+    """
+
+    def __init__(
+        self,
+        *,
+        stream_out: bool = True,
+        hide_meminfo: bool = False,
+        log_errors: bool = True,
+        tags: LogTags = DEFAULT_LOG_TAGS,
+        capture_lines: int = 0,
+        refresh_rate: float = 0,
+        visible_lines: int = 0,
+        prefix: str = "",
+        on_line: Optional[Callable[[str], bool]] = None,
+    ):
+        self.stream_out = stream_out
+        self.on_line = on_line
+        self.hide_meminfo = hide_meminfo
+        self.log_errors = log_errors
+        self.tags = tags
+        self.all_out = CaptureBuffer(capture_lines)
+        self.renderer = FrameRenderer(refresh_rate, visible_lines, prefix=prefix)
+        self._partial: List[bytes] = []  # the chunks of a line that is not complete yet
+
+    def line(self, output: str):
+        """Assess, store and stream a single line of output"""
+        if "no device found" in output or "failed to access" in output:
+            raise ConnectionError(output.strip())
+        log.trace(f"output: {output}")
+        if self.on_line and self.on_line(output):
+            return
+        if not do_output(
+            output, self.tags, log_errors=self.log_errors, hide_meminfo=self.hide_meminfo
+        ):
+            return
+        if output:
+            self.all_out.append(output)
+            if self.stream_out:
+                self.renderer.write(output)
+
+    def feed(self, data: bytes):
+        """Feed a chunk of raw output, complete lines are processed as they become available"""
+        start = 0
+        # only the new chunk is searched, a long line is joined once when it is complete
+        while (eol := data.find(b"\n", start)) >= 0:
+            line_b = data[start : eol + 1]
+            if self._partial:
+                self._partial.append(line_b)
+                line_b = b"".join(self._partial)
+                self._partial.clear()
+            self.line(line_b.decode("utf-8", errors="ignore"))
+            start = eol + 1
+        if start < len(data):
+            self._partial.append(data[start:])
+
+    def flush(self):
+        """Process any remaining partial line, and render all pending output"""
+        if self._partial:
+            line_b = b"".join(self._partial)
+            self._partial.clear()
+            self.line(line_b.decode("utf-8", errors="ignore"))
+        self.renderer.flush()
+
+    def tick(self):
+        """Render pending output once the refresh interval has passed"""
+        self.renderer.tick()
+
+    def close(self):
+        """Release the spill file of output that was not collected as a result"""
+        self.all_out.close()
+
+    def result(self, store_output: bool = True) -> Union[SList, CapturedOutput]:
+        """Return the collected output as a list of lines"""
+        all_out = self.all_out.result()
+        if store_output:
+            # update the ipython kernel namespace with the output of the command
+            # this is useful for storing the output of a command in a variable
+            # Normally the output of a command is not stored in the kernel namespace
+            ipy: InteractiveShell = get_ipython()  # type: ignore
+            ipy.displayhook.fill_exec_result(all_out)
+            ipy.displayhook.update_user_ns(all_out)
+        return all_out
+
+
+class PipePump:
+    """Read the stdout and stderr pipes of a process together, in chunks, without blocking on either.
+
+    On posix systems a selector is used to wait for the pipes to become readable.
+    Windows does not support selectors on pipes, so there a reader thread per pipe feeds a queue.
+    """
+
+    def __init__(self, process: subprocess.Popen):
+        self.pipes = {
+            p: name for p, name in ((process.stdout, "stdout"), (process.stderr, "stderr")) if p
+        }
+        self._open = set(self.pipes)
+        if os.name == "nt":  # pragma: no cover
+            self._queue: queue.Queue = queue.Queue()
+            for pipe, name in self.pipes.items():
+                threading.Thread(target=self._reader, args=(pipe, name), daemon=True).start()
+        else:
+            self._selector = selectors.DefaultSelector()
+            for pipe, name in self.pipes.items():
+                self._selector.register(pipe, selectors.EVENT_READ, name)
+
+    @property
+    def eof(self) -> bool:
+        """All pipes have been closed by the process"""
+        return not self._open
+
+    def read(self, timeout: float) -> List[Tuple[str, bytes]]:
+        """Wait up to timeout seconds for output, return a list of (pipe name, data) chunks"""
+        if os.name == "nt":  # pragma: no cover
+            return self._read_queue(timeout)
+        chunks = []
+        for key, _ in self._selector.select(timeout):
+            data = os.read(key.fd, CHUNK_SIZE)
+            if not data:
+                self._selector.unregister(key.fileobj)
+                self._open.discard(key.fileobj)
+                continue
+            chunks.append((key.data, data))
+        return chunks
+
+    def _read_queue(self, timeout: float) -> List[Tuple[str, bytes]]:  # pragma: no cover
+        chunks = []
+        try:
+            item = self._queue.get(timeout=timeout)
+            while True:
+                pipe, data = item
+                if data:
+                    chunks.append((self.pipes[pipe], data))
+                else:
+                    self._open.discard(pipe)
+                item = self._queue.get_nowait()
+        except queue.Empty:
+            pass
+        return chunks
+
+    def _reader(self, pipe, name):  # pragma: no cover
+        while data := pipe.read1(CHUNK_SIZE):
+            self._queue.put((pipe, data))
+        self._queue.put((pipe, b""))
+
+    def close(self):
+        if os.name != "nt":
+            self._selector.close()
+
+
+def reap(process: subprocess.Popen, timeout: float = REAP_TIMEOUT) -> Optional[int]:
+    """Wait for a process to exit, kill it if it does not, and return its exit code"""
+    try:
+        return process.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        log.warning(f"Process {process.pid} did not exit after {timeout} seconds, killing it")
+        process.kill()
+        with contextlib.suppress(subprocess.TimeoutExpired):
+            return process.wait(timeout=timeout)
+    return None
+
+
 def ipython_run(
     cmd: List[str],
     stream_out=True,
@@ -86,9 +334,14 @@ def ipython_run(
     log_errors: bool = True,
     tags: LogTags = DEFAULT_LOG_TAGS,
     follow: bool = True,
+    capture_lines: int = 0,
+    refresh_rate: float = 0,
+    visible_lines: int = 0,
+    prefix: str = "",
+    on_line: Optional[Callable[[str], bool]] = None,
     # port: Optional[str] = "",
 ) -> Optional[
-    SList
+    Union[SList, CapturedOutput]
 ]:  # sourcery skip: assign-if-exp, boolean-if-exp-identity, reintroduce-else, remove-unnecessary-cast, use-contextlib-suppress
     """Run an external command stream the output back to the Ipython console.
     args:
@@ -101,84 +354,89 @@ def ipython_run(
         log_errors: log errors to the console
         tags: a LogTags object containing the tags to detect in the output
         follow: follow the output of the command until it finishes
+        capture_lines: the number of lines of output to keep in memory, older lines are written to a file.
+            0 keeps all output in memory
+        refresh_rate: the maximum number of times per second that streamed output is rendered.
+            0 renders each line as it is received
+        visible_lines: the number of lines of streamed output that remain visible, 0 shows all output
+        prefix: a prefix for each line of streamed output, such as the port of the device
+        on_line: called with each line of output, lines for which it returns True are not
+            assessed, stored or streamed
 
     returns:
         (exit_code:int, output:List[str])
         a tuple of the exit code of the command and the output of the command
     """
-    # Only implement line based reading and parsing for now
-    # it is, faster, easier to implement and more useful for parsing regexes
-    line_based = True
     interupted = False
+    timed_out = False
     forever = timeout == 0
     timeout = abs(timeout)
 
-    all_out = []
-    output = ""
+    collector = OutputCollector(
+        stream_out=stream_out,
+        hide_meminfo=hide_meminfo,
+        log_errors=log_errors,
+        tags=tags,
+        capture_lines=capture_lines,
+        refresh_rate=refresh_rate,
+        visible_lines=visible_lines,
+        prefix=prefix,
+        on_line=on_line,
+    )
+    stderr_out = b""
 
-    log.debug(f"{'line' if line_based else 'char'} based, with timeout of {timeout} seconds")
+    log.debug(f"chunk based, with timeout of {timeout} seconds")
     assert isinstance(cmd, list)
     try:
-        process = subprocess.Popen(
-            cmd,
-            shell=False,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            start_new_session=False,
-        )  # ,  universal_newlines=True)
+        with STATS.span("spawn"):
+            process = subprocess.Popen(
+                cmd,
+                shell=False,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                start_new_session=False,
+            )  # ,  universal_newlines=True)
     except FileNotFoundError as e:  # pragma: no cover
         raise FileNotFoundError(f"Failed to start {cmd[0]}") from e
+    # startup: until the first output, includes the mpremote import, port open and raw-REPL entry
+    # output: the execution on the device and the output until the process ends
+    started = first_output = time.perf_counter()
 
     assert process.stdout is not None
     if follow == False:
         # we do not need to follow the output of the command
         # just return
         return None
-    process_timer = None
+    pump = PipePump(process)
+    deadline = None if forever else time.monotonic() + timeout
     try:
-        if not forever:
-            # only if a timeout was specified start a timer to kill the process
-            def timed_out():
+        # a single loop reads stdout and stderr together, and checks the deadline
+        # the short poll interval allows Ctrl-C / KeyboardInterrupt to be handled without waiting for a newline
+        while not pump.eof:
+            for name, data in pump.read(POLL_INTERVAL):
+                if name == "stdout":
+                    if first_output == started:
+                        first_output = time.perf_counter()
+                        STATS.record("startup", started, first_output - started)
+                    collector.feed(data)
+                elif log_errors:
+                    stderr_out += data
+                    *lines, stderr_out = stderr_out.split(b"\n")
+                    for line in lines:
+                        log.warning(line.decode("utf-8", errors="ignore"))
+            collector.tick()
+            if deadline and time.monotonic() > deadline:
                 process.kill()
+                timed_out = True
                 log.warning(f"Command {cmd} timed out after {timeout} seconds")
-
-            process_timer = Timer(interval=timeout, function=timed_out)
-            process_timer.start()
-        while forever or (process_timer and process_timer.is_alive()):
-            if line_based:
-                # TODO: Ctrl-C / KeyboardInterrupt is only detected at line-end (after \n)
-                output_b = process.stdout.readline()
-                output = output_b.decode("utf-8", errors="ignore")
-                if "no device found" in output or "failed to access" in output:
-                    raise ConnectionError(output.strip())
-                log.trace(f"output: {output}")
-                if not do_output(output, tags, log_errors=log_errors, hide_meminfo=hide_meminfo):
-                    continue
-
-            else:
-                output_b = process.stdout.read(1)
-                # ToDo # swallow the output if it matches a regex
-                output = output_b.decode("utf-8", errors="ignore")
-
-            if output == "" and process.poll() is not None:
-                # process has finished, read the rest of the output before breaking out of the loop
                 break
-            if output:
-                all_out.append(output)
-                if stream_out:
-                    print(output, end="")
-                output = ""
-
-        # rearrange the output to be a list of lines
-        all_out = SList("".join(all_out).splitlines())
-        if store_output:
-            # update the ipython kernel namespace with the output of the command
-            # this is useful for storing the output of a command in a variable
-            # Normally the output of a command is not stored in the kernel namespace
-            ipy: InteractiveShell = get_ipython()  # type: ignore
-            ipy.displayhook.fill_exec_result(all_out)
-            ipy.displayhook.update_user_ns(all_out)
-        return all_out
+        STATS.record("output", first_output, time.perf_counter() - first_output)
+        returncode = reap(process)
+        if returncode and not timed_out and log_errors:
+            log.warning(f"Command {cmd} exited with code {returncode}")
+
+        collector.flush()
+        return collector.result(store_output)
     except KeyboardInterrupt:  # pragma: no cover
         # if the user presses ctrl-c or stops the cell,
         # kill the process and raise a keyboard interrupt
@@ -191,10 +449,8 @@ def ipython_run(
                 os.kill(process.pid, signal.SIGINT)
             # kill the process
             process.kill()
-            if process_timer:
-                process_timer.cancel()
-            if output:
-                do_output(output, tags, log_errors=log_errors, hide_meminfo=hide_meminfo)
+            reap(process)
+            collector.flush()
     except MCUException as mcu_e:
         log.trace("re-raise MCUException")
         raise mcu_e
@@ -212,11 +468,17 @@ def ipython_run(
         sys.unraisablehook = unraisable_hook
 
         try:
-            if process.stderr and log_errors:
-                for line in process.stderr:
-                    log.warning(line)
-            if not interupted and process_timer and process_timer.is_alive():
-                process_timer.cancel()
+            if stderr_out and log_errors:
+                log.warning(stderr_out.decode("utf-8", errors="ignore"))
+            if process.poll() is None:
+                # an error in the output ended the loop while the process is still running
+                process.kill()
+                reap(process)
+            pump.close()
+            for pipe in (process.stdout, process.stderr):
+                if pipe:
+                    pipe.close()
+            collector.close()
         except Exception as e:
             log.trace(e)
 
@@ -0,0 +1,150 @@
+"""
+Time MicroPython code on the MCU itself.
+
+A timing harness is sent to the MCU, and uses `time.ticks_us()` to measure the statement,
+so the timing does not include the overhead of mpremote and the serial connection.
+"""
+
+import ast
+import json
+from textwrap import dedent, indent
+from typing import List, Optional, Set
+
+from IPython.core.magics.execution import TimeitResult
+
+from .mpr import JSON_END, JSON_START
+from .runtime import RUNTIME_NAME, TIMEIT_FUNC
+
+# the minimal duration of a run when the number of loops is determined automatically
+MIN_RUN_US = 200_000
+
+HARNESS = """\
+import gc, json, time
+{setup}
+def _mpy_timeit(_n):
+{globals}    _t0 = time.ticks_us()
+    for _ in range(_n):
+{stmt}
+    return time.ticks_diff(time.ticks_us(), _t0)
+{timeit_func}try:
+    _mpy_timeit_run(_mpy_timeit, {number}, {repeat}, {collect}, {min_run_us})
+finally:
+    del _mpy_timeit, _mpy_timeit_empty, _mpy_timeit_alloc, _mpy_timeit_run
+"""
+
+# the same, using the timing harness of the helper runtime
+RUNTIME_HARNESS = """\
+import time
+{setup}
+def _mpy_timeit(_n):
+{globals}    _t0 = time.ticks_us()
+    for _ in range(_n):
+{stmt}
+    return time.ticks_diff(time.ticks_us(), _t0)
+try:
+    {runtime}.timeit(_mpy_timeit, {number}, {repeat}, {collect}, {min_run_us})
+finally:
+    del _mpy_timeit
+"""
+
+
+# the nodes with a scope of their own, the names they bind are not in the scope of the code
+DEFINITIONS = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+SCOPES = DEFINITIONS + (ast.Lambda, ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)
+
+
+def _bound_names(code: str) -> Set[str]:
+    """Return the names that the code assigns, imports or defines in its own scope"""
+    names = set()
+    nodes: List[ast.AST] = [ast.parse(dedent(code))]
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Load):
+            names.add(node.id)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            names.update((a.asname or a.name).split(".")[0] for a in node.names)
+        if isinstance(node, DEFINITIONS):
+            names.add(node.name)
+        if not isinstance(node, SCOPES):
+            nodes.extend(ast.iter_child_nodes(node))
+    return names
+
+
+def _global_names(stmt: str, setup: str) -> List[str]:
+    """Return the names of the setup that the statement assigns.
+    The setup runs at module level, so these must be declared global in the timing function,
+    as `x += 1` would otherwise raise an UnboundLocalError.
+    """
+    try:
+        return sorted(_bound_names(setup) & _bound_names(stmt))
+    except SyntaxError:
+        # let the MCU report the error
+        return []
+
+
+def timeit_code(
+    stmt: str,
+    setup: str = "",
+    *,
+    number: int = 0,
+    repeat: int = 7,
+    collect: bool = False,
+    runtime: bool = False,
+) -> str:
+    """Return the MicroPython code to time a statement on the MCU.
+    args:
+        stmt: the statement(s) to time
+        setup: statement(s) to run once, before the timing
+        number: the number of loops per run, 0 to determine the number automatically
+        repeat: the number of runs
+        collect: run gc.collect() before each run
+        runtime: use the timing harness of the helper runtime, rather than sending it
+    """
+    names = _global_names(stmt, setup)
+    return (RUNTIME_HARNESS if runtime else HARNESS).format(
+        setup=setup,
+        globals=f"    global {', '.join(names)}\n" if names else "",
+        stmt=indent(stmt.strip("\n") or "pass", " " * 8),
+        number=int(number),
+        repeat=max(1, int(repeat)),
+        collect=bool(collect),
+        min_run_us=MIN_RUN_US,
+        runtime=RUNTIME_NAME,
+        timeit_func=TIMEIT_FUNC.format(json_start=JSON_START, json_end=JSON_END),
+    )
+
+
+class MCUTimeitResult(TimeitResult):
+    """The result of %mpy_timeit, with the same attributes as the result of IPython's %timeit.
+    In addition `allocated` is the number of bytes allocated on the MCU heap by a single loop.
+    """
+
+    def __init__(
+        self, loops: int, repeat: int, all_runs: List[float], allocated: int, precision: int = 3
+    ):
+        super().__init__(
+            loops,
+            repeat,
+            min(all_runs) / loops,
+            max(all_runs) / loops,
+            all_runs,
+            0,
+            precision,
+        )
+        self.allocated = allocated
+
+    @classmethod
+    def from_output(cls, output: List[str], precision: int = 3) -> Optional["MCUTimeitResult"]:
+        """Create the result from the output of the timing harness"""
+        for line in output:
+            if line.startswith(JSON_START) and line.endswith(JSON_END):
+                data = json.loads(line[len(JSON_START) : -len(JSON_END)])
+                runs = [us / 1_000_000 for us in data["runs"]]
+                return cls(data["loops"], len(runs), runs, data["alloc"], precision)
+        return None
+
+    def __str__(self):
+        return f"{super().__str__()}, {self.allocated:,} bytes allocated per loop"
+
+    def _repr_pretty_(self, p, cycle):
+        p.text(f"<MCUTimeitResult : {self}>")
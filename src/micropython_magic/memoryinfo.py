@@ -1,68 +1,84 @@
 from __future__ import annotations
 
 import datetime
-import re
 import time
 from dataclasses import InitVar, dataclass
-from functools import cached_property
-from typing import Any, Dict, Iterable, List, Optional, Union
-
-import matplotlib.dates as mpl_dates
-import matplotlib.pyplot as plt
-import numpy as np
-from colorama import Back, Fore, Style
-from IPython.display import display, update_display
+from functools import cached_property, lru_cache
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Union
+
+from colorama import Back, Fore
+from IPython.display import Image, display, update_display
 from IPython.lib.pretty import PrettyPrinter
 from loguru import logger as log
-from matplotlib import ticker
-from matplotlib.backend_bases import MouseEvent
-from matplotlib.lines import Line2D
 
-RE_HEAD_1 = re.compile(r"GC: total: (\d+), used: (\d+), free: (\d+)")
-RE_HEAD_2 = re.compile(
-    r"\s?No. of 1-blocks: (\d+), 2-blocks: (\d+), max blk sz: (\d+), max free sz: (\d+)"
-)
-RE_D_TIME = re.compile(r"time:\s?(\([\d|,|\s]+\))")
-RE_STACK = re.compile(r"stack: (\d+) out of (\d+)")
-RE_BLOCK = re.compile(r"^[0-9a-fA-F]*\: (.*)", flags=re.MULTILINE)
-RE_FREE = re.compile(r"\((.*) lines all free\)")
-# setup terminators
-# Updated to handle both standard format (space) and decorator format (colon)
-# Examples: "*** Memory info test ***" and "*** Memory info: test ***"
-# Using [^*]* to match any characters except asterisks (more semantically correct)
-RE_MEM_INFO_START = re.compile(r"\*\*\* Memory info\s*:?\s*([^*]*?)\s*\*\*\*")
-RE_MEM_INFO_END = re.compile(r"\*\*\*\*\*\*\*\*\*\*\*\*\*\*\*\*\*\*\*\*\*")
-
-RE_ALL = [
-    RE_HEAD_1,
-    RE_HEAD_2,
-    RE_D_TIME,
-    RE_STACK,
+# the regexes are also available from this module
+from .memoryinfo_regex import (
+    RE_ALL,
     RE_BLOCK,
+    RE_D_TIME,
     RE_FREE,
-    RE_MEM_INFO_START,
+    RE_HEAD_1,
+    RE_HEAD_2,
+    RE_MAP_BYTES,
     RE_MEM_INFO_END,
-]
-
-#  a numpy datatype to hold the memory info for a series of memory maps
-DT_MEMINFO = np.dtype(
-    {
-        "names": [
-            "description",  # U25
-            "datetime",  # M
-            "total",
-            "used",
-            "free",
-            "max free",
-            "1-blocks",
-            "2-blocks",
-            "max block",
-            "stack",
-            "stack used",
-        ],
-        "formats": ["U25", "datetime64[us]", "i4", "i4", "i4", "i4", "i4", "i4", "i4", "i4", "i4"],
-    }
+    RE_MEM_INFO_START,
+    RE_STACK,
 )
+from .memoryinfo_diff import BLOCK_SIZE
+from .memoryinfo_render import diff_rows, map_rows
+from .repr_parser import parse_repr
+
+# numpy and matplotlib are only imported when the numpy arrays or plots are used
+if TYPE_CHECKING:
+    import numpy as np
+    from matplotlib.backend_bases import MouseEvent
+    from matplotlib.lines import Line2D
+
+    from .memoryinfo_diff import MapDiff
+
+
+@lru_cache(maxsize=None)
+def dt_meminfo() -> "np.dtype":
+    """a numpy datatype to hold the memory info for a series of memory maps"""
+    import numpy as np
+
+    return np.dtype(
+        {
+            "names": [
+                "description",  # U25
+                "datetime",  # M
+                "total",
+                "used",
+                "free",
+                "max free",
+                "1-blocks",
+                "2-blocks",
+                "max block",
+                "stack",
+                "stack used",
+            ],
+            "formats": [
+                "U25",
+                "datetime64[us]",
+                "i4",
+                "i4",
+                "i4",
+                "i4",
+                "i4",
+                "i4",
+                "i4",
+                "i4",
+                "i4",
+            ],
+        }
+    )
+
+
+def __getattr__(name: str):
+    # DT_MEMINFO is created on first use, to avoid importing numpy
+    if name == "DT_MEMINFO":
+        return dt_meminfo()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 COL_WIDTH = 64
@@ -119,6 +135,11 @@ class MemoryInfo:
     parent: Optional[MemoryInfoList] = None
     _columns: int = 4
     _show_free = False
+    _image = False
+    _zoom = 1
+    # the memory map, one byte per block, and its str view that is created when used
+    _map = b""
+    _mmap = None
 
     def __post_init__(self, mmap: str, cols):
         if mmap:
@@ -139,6 +160,22 @@ class MemoryInfo:
     def diff_with(self):
         return self.parent.diff_with if self.parent else None
 
+    @property
+    def blocks(self) -> "np.ndarray":
+        """The memory map as a read-only numpy array of the block codes, one uint8 per block"""
+        import numpy as np
+
+        return np.frombuffer(self._map, dtype=np.uint8)
+
+    def _get_mmap(self) -> str:
+        if self._mmap is None:
+            self._mmap = self._map.decode("ascii")
+        return self._mmap
+
+    def _set_mmap(self, value: str):
+        self._map = value.encode("ascii", "replace")
+        self._mmap = None
+
     @property
     def show_free(self):
         return self.parent.show_free if self.parent else self._show_free
@@ -147,6 +184,24 @@ class MemoryInfo:
     def show_free(self, val: bool):
         self._show_free = val
 
+    @property
+    def image(self):
+        """Display the memory map as an image, rather than as colored text"""
+        return self.parent.image if self.parent else self._image
+
+    @image.setter
+    def image(self, val: bool):
+        self._image = val
+
+    @property
+    def zoom(self):
+        """The size in pixels of a block in the image"""
+        return self.parent.zoom if self.parent else self._zoom
+
+    @zoom.setter
+    def zoom(self, val: int):
+        self._zoom = val
+
     def _header(self):
         head = f"{Fore.WHITE}{Back.BLACK}"
         if self.diff_with:
@@ -168,23 +223,13 @@ class MemoryInfo:
         if cycle:
             pp.text("MemoryInfo(...)")
             return
-        width = COL_WIDTH * self.columns
-        text = self._header()
-        color = Fore.WHITE
-
-        for i in range(len(self.mmap)):
-            # '=' keeps the same color
-            if self.mmap[i] != "=":
-                color = self.pcolor(self.mmap[i])
-            text += color + self.mmap[i]
-            # columns
-            if (i + 1) % COL_WIDTH == 0:
-                text += f"{Style.RESET_ALL} "
-            # rows
-            if (i + 1) % width == 0:
-                text += Style.RESET_ALL + "\n"
+        if self.image:
+            # the map is shown by _repr_png_, only the header is printed
+            pp.text(self._header())
+            return
+        rows = map_rows(self._map, self.columns, COL_WIDTH, rainbow=self.rainbow)
         # now pretty print the memory map
-        pp.text(text)
+        pp.text(self._header() + "\n".join(rows))
 
     def _repr_pretty_diff_(self, pp: PrettyPrinter, cycle, other: "MemoryInfo"):
         """print a colored version of a differential memory map
@@ -193,30 +238,39 @@ class MemoryInfo:
         """
         if cycle:
             pp.text("MemoryInfo(...)")
-        width = COL_WIDTH * self.columns
         if not other:
             pp.text("MemoryInfo(...)")
             return
         pp.text(self._header())
-        text = ""
-        color = Fore.WHITE
-        for i in range(len(self.mmap)):
-            # '=' keeps the same color
-            current = self.mmap[i] if i < len(self.mmap) else ""
-            other_ = other.mmap[i] if i < len(other.mmap) else ""
-            color = self.diff_color(current, other_)
-            text += color + self.mmap[i]
-            # columns
-            if (i + 1) % COL_WIDTH == 0:
-                text += f"{Style.RESET_ALL} "
-            # rows
-            if (i + 1) % width == 0:
-                text += Style.RESET_ALL
-                pp.text(text)
-                pp.breakable("\n")
-                text = ""
+        if self.image:
+            return
+        rows = diff_rows(self._map, other._map, self.columns, COL_WIDTH)
+        for row in rows[:-1]:
+            pp.text(row)
+            pp.breakable("\n")
         # remainder
-        pp.text(text)
+        pp.text(rows[-1])
+
+    def png(self, zoom: Optional[int] = None, other: Optional[MemoryInfo] = None) -> Image:
+        """The memory map as a PNG image, with a square of `zoom` pixels per block.
+        With an other map, the blocks that were allocated or freed since are highlighted.
+        """
+        return Image(data=self._png_data(zoom, other), format="png")
+
+    def _png_data(self, zoom: Optional[int] = None, other: Optional[MemoryInfo] = None) -> bytes:
+        from .memoryinfo_image import map_image, png_bytes
+
+        image = map_image(
+            self.blocks,
+            COL_WIDTH * self.columns,
+            zoom=zoom or self.zoom,
+            other=other.blocks if other is not None else None,
+        )
+        return png_bytes(image)
+
+    def _repr_png_(self):
+        "the memory map as an image, in a notebook that shows images"
+        return self._png_data() if self.image else None
 
     def diff_color(self, this: str, other: str):
         "Colors for the diff view"
@@ -304,32 +358,20 @@ class MemoryInfo:
             self.stack_used, self.stack_total = [int(x) for x in match_stack.groups()]
         match_dt = RE_D_TIME.search(mem_info)
         if match_dt:
-            dt = eval(match_dt.groups()[0])
+            dt = parse_repr(match_dt.groups()[0])
             self.datetime = datetime.datetime(*dt[:-1])
         else:
             # use the local time
             self.datetime = datetime.datetime.now()
 
-        _raw_map = RE_BLOCK.findall(mem_info)
+        # a single pass over the encoded output, for the lines of the map and the free lines
+        rows = RE_MAP_BYTES.findall(mem_info.encode("ascii", "replace"))
         if self.show_free:
-            match_free = RE_FREE.search(mem_info)
-            if match_free:
-                # there can be multiple marks of free lines, so lets try to find them all
-                # break the map into lines and find the free lines
-                lines = mem_info.split("\n")
-                l1 = 0
-                for line in lines:
-                    match_map = RE_BLOCK.match(line)
-                    if match_map:
-                        l1 += 1
-                        continue
-                    match_free = RE_FREE.search(line)
-                    if match_free:
-                        lines_free = int(match_free.groups(0)[0])
-                        # insert the free lines in one go
-                        _raw_map[l1:l1] = ["." * 64] * lines_free
-                        l1 += lines_free
-        self.mmap = "".join(_raw_map)
+            # expand each run of free lines in one go
+            self._map = b"".join([b"." * (COL_WIDTH * int(n)) if n else row for row, n in rows])
+        else:
+            self._map = b"".join([row for row, n in rows])
+        self._mmap = None
         return self
 
     def __sub__(self, other: MemoryInfo):
@@ -341,8 +383,17 @@ class MemoryInfo:
         diff.diff_with = (0, -1)
         return diff
 
+    def diff(self, other: MemoryInfo, block_size: int = BLOCK_SIZE) -> MapDiff:
+        """The blocks that were allocated, freed or changed type since the other memory map,
+        with the blocks and bytes per object type"""
+        from .memoryinfo_diff import diff_maps
+
+        return diff_maps(other.blocks, self.blocks, block_size)
+
     def as_np_array(self):
         """Return the memory object as a numpy array of a single row"""
+        import numpy as np
+
         return np.array(
             [
                 (
@@ -359,10 +410,15 @@ class MemoryInfo:
                     self.stack_used,
                 )
             ],
-            dtype=DT_MEMINFO,
+            dtype=dt_meminfo(),
         )
 
 
+# the str view of the memory map, a property can only be added after the dataclass is created
+# as `mmap` is also the argument of __init__
+MemoryInfo.mmap = property(MemoryInfo._get_mmap, MemoryInfo._set_mmap)  # type: ignore
+
+
 # -------------------------------------------------------------------------------------------
 # MemoryInfoList
 # -------------------------------------------------------------------------------------------
@@ -381,10 +437,14 @@ class MemoryInfoList(UserList):
         show_free: bool = True,
         rainbow: bool = False,
         columns: int = 4,
+        image: bool = False,
+        zoom: int = 1,
     ):
         self.show_free: bool = show_free  # show the free blocks - default True
         self.rainbow: bool = rainbow  # color the blocks in rainbow colors
         self.columns: int = columns
+        self.image: bool = image  # show the memory maps as an image
+        self.zoom: int = zoom  # the size in pixels of a block in the image
 
         self.diff_with: tuple = ()  # (other, current)
         if not iterable:
@@ -397,6 +457,8 @@ class MemoryInfoList(UserList):
     @cached_property
     def np_array(self):
         """Return the memory List as a numpy array to allow simple math operations"""
+        import numpy as np
+
         return np.array(
             [
                 (
@@ -414,7 +476,7 @@ class MemoryInfoList(UserList):
                 )
                 for i in self.data
             ],
-            dtype=DT_MEMINFO,
+            dtype=dt_meminfo(),
         )
 
     def insert(self, index, item, name: str = ""):
@@ -498,6 +560,24 @@ class MemoryInfoList(UserList):
             return
         return cur_map._repr_pretty_diff_(pp, cycle, other=other_map)
 
+    def _repr_png_(self):
+        """the last memory map, or the diff of two maps, as an image"""
+        if not (self.image and len(self.data)):
+            return None
+        if self.diff_with and len(self.data) > 1:
+            try:
+                other_map = self.data[self.diff_with[0]]
+                cur_map = self.data[self.diff_with[-1]]
+            except IndexError:
+                return None
+            return cur_map._png_data(other=other_map)
+        return self.data[-1]._png_data()
+
+    def diff(self, block_size: int = BLOCK_SIZE) -> MapDiff:
+        """The changes between the maps in diff_with, or else between the last two maps"""
+        before, after = self.diff_with if len(self.diff_with) > 1 else (-2, -1)
+        return self.data[after].diff(self.data[before], block_size)
+
     def map(self, action):
         return type(self)(action(item) for item in self)
 
@@ -565,6 +645,11 @@ class MemoryInfoList(UserList):
         # only import if needed
         import warnings
 
+        import matplotlib.dates as mpl_dates
+        import matplotlib.pyplot as plt
+        import numpy as np
+        from matplotlib import ticker
+
         KB_DIVIDER = 1024
         LEGEND_L_BOX = (0.0, 0.0, 0.05, 1)
         LEGEND_R_BOX = (0.7, 0.0, 0.3, 1)
@@ -0,0 +1,93 @@
+"""
+Compare two memory maps block by block, in a single vectorized step over their numpy arrays.
+
+Each block of the later map is classified as:
+ - unchanged: the same block, of an object of the same type
+ - allocated: free before, and used now
+ - freed: used before, and free now
+ - type_changed: used before and now, by an object of a different type or a different object
+
+A tail block ( `=` ) belongs to the object of the head before it, so it has the type of that head.
+Blocks beyond the end of the shorter map are compared as free blocks.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Dict
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# the types of objects, and `h` for the heads of other objects
+TYPES = "TLDFBMSAh"
+FREE = ord(".")
+TAIL = ord("=")
+# the bytes per block of the GC heap on 32-bit ports, 4 words
+BLOCK_SIZE = 16
+
+
+@dataclass
+class MapDiff:
+    """The changes of a memory map since an earlier map, as masks over the blocks of the later map"""
+
+    allocated: "np.ndarray"
+    freed: "np.ndarray"
+    type_changed: "np.ndarray"
+    unchanged: "np.ndarray"
+    block_size: int = BLOCK_SIZE
+    by_type: Dict[str, Dict[str, int]] = field(default_factory=dict)
+    """Per object type, the blocks and bytes that were allocated and freed"""
+
+    @property
+    def counts(self) -> Dict[str, int]:
+        """The number of blocks in each class"""
+        return {
+            "allocated": int(self.allocated.sum()),
+            "freed": int(self.freed.sum()),
+            "type_changed": int(self.type_changed.sum()),
+            "unchanged": int(self.unchanged.sum()),
+        }
+
+    @property
+    def changed(self) -> "np.ndarray":
+        return ~self.unchanged
+
+
+def object_types(blocks: "np.ndarray") -> "np.ndarray":
+    """The code of the head of the object of each block, a tail at the start is a `h` block"""
+    import numpy as np
+
+    tail = blocks == TAIL
+    heads = np.maximum.accumulate(np.where(tail, -1, np.arange(len(blocks))))
+    return np.where(heads < 0, ord("h"), blocks[np.maximum(heads, 0)]).astype(np.uint8)
+
+
+def diff_maps(before: "np.ndarray", after: "np.ndarray", block_size: int = BLOCK_SIZE) -> MapDiff:
+    """Compare the blocks of two maps, the masks have the length of the later map"""
+    import numpy as np
+
+    n = len(after)
+    padded = np.full(n, FREE, dtype=np.uint8)
+    padded[: min(n, len(before))] = before[:n]
+    was_free, is_free = padded == FREE, after == FREE
+    type_before, type_after = object_types(padded), object_types(after)
+
+    unchanged = (padded == after) & (type_before == type_after)
+    allocated = was_free & ~is_free
+    freed = ~was_free & is_free
+    type_changed = ~(unchanged | allocated | freed)
+
+    # a block that changed type is freed from the old object and allocated to the new one
+    gained = np.bincount(type_after[allocated | type_changed], minlength=256)
+    lost = np.bincount(type_before[freed | type_changed], minlength=256)
+    by_type = {
+        t: {
+            "allocated": int(gained[ord(t)]),
+            "freed": int(lost[ord(t)]),
+            "allocated_bytes": int(gained[ord(t)]) * block_size,
+            "freed_bytes": int(lost[ord(t)]) * block_size,
+        }
+        for t in TYPES
+    }
+    return MapDiff(allocated, freed, type_changed, unchanged, block_size, by_type)
@@ -0,0 +1,108 @@
+"""
+Render the memory map of a MemoryInfo as a PNG image, with a square of pixels per block.
+
+The colored text of the map of a large heap, such as the PSRAM of an ESP32 or an RP2350, has
+thousands of rows. The image shows the same map in a few hundred kilobytes: each block is
+colored by the type of its object, through a palette lookup of all blocks at once,
+and the PNG is encoded with zlib, so no imaging library is needed.
+
+In a diff with an other map the unchanged blocks are dimmed, the blocks that were allocated
+or reused by an object of another type are shown in red, and the blocks that were freed in green.
+"""
+
+from __future__ import annotations
+
+import struct
+import zlib
+from functools import lru_cache
+from typing import TYPE_CHECKING, Optional
+
+from .memoryinfo_diff import diff_maps, object_types
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# the color of the blocks of each type of object, other blocks are gray
+BLOCK_RGB = {
+    ".": (30, 110, 50),  # free
+    "h": (205, 49, 49),  # head of another object
+    "m": (255, 140, 0),  # marked head
+    "T": (36, 114, 200),  # tuple
+    "L": (17, 168, 205),  # list
+    "D": (188, 63, 188),  # dict
+    "F": (229, 229, 16),  # float
+    "B": (240, 240, 240),  # byte code
+    "M": (140, 140, 255),  # module
+    "S": (245, 130, 170),  # string or bytes
+    "A": (170, 110, 40),  # bytearray
+}
+OTHER_RGB = (128, 128, 128)
+PADDING_RGB = (0, 0, 0)
+FREED_RGB = (13, 188, 121)
+ALLOCATED_RGB = (241, 76, 76)
+# the brightness of the blocks that did not change in a diff
+DIM = 0.3
+
+
+@lru_cache(maxsize=None)
+def palette() -> "np.ndarray":
+    """The RGB color of each block code"""
+    import numpy as np
+
+    rgb = np.full((256, 3), OTHER_RGB, dtype=np.uint8)
+    for c, color in BLOCK_RGB.items():
+        rgb[ord(c)] = color
+    return rgb
+
+
+def block_rgb(blocks: "np.ndarray") -> "np.ndarray":
+    """The color of each block, a tail block has the color of the head of its object"""
+    return palette()[object_types(blocks)]
+
+
+def map_image(
+    blocks: "np.ndarray",
+    width: int,
+    zoom: int = 1,
+    other: Optional["np.ndarray"] = None,
+) -> "np.ndarray":
+    """The map as an RGB image of rows of `width` blocks, each block a square of zoom pixels.
+    With an other map, the blocks that changed are highlighted.
+    """
+    import numpy as np
+
+    rgb = block_rgb(blocks)
+    if other is not None:
+        diff = diff_maps(other, blocks)
+        rgb[diff.unchanged] = (rgb[diff.unchanged] * DIM).astype(np.uint8)
+        rgb[diff.allocated | diff.type_changed] = ALLOCATED_RGB
+        rgb[diff.freed] = FREED_RGB
+    rows = max(1, -(-len(blocks) // width))
+    image = np.empty((rows * width, 3), dtype=np.uint8)
+    image[: len(blocks)] = rgb
+    image[len(blocks) :] = PADDING_RGB
+    image = image.reshape(rows, width, 3)
+    if zoom > 1:
+        image = image.repeat(zoom, axis=0).repeat(zoom, axis=1)
+    return image
+
+
+def png_bytes(image: "np.ndarray", level: int = 6) -> bytes:
+    """Encode an RGB image of shape (height, width, 3) as PNG"""
+    import numpy as np
+
+    height, width, _ = image.shape
+    # each scanline starts with filter type 0, no filter
+    raw = np.zeros((height, 1 + width * 3), dtype=np.uint8)
+    raw[:, 1:] = image.reshape(height, width * 3)
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)  # 8 bit RGB
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + _chunk(b"IHDR", header)
+        + _chunk(b"IDAT", zlib.compress(raw.tobytes(), level))
+        + _chunk(b"IEND", b"")
+    )
+
+
+def _chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
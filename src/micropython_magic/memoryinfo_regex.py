@@ -0,0 +1,38 @@
+"""
+Regular expressions to recognize the output of `micropython.mem_info()` in the console output.
+
+These are kept apart from the MemoryInfo rendering and plotting code, so that they can be used
+to filter the output without importing numpy or matplotlib.
+"""
+
+import re
+
+RE_HEAD_1 = re.compile(r"GC: total: (\d+), used: (\d+), free: (\d+)")
+RE_HEAD_2 = re.compile(
+    r"\s?No. of 1-blocks: (\d+), 2-blocks: (\d+), max blk sz: (\d+), max free sz: (\d+)"
+)
+RE_D_TIME = re.compile(r"time:\s?(\([\d|,|\s]+\))")
+RE_STACK = re.compile(r"stack: (\d+) out of (\d+)")
+RE_BLOCK = re.compile(r"^[0-9a-fA-F]*\: (.*)", flags=re.MULTILINE)
+RE_FREE = re.compile(r"\((.*) lines all free\)")
+# setup terminators
+# Updated to handle both standard format (space) and decorator format (colon)
+# Examples: "*** Memory info test ***" and "*** Memory info: test ***"
+# Using [^*]* to match any characters except asterisks (more semantically correct)
+RE_MEM_INFO_START = re.compile(r"\*\*\* Memory info\s*:?\s*([^*]*?)\s*\*\*\*")
+RE_MEM_INFO_END = re.compile(r"\*\*\*\*\*\*\*\*\*\*\*\*\*\*\*\*\*\*\*\*\*")
+# the blocks of a line of the memory map, or the number of free lines, in the encoded output
+RE_MAP_BYTES = re.compile(
+    rb"^(?:[0-9a-fA-F]*: (.*)|[ \t]*\((\d+) lines all free\))", flags=re.MULTILINE
+)
+
+RE_ALL = [
+    RE_HEAD_1,
+    RE_HEAD_2,
+    RE_D_TIME,
+    RE_STACK,
+    RE_BLOCK,
+    RE_FREE,
+    RE_MEM_INFO_START,
+    RE_MEM_INFO_END,
+]
@@ -0,0 +1,119 @@
+"""
+Render the memory map of a MemoryInfo as colored text, in runs of blocks.
+
+The map is scanned in runs of the same block code, and the color of a run is looked up in a table
+indexed by the block code. Consecutive blocks that are rendered the same are written as one
+repeated string, and each row is built with a single join, so the time to render grows with the
+number of runs in the map, rather than with the square of the number of blocks.
+
+The output is the same as rendering the map block by block with `MemoryInfo.pcolor` and
+`MemoryInfo.diff_color`. numpy is not needed to render a map.
+"""
+
+import re
+from typing import List
+
+from colorama import Back, Fore, Style
+
+# the blocks that are colored in turn with the rainbow colors
+RAINBOW_BLOCKS = "TSLDFABh"
+RAINBOW = (Back.BLUE, Back.RED, Back.MAGENTA, Back.CYAN)
+# the colors of the diff view
+SAME_COLOR = Fore.MAGENTA + Back.BLACK
+FREED_COLOR = Fore.WHITE + Back.GREEN
+ALLOCATED_COLOR = Fore.WHITE + Back.RED
+
+COLUMN_END = f"{Style.RESET_ALL} "
+# a run of the same block code
+_RUN = re.compile(rb"(.)\1*", flags=re.DOTALL)
+_TAIL = ord("=")
+_FREE = ord(".")
+
+
+def block_color(c: str, bg: str = Back.RED) -> str:
+    """The color of a block, with the background for a block in RAINBOW_BLOCKS"""
+    if c == ".":
+        return Fore.GREEN + Back.GREEN
+    if c == "M":
+        return Fore.BLACK + Back.CYAN
+    fg = Fore.WHITE if c.isupper() else Fore.BLACK
+    return fg + (bg if c in RAINBOW_BLOCKS else Back.RED)
+
+
+# the color of each block code, and the rainbow colors of the blocks in RAINBOW_BLOCKS
+COLORS = [block_color(chr(code)) for code in range(256)]
+RAINBOW_COLORS = {ord(c): [block_color(c, bg) for bg in RAINBOW] for c in RAINBOW_BLOCKS}
+# the text of a block, and of the rainbow blocks starting at each turn: 0 to 3 blocks, and 4 blocks
+TOKENS = [color + chr(code) for code, color in enumerate(COLORS)]
+RAINBOW_TOKENS = {
+    code: [
+        ["".join(t + chr(code) for t in (colors[turn:] + colors[:turn])[:n]) for n in range(5)]
+        for turn in range(len(RAINBOW))
+    ]
+    for code, colors in RAINBOW_COLORS.items()
+}
+
+
+def map_rows(mmap: bytes, columns: int, col_width: int, rainbow: bool = False) -> List[str]:
+    """Render a map in rows of `columns` columns of `col_width` blocks.
+    A full row ends with a reset, the last item is the remainder of a partial row, or empty.
+    """
+    rows: List[str] = []
+    pieces: List[str] = []
+    color = Fore.WHITE  # the color of a tail block at the start of the map
+    turn = 0
+    for start in range(0, len(mmap), col_width):
+        end = min(start + col_width, len(mmap))
+        for run in _RUN.finditer(mmap, start, end):
+            a, b = run.span()
+            code, n = mmap[a], b - a
+            if code == _TAIL:
+                # a tail block keeps the color of the block before it
+                pieces.append((color + "=") * n)
+            elif rainbow and code in RAINBOW_TOKENS:
+                # each block takes the next rainbow color
+                tokens = RAINBOW_TOKENS[code][turn]
+                pieces.append(tokens[4] * (n // 4) + tokens[n % 4] if n > 4 else tokens[n])
+                color = RAINBOW_COLORS[code][(turn + n - 1) % 4]
+                turn = (turn + n) % 4
+            else:
+                color = COLORS[code]
+                pieces.append(TOKENS[code] * n)
+        _end_column(rows, pieces, end, columns * col_width, col_width)
+    rows.append("".join(pieces))
+    return rows
+
+
+def diff_rows(mmap: bytes, other: bytes, columns: int, col_width: int) -> List[str]:
+    """Render a map with the blocks that differ from the other map, in rows as `map_rows`"""
+    rows: List[str] = []
+    pieces: List[str] = []
+    for start in range(0, len(mmap), col_width):
+        end = min(start + col_width, len(mmap))
+        same_column = mmap[start:end] == other[start:end]
+        for run in _RUN.finditer(mmap, start, end):
+            a, b = run.span()
+            if same_column or mmap[a:b] == other[a:b]:
+                pieces.append((SAME_COLOR + chr(mmap[a])) * (b - a))
+                continue
+            # compare the blocks of a run that changed
+            for i in range(a, b):
+                code = mmap[i]
+                if i < len(other) and code == other[i]:
+                    color = SAME_COLOR
+                else:
+                    color = FREED_COLOR if code == _FREE else ALLOCATED_COLOR
+                pieces.append(color + chr(code))
+        _end_column(rows, pieces, end, columns * col_width, col_width)
+    rows.append("".join(pieces))
+    return rows
+
+
+def _end_column(rows: List[str], pieces: List[str], end: int, width: int, col_width: int):
+    if end % col_width == 0:
+        pieces.append(COLUMN_END)
+    if end % width == 0:
+        # one join per row
+        pieces.append(Style.RESET_ALL)
+        rows.append("".join(pieces))
+        pieces.clear()
@@ -3,10 +3,11 @@
 
 import contextlib
 import json
+import re
 import sys
 import tempfile
 from pathlib import Path
-from typing import List, Optional, Union
+from typing import Any, Callable, Dict, List, Optional, Set, Union
 
 from IPython.core.interactiveshell import InteractiveShell
 from loguru import logger as log
@@ -14,11 +15,52 @@ from loguru import logger as log
 from micropython_magic.logger import MCUException
 from micropython_magic.script_access import path_for_script
 
+from .eval_batch import Expressions, batch_code, batch_result
+from .filehash import HASH_CODE, FileHash, parse_hashes, same_file
+from .fw_cache import FW_INFO_STORE, UNIQUE_ID_CODE
 from .interactive import TIMEOUT, ipython_run
+from .precompile import MpyTarget, compile_source, mpy_name
+from .repr_parser import ReprError, parse_repr
+from .runtime import (
+    MEMINFO_CODE,
+    RUNTIME_NAME,
+    call_code,
+    check_code,
+    install_code,
+    runtime_version,
+)
+from .session import MCUSession
+from .stats import timed
+from .transport import ChunkAssembler, stream_code
 
 JSON_START = "<json~"
 JSON_END = "~json>"
 DONT_KNOW = "<~?~>"
+CELL_HEADER = "# Jupyter cell\n"
+# the module a compiled cell is imported as
+CELL_MODULE = "_jupyter_cell"
+# the module and its file are removed, so a changed cell is imported again
+CELL_IMPORT = """\
+import sys
+try:
+    import {module}
+    for _k in dir({module}):
+        if not _k.startswith("__"):
+            globals()[_k] = getattr({module}, _k)
+finally:
+    sys.modules.pop("{module}", None)
+    for _k in ("{module}", "_k"):
+        globals().pop(_k, None)
+    try:
+        import os
+        os.remove("{module}.mpy")
+    except OSError:
+        pass
+"""
+# mpremote commands after which the files on the device may have changed
+FILE_COMMANDS = {"reset", "soft-reset", "bootloader", "fs", "rm", "rmdir", "touch", "mip", "edit"}
+# mpremote commands after which the firmware of the device may have changed
+FIRMWARE_COMMANDS = {"reset", "bootloader"}
 
 
 class MCUInfo(dict):
@@ -37,11 +79,38 @@ class MPRemote2:
         shell: InteractiveShell,
         port: str = "auto",
         resume: bool = True,
+        session: bool = False,
     ):
         self.shell: InteractiveShell = shell
         self.port: str = port  # by default connect to the first device
         self.resume = resume  # by default resume the device to maintain state
         self.timeout = TIMEOUT
+        self.capture_lines = 0  # lines of output kept in memory, 0 = all
+        self.refresh_rate = 0.0  # frames of streamed output per second, 0 = every line
+        self.visible_lines = 0  # lines of streamed output shown, 0 = all
+        self.output_prefix = ""  # prefix for each line of streamed output
+        self.precompile = False  # compile files to .mpy on the host before copying them
+        self.optimize = 0  # the mpy-cross optimisation level
+        self.runtime = "off"  # install the helper runtime in "ram" or "flash", or "off"
+        self.runtime_ready = ""  # the mode in which the runtime was checked on this connection
+        # the known size and hash of files on the device, by device path
+        self.file_hashes: Dict[str, FileHash] = {}
+        self.fw_info: Optional[MCUInfo] = None  # the firmware info, until the device is reset
+        self._session: Optional[MCUSession] = None
+        self.use_session = session
+
+    @property
+    def use_session(self) -> bool:
+        """Keep a connection to the device open between commands, rather than starting mpremote for each command"""
+        return self._session is not None
+
+    @use_session.setter
+    def use_session(self, value: bool):
+        if value and not self._session:
+            self._session = MCUSession(self.port)
+        elif not value and self._session:
+            self._session.close()
+            self._session = None
 
     @property
     def cmd_prefix(self) -> List[str]:
@@ -59,6 +128,7 @@ class MPRemote2:
             c.append(self.port)
         return c
 
+    @timed
     def run_cmd(
         self,
         cmd: List[str],
@@ -68,9 +138,38 @@ class MPRemote2:
         shell=True,
         timeout: Union[int, float] = 0,
         follow: bool = True,
+        store_output: bool = True,
+        log_errors: bool = True,
+        on_line: Optional[Callable[[str], bool]] = None,
     ):
         """run a command on the device and return the output"""
         assert isinstance(cmd, list)
+        if FILE_COMMANDS.intersection(cmd):
+            self.file_hashes.clear()
+            self.runtime_ready = ""
+        if FIRMWARE_COMMANDS.intersection(cmd):
+            self.forget_fw_info()
+        if auto_connect and self._session:
+            if self._session.can_run(cmd):
+                with log.contextualize(port=self.port):
+                    log.debug(f"session: {cmd}")
+                    return self._session.run_cmd(
+                        cmd,
+                        port=self.port,
+                        resume=self.resume,
+                        stream_out=stream_out,
+                        timeout=timeout or self.timeout,
+                        follow=follow,
+                        capture_lines=self.capture_lines,
+                        refresh_rate=self.refresh_rate,
+                        visible_lines=self.visible_lines,
+                        prefix=self.output_prefix,
+                        store_output=store_output,
+                        log_errors=log_errors,
+                        on_line=on_line,
+                    )
+            # release the serial port for the mpremote subprocess
+            self._session.close()
         if auto_connect:
             cmd = self.cmd_prefix + cmd
             # if isinstance(cmd, str):
@@ -85,11 +184,24 @@ class MPRemote2:
                 shell=shell,
                 timeout=timeout or self.timeout,
                 follow=follow,
+                capture_lines=self.capture_lines,
+                refresh_rate=self.refresh_rate,
+                visible_lines=self.visible_lines,
+                prefix=self.output_prefix,
+                store_output=store_output,
+                log_errors=log_errors,
+                on_line=on_line,
             )
 
     def select_device(self, port: Optional[str], verify: bool = False):
         """try to select the device to connect to by specifying the serial port name."""
         _port = port.strip() if port else "auto"
+        if self._session and _port != self.port:
+            self._session.close()
+        if _port != self.port:
+            self.file_hashes.clear()
+            self.fw_info = None
+            self.runtime_ready = ""
         if not verify:
             self.port = _port
             return _port
@@ -102,6 +214,7 @@ class MPRemote2:
             output = e
         return output
 
+    @timed
     def run_cell(
         self,
         cell: str,
@@ -109,9 +222,46 @@ class MPRemote2:
         timeout: Union[int, float] = TIMEOUT,
         follow: bool = True,
         mount: Optional[str] = None,
+        store_output: bool = True,
+        precompile: bool = False,
     ):
-        """run a codeblock on the device and return the output"""
-        """copy cell to a file and run it on the MCU"""
+        """run a codeblock on the device and return the output.
+        With precompile, the cell is compiled to .mpy on the host, and imported on the device
+        as a module. The globals of that module are then copied to the globals of the device.
+        """
+        if precompile:
+            if mount:
+                raise ValueError("a precompiled cell cannot be run with a mounted folder")
+            target = self.mpy_target(timeout)
+            compiled = compile_source(
+                (CELL_HEADER + cell).encode(), f"{CELL_MODULE}.py", target, opt=self.optimize
+            )
+            # copy and import in a single command, the import removes the file again
+            return self.run_cmd(
+                ["cp", str(compiled), f":{CELL_MODULE}.mpy", "+"]
+                + ["exec", CELL_IMPORT.format(module=CELL_MODULE)],
+                timeout=timeout,
+                follow=follow,
+                store_output=store_output,
+            )
+        if self._session and not mount:
+            # send the cell directly over the session, no need for a temporary file
+            log.trace("running cell in session")
+            with log.contextualize(port=self.port):
+                return self._session.run_code(
+                    CELL_HEADER + cell,
+                    port=self.port,
+                    resume=self.resume,
+                    stream_out=True,
+                    timeout=timeout,
+                    follow=follow,
+                    capture_lines=self.capture_lines,
+                    refresh_rate=self.refresh_rate,
+                    visible_lines=self.visible_lines,
+                    prefix=self.output_prefix,
+                    store_output=store_output,
+                )
+        # copy cell to a file and run it on the MCU
         with tempfile.NamedTemporaryFile(mode="w", suffix=".py", delete=False) as f:
             self._cell_to_file(f, cell)
             # copy the file to the device
@@ -129,6 +279,7 @@ class MPRemote2:
                     stream_out=True,
                     timeout=timeout,
                     follow=follow,
+                    store_output=store_output,
                 )
                 if result:
                     log.debug(f"result: {result}")
@@ -159,25 +310,237 @@ class MPRemote2:
         exec_cmd += ["exec", f"\"exec( open('{filename}').read() , globals() )\""]
         return self.run_cmd(exec_cmd, stream_out=stream_out, timeout=timeout, follow=follow)
 
-    def copy_cell_to_mcu(self, cell, *, filename: str):
-        """copy cell to a file to the MCU"""
+    @timed
+    def copy_cell_to_mcu(self, cell, *, filename: str, precompile: Optional[bool] = None):
+        """copy cell to a file to the MCU.
+        With precompile, or the precompile attribute set, a .py file is compiled and copied
+        as a .mpy file, and the .py file is removed from the MCU, as it would be imported first.
+        """
+        mpy_filename = mpy_name(filename)
+        if mpy_filename and (self.precompile if precompile is None else precompile):
+            target = self.mpy_target(self.timeout)
+            compiled = compile_source(
+                (CELL_HEADER + cell).encode(), filename, target, opt=self.optimize
+            )
+            self.file_hashes.pop(filename, None)
+            remove = f"import os\ntry:\n    os.remove({filename!r})\nexcept OSError:\n    pass"
+            # the .py file is removed in the same command
+            self._copy_file(str(compiled), mpy_filename, then=["exec", remove])
+            return
         with tempfile.NamedTemporaryFile(mode="w", suffix=".py", delete=False) as f:
             self._cell_to_file(f, cell)
-            # copy the file to the device
-            copy_cmd = ["cp", f.name, f":{filename}"]
-            # TODO: detect / retry / report errors copying the file
-            _ = self.run_cmd(copy_cmd, stream_out=False, timeout=60)
-            # log.info(_)
-            # log.info(f.name, "copied to device")
+        try:
+            self._copy_file(f.name, filename)
+        finally:
+            Path(f.name).unlink()
+
+    def _copy_file(self, src: str, dest: str, then: Optional[List[str]] = None):
+        """copy a single file to the MCU, unless the MCU reports it as identical.
+        The hash of the copied file is checked in the same command, and kept if it matches,
+        so the next copy of the same file needs no round trip.
+        args:
+            then: a command to run after the copy, in the same mpremote call
+        """
+        dest = dest.lstrip(":")
+        if self.unchanged_files({src: dest}):
+            if then:
+                self.run_cmd(then, stream_out=False, store_output=False)
+            return
+        self.file_hashes.pop(dest, None)
+        check = HASH_CODE.format(files=repr([dest]), json_start=JSON_START, json_end=JSON_END)
+        cmd = ["cp", src, f":{dest}", "+", "exec", check] + (["+", *then] if then else [])
+        output = self.run_cmd(cmd, stream_out=False, timeout=60, store_output=False)
+        hashes = self.first_json(output)
+        on_device = {} if hashes == DONT_KNOW else parse_hashes([dest], hashes)
+        if dest in on_device and same_file(src, on_device[dest]):
+            self.file_hashes[dest] = on_device[dest]
+        else:
+            log.warning(f"{dest} was not copied to {self.port}")
+
+    @timed
+    def copy_files_to_mcu(
+        self, files: Dict[str, str], *, timeout: Union[int, float] = 60, force: bool = False
+    ) -> List[str]:
+        """copy host files to the MCU, using a single command.
+        Files that are already identical on the MCU are not copied, unless force is set.
+        args:
+            files: the device path for each host file
+        Returns the device paths of the files that were copied.
+        """
+        unchanged = set() if force else self.unchanged_files(files, timeout=timeout)
+        copy_cmd = []
+        copied = []
+        for src, dest in files.items():
+            if src in unchanged:
+                continue
+            dest = dest.lstrip(":")
+            # the hash is known again once the copy is verified
+            self.file_hashes.pop(dest, None)
+            copied.append(dest)
+            # `+` separates the commands, as cp accepts multiple sources
+            copy_cmd += ["+"] if copy_cmd else []
+            copy_cmd += ["cp", src, f":{dest}"]
+        if unchanged:
+            log.debug(f"{len(unchanged)} unchanged files not copied to {self.port}")
+        if copy_cmd:
+            # errors are logged, the sender should verify the files if needed
+            self.run_cmd(copy_cmd, stream_out=False, timeout=timeout, store_output=False)
+        return copied
+
+    def device_hashes(
+        self, files: List[str], *, timeout: Union[int, float] = 0, setup: str = ""
+    ) -> Dict[str, FileHash]:
+        """get the size and hash of files on the MCU in a single round trip.
+        The setup code, such as creating folders, is run first in the same round trip.
+        """
+        code = setup + HASH_CODE.format(files=repr(files), json_start=JSON_START, json_end=JSON_END)
+        hashes = self.run_json(code, timeout=timeout)
+        return {} if hashes == DONT_KNOW else parse_hashes(files, hashes)
+
+    @timed
+    def eval_batch(self, expressions: Expressions, *, timeout: Union[int, float] = 0):
+        """evaluate several expressions in a single execution on the MCU.
+        args:
+            expressions: a list of expressions, or a dict of name -> expression
+        Returns a list or dict with the value of each expression, or the MCUException it raised.
+        """
+        code = batch_code(expressions, JSON_START, JSON_END)
+        # the values may contain text that looks like an error
+        results = self.run_json(code, timeout=timeout, log_errors=False)
+        if results == DONT_KNOW:
+            raise MCUException(f"Could not evaluate {expressions}")
+        return batch_result(expressions, results)
+
+    @timed
+    def eval_stream(
+        self,
+        statement: str,
+        *,
+        chunk_size: int = 1024,
+        timeout: Union[int, float] = 0,
+        progress: Optional[Callable[[int, int], None]] = None,
+    ):
+        """evaluate an expression on the MCU, and transfer its value in chunks.
+        The MCU serialises the value while it is sent, so it only needs memory for a single chunk,
+        rather than for the json of the whole value.
+        args:
+            chunk_size: the approximate number of characters per chunk
+            progress: called with the number of top level items received, and the total
+        """
+        assembler = ChunkAssembler(progress)
+        kwargs = dict(stream_out=False, timeout=timeout, store_output=False, on_line=assembler.feed)
+        if self.use_runtime(timeout):
+            call = f"{RUNTIME_NAME}.stream(({statement}), {max(1, int(chunk_size))})"
+            output = self.run_runtime(call, **kwargs)
+        else:
+            output = self.run_cmd(["exec", stream_code(statement, chunk_size)], **kwargs)
+        if not assembler.complete:
+            raise MCUException(f"Could not evaluate {statement}: {output}")
+        return assembler.result()
+
+    def use_runtime(self, timeout: Union[int, float] = 0) -> bool:
+        """Install the helper runtime on the MCU if needed, returns False if it is not used.
+        The version of the runtime is checked once per connection, and after a reset.
+        """
+        # without resume the MCU is reset before each command, and loses the runtime in ram
+        if self.runtime not in ("ram", "flash") or (self.runtime == "ram" and not self.resume):
+            return False
+        if self.runtime_ready == self.runtime:
+            return True
+        expected = runtime_version(JSON_START, JSON_END)
+        version = self.run_json(check_code(JSON_START, JSON_END), timeout=timeout)
+        if version != expected:
+            log.info(f"Installing the helper runtime {expected} in {self.runtime} on {self.port}")
+            code = install_code(self.runtime, JSON_START, JSON_END)
+            version = self.run_json(code, timeout=timeout)
+        if version != expected:
+            log.warning(f"Could not install the helper runtime on {self.port}: {version}")
+            return False
+        self.runtime_ready = self.runtime
+        return True
+
+    def run_runtime(self, code: str, **kwargs):
+        """run code that calls the helper runtime.
+        The runtime is installed again if the MCU lost it by a reset that was not seen by the host.
+        """
+        cmd = ["exec", call_code(self.runtime, code)]
+        try:
+            return self.run_cmd(cmd, **kwargs)
+        except MCUException as e:
+            if f"'{RUNTIME_NAME}'" not in str(e):
+                raise
+        self.runtime_ready = ""
+        if not self.use_runtime(kwargs.get("timeout", 0)):
+            raise MCUException(f"The helper runtime is not available on {self.port}")
+        return self.run_cmd(cmd, **kwargs)
+
+    def run_json(self, code: str, *, timeout: Union[int, float] = 0, log_errors: bool = True):
+        """run a block of code on the MCU, and return the first value it prints as json.
+        The code is sent as a file, so it can be longer than a command line allows.
+        Returns DONT_KNOW if no json was printed.
+        """
+        with tempfile.NamedTemporaryFile(mode="w", suffix=".py", delete=False) as f:
+            f.write(code)
+        try:
+            output = self.run_cmd(
+                ["run", f.name],
+                stream_out=False,
+                timeout=timeout,
+                store_output=False,
+                log_errors=log_errors,
+            )
+        finally:
             Path(f.name).unlink()
+        return self.first_json(output)
+
+    @classmethod
+    def first_json(cls, output) -> Any:
+        """the first value in the output that was printed as json, or DONT_KNOW"""
+        for line in output or []:
+            result = cls.load_json_from_MCU(line.strip())
+            if result != DONT_KNOW:
+                return result
+        return DONT_KNOW
+
+    def unchanged_files(
+        self,
+        files: Dict[str, str],
+        *,
+        timeout: Union[int, float] = 0,
+        query: bool = True,
+        setup: str = "",
+    ) -> Set[str]:
+        """Return the host files that are identical to their copy on the MCU.
+        Known hashes are used without asking the MCU, the others are checked in a single round trip.
+        args:
+            files: the device path for each host file
+            query: ask the MCU for the hashes that are not known
+            setup: code to run on the MCU in the same round trip, before the files are hashed
+        """
+        unchanged = set()
+        unknown = {}
+        for src, dest in files.items():
+            dest = dest.lstrip(":")
+            if dest in self.file_hashes and same_file(src, self.file_hashes[dest]):
+                unchanged.add(src)
+            else:
+                unknown[src] = dest
+        if unknown and query:
+            on_device = self.device_hashes(list(unknown.values()), timeout=timeout, setup=setup)
+            for src, dest in unknown.items():
+                if dest in on_device and same_file(src, on_device[dest]):
+                    self.file_hashes[dest] = on_device[dest]
+                    unchanged.add(src)
+        return unchanged
 
     def _cell_to_file(self, f, cell):
         """Copy cell to a file, and close the file"""
-        f.write("# Jupyter cell\n")
+        f.write(CELL_HEADER)
         f.write(cell)
         f.close()
         log.trace(f"copied cell to {f.name}")
 
+    @timed
     def cell_from_mcu_file(self, filename):
         """read a file from the device and return the contents"""
         with tempfile.NamedTemporaryFile(mode="w", suffix=".py", delete=False) as f:
@@ -200,20 +563,73 @@ class MPRemote2:
             try:
                 result = json.loads(line)
             except json.JSONDecodeError as e:
-                with contextlib.suppress(Exception):
-                    result = eval(line)
+                # the repr of a value that json could not convert, such as bytes or a tuple
+                with contextlib.suppress(ReprError):
+                    result = parse_repr(line)
             except Exception as e:
                 # result = None
                 pass
         return result
 
-    def get_fw_info(self, timeout: float):
+    def mpy_target(self, timeout: float) -> MpyTarget:
+        """The .mpy version and architecture of the device, to compile code for"""
+        return MpyTarget.from_fw_info(self.get_fw_info(timeout))
+
+    @timed
+    def get_fw_info(self, timeout: float, *, refresh: bool = False):
+        """get the firmware info of the device.
+        The info is kept until the device is reset, and is stored on disk by the unique id
+        of the device, so it is only collected once per device, also across kernel sessions.
+        """
+        if self.fw_info and not refresh:
+            return self.fw_info
+        # the unique id is only read if a device on this port is known,
+        # otherwise it is part of the firmware info that is collected
+        if not refresh and FW_INFO_STORE.has_port(self.port):
+            if info := FW_INFO_STORE.get(self.unique_id(timeout), self.port):
+                self.fw_info = MCUInfo(info, serial_port=self.port)
+                return self.fw_info
         fw_info = {}
-        #  load datafile from installed package
-        cmd = ["run", str(path_for_script("fw_info.py"))]
-        if out := self.run_cmd(cmd, stream_out=False, timeout=timeout):
+        if self.use_runtime(timeout):
+            out = self.run_runtime(f"{RUNTIME_NAME}.fw_info()", stream_out=False, timeout=timeout)
+        else:
+            #  load datafile from installed package
+            cmd = ["run", str(path_for_script("fw_info.py"))]
+            out = self.run_cmd(cmd, stream_out=False, timeout=timeout)
+        if out:
             if not out[0].startswith("{"):
                 return out
-            fw_info = MCUInfo(eval(out[0]))
+            fw_info = MCUInfo(parse_repr(out[0]))
             fw_info.serial_port = self.port
+            self.fw_info = fw_info
+            FW_INFO_STORE.put(self.port, fw_info)
         return fw_info
+
+    @timed
+    def meminfo(self, timeout: float) -> List[str]:
+        """the time and the memory map of the MCU, as printed by `micropython.mem_info(1)`"""
+        if self.use_runtime(timeout):
+            out = self.run_runtime(f"{RUNTIME_NAME}.meminfo()", stream_out=False, timeout=timeout)
+        else:
+            out = self.run_cmd(["exec", MEMINFO_CODE], stream_out=False, timeout=timeout)
+        return list(out or [])
+
+    def unique_id(self, timeout: float) -> str:
+        """the unique id of the device as hex, or an empty string if it has none"""
+        try:
+            out = self.run_cmd(
+                ["exec", UNIQUE_ID_CODE],
+                stream_out=False,
+                timeout=timeout,
+                store_output=False,
+                log_errors=False,
+            )
+        except MCUException:
+            return ""
+        unique_id = out[0].strip() if out else ""
+        return unique_id if re.fullmatch(r"[0-9a-f]+", unique_id) else ""
+
+    def forget_fw_info(self):
+        """forget the firmware info of the device, in memory and on disk"""
+        self.fw_info = None
+        FW_INFO_STORE.forget(self.port)
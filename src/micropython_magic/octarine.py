@@ -9,14 +9,23 @@ Run micropython code from a a notebook
 # https://nbviewer.org/github/rossant/ipython-minibook/blob/master/chapter6/602-cpp.ipynb
 
 import argparse
+import builtins
 import re
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional
 
 import traitlets
 from IPython.core.error import UsageError
 from IPython.core.getipython import get_ipython
 from IPython.core.interactiveshell import InteractiveShell
-from IPython.core.magic import Magics, cell_magic, line_magic, magics_class, output_can_be_silenced
+from IPython.core.magic import (
+    Magics,
+    cell_magic,
+    line_cell_magic,
+    line_magic,
+    magics_class,
+    output_can_be_silenced,
+)
 from IPython.core.magic_arguments import argument, argument_group, magic_arguments, parse_argstring
 from IPython.utils.text import SList
 from loguru import logger as log  # type: ignore
@@ -24,10 +33,17 @@ from traitlets import Float as Float_
 from traitlets import UseEnum, observe
 
 from micropython_magic.interactive import TIMEOUT
-from micropython_magic.param_fixup import get_code
+from micropython_magic.param_fixup import get_code, long_options
 
+from .deploy import deploy, summary_table
+from .eval_batch import Expressions, split_expressions
 from .logger import LogLevel, MCUException, set_log_level
+from .mcu_timeit import MCUTimeitResult, timeit_code
 from .mpr import DONT_KNOW, JSON_END, JSON_START, MPRemote2
+from .runtime import RUNTIME_MODES, RUNTIME_NAME
+from .stats import STATS
+from .sync import sync
+from .transport import eval_code, is_binary, load_binary
 
 # set the log level to WARNING
 set_log_level("WARNING")
@@ -43,6 +59,12 @@ def set_xmode(mode="Minimal"):
             print(f"New {ip.InteractiveTB.mode=}")
 
 
+def _builtin_exception(name: str) -> Optional[type]:
+    """The builtin exception class with the name that the MCU reported, if any"""
+    cls = getattr(builtins, name.strip(), None)
+    return cls if isinstance(cls, type) and issubclass(cls, BaseException) else None
+
+
 @magics_class
 class MicroPythonMagic(Magics):
     """A class to define the magic functions for MicroPython."""
@@ -50,13 +72,29 @@ class MicroPythonMagic(Magics):
     # The default timeout
     timeout = Float_(TIMEOUT).tag(config=True, sync=True)  # type: ignore
     loglevel = UseEnum(LogLevel, default_value=LogLevel.WARNING).tag(config=True)
+    # the maximum number of times per second that streamed output is rendered, 0 renders each line
+    refresh_rate = Float_(20.0).tag(config=True)  # type: ignore
+    # the number of lines of streamed output that remain visible, 0 shows all output
+    visible_lines = traitlets.Int(0).tag(config=True)  # type: ignore
     xmode = traitlets.Unicode("Minimal").tag(config=True)  # type: ignore
+    session = traitlets.Bool(False).tag(config=True)  # type: ignore
+    # the number of output lines kept in memory, older lines are spilled to a file, 0 keeps all lines
+    capture_lines = traitlets.Int(0).tag(config=True)  # type: ignore
+    # compile files to .mpy using mpy-cross before writing them to the MCU
+    precompile = traitlets.Bool(False).tag(config=True)  # type: ignore
+    # the mpy-cross optimisation level
+    optimize = traitlets.Int(0).tag(config=True)  # type: ignore
+    # transfer the result of an expression in chunks of this many characters, 0 transfers it at once
+    chunk_size = traitlets.Int(0).tag(config=True)  # type: ignore
+    # install the helper runtime on the MCU in "ram" or "flash", or send the helpers with each call
+    runtime = traitlets.Enum(RUNTIME_MODES, default_value="off").tag(config=True)  # type: ignore
 
     def __init__(self, shell: InteractiveShell):
         # first call the parent constructor
         super(MicroPythonMagic, self).__init__(shell)
         self.shell: InteractiveShell
-        self._MCU: list[MPRemote2] = [MPRemote2(shell)]
+        # the first MCU is the current device, the others are used when selecting multiple devices
+        self._MCU: list[MPRemote2] = [self._new_mcu("auto")]
         # self.port: str = "auto"  # by default connect to the first device
         # self.resume = True  # by default resume the device to maintain state
         set_xmode(mode=str(self.xmode))
@@ -74,12 +112,83 @@ class MicroPythonMagic(Magics):
         if change["new"]:
             set_xmode(change["new"])
 
+    @observe("session")
+    def _session_changed(self, change):
+        log.info(f"Device session {'enabled' if change['new'] else 'disabled'}")
+        for mcu in self._MCU:
+            mcu.use_session = bool(change["new"])
+
+    @observe("capture_lines")
+    def _capture_lines_changed(self, change):
+        for mcu in self._MCU:
+            mcu.capture_lines = int(change["new"])
+
+    @observe("refresh_rate", "visible_lines", "precompile", "optimize", "runtime")
+    def _render_changed(self, change):
+        for mcu in self._MCU:
+            setattr(mcu, change["name"], change["new"])
+
     @property
     def MCU(self) -> MPRemote2:
         """Return the first/current/only MCU"""
         # to allow expansion to multiple MCUs in the future
         return self._MCU[0]
 
+    def _new_mcu(self, port: str) -> MPRemote2:
+        """Create a MPRemote2 for a port, configured with the current options"""
+        mcu = MPRemote2(self.shell, port=port, session=bool(self.session))
+        mcu.timeout = float(self.timeout)
+        mcu.capture_lines = int(self.capture_lines)
+        mcu.refresh_rate = float(self.refresh_rate)
+        mcu.visible_lines = int(self.visible_lines)
+        mcu.precompile = bool(self.precompile)
+        mcu.optimize = int(self.optimize)
+        mcu.runtime = str(self.runtime)
+        return mcu
+
+    def devices(self, ports: List[str]) -> List[MPRemote2]:
+        """Return a MPRemote2 for each of the ports, re-using the MCUs that were used before"""
+        devices = []
+        for port in ports:
+            port = port.strip()
+            mcu = next((m for m in self._MCU if m.port == port), None)
+            if not mcu:
+                mcu = self._new_mcu(port)
+                self._MCU.append(mcu)
+            if mcu not in devices:
+                devices.append(mcu)
+        return devices
+
+    def run_on_devices(
+        self, ports: List[str], action: Callable[[MPRemote2], Any]
+    ) -> Dict[str, Any]:
+        """Run an action on multiple devices concurrently, one thread per device.
+        The streamed output of each device is prefixed with its port.
+        Returns the result of each device by port, or the exception if the action failed.
+        """
+        devices = self.devices(ports)
+        width = max(len(mcu.port) for mcu in devices)
+
+        def run(mcu: MPRemote2):
+            mcu.output_prefix = f"{mcu.port:<{width}} | "
+            try:
+                return action(mcu)
+            finally:
+                mcu.output_prefix = ""
+
+        results: Dict[str, Any] = {}
+        with ThreadPoolExecutor(max_workers=len(devices), thread_name_prefix="mpy") as pool:
+            futures = {pool.submit(run, mcu): mcu.port for mcu in devices}
+            for future in as_completed(futures):
+                port = futures[future]
+                try:
+                    results[port] = future.result()
+                except Exception as e:
+                    log.error(f"{port}: {e}")
+                    results[port] = e
+        # in the order of the ports
+        return {mcu.port: results[mcu.port] for mcu in devices}
+
     # -------------------------------------------------------------------------
     # cell magics
     # -------------------------------------------------------------------------
@@ -117,6 +226,12 @@ class MicroPythonMagic(Magics):
         action="store_true",
         help="new cell is added after the current cell instead of replacing it",
     )
+    @argument(
+        "--compile",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="compile the cell to .mpy with mpy-cross, using the precompile setting for --writefile",
+    )
     @argument("--timeout", default=-1, help="maximum timeout for the cell to run")
     @argument(
         "--follow",
@@ -142,12 +257,17 @@ class MicroPythonMagic(Magics):
         if args.timeout == -1:
             args.timeout = self.timeout
         assert isinstance(args.timeout, float)
+        if args.compile and args.mount and not args.writefile:
+            raise UsageError("--compile cannot be used with --mount")
 
         if args.select:
             if len(args.select) > 1:
-                # allow a list of ports to be specified
-                log.warning(f"{args.select=} not yet implemented")
-                return
+                if args.readfile:
+                    raise UsageError("--readfile can only be used with a single device")
+                # run the cell on all devices at the same time
+                return self.run_on_devices(
+                    args.select, lambda mcu: self._cell_on_device(mcu, cell, args)
+                )
             else:
                 self.select(args.select[0])
 
@@ -164,7 +284,7 @@ class MicroPythonMagic(Magics):
             log.debug(f"{args.writefile=}")
             if args.new:
                 log.warning(f"{args.new=} not implemented")
-            self.MCU.copy_cell_to_mcu(cell, filename=args.writefile)
+            self.MCU.copy_cell_to_mcu(cell, filename=args.writefile, precompile=args.compile)
             return
 
         if args.readfile:
@@ -184,7 +304,11 @@ class MicroPythonMagic(Magics):
             raise UsageError("Please specify some MicroPython code to execute")
         log.trace(f"{cell=}")
         output = self.MCU.run_cell(
-            cell, timeout=args.timeout, follow=args.follow, mount=args.mount
+            cell,
+            timeout=args.timeout,
+            follow=args.follow,
+            mount=args.mount,
+            precompile=bool(args.compile),
         )
 
     # -------------------------------------------------------------------------
@@ -200,6 +324,13 @@ class MicroPythonMagic(Magics):
     @argument("--eval", "-e", nargs="*", help="Expression to evaluate", metavar="EXPRESSION")
     @argument("--timeout", default=-1, help="maximum timeout for the cell to run")
     @argument("--stream", action="store_true", help="stream each line of output as it is received")
+    @argument(
+        "--chunk",
+        type=int,
+        default=None,
+        help="transfer the result of --eval in chunks of this many characters",
+        metavar="SIZE",
+    )
     #
     @argument_group("Devices")
     @argument("--list", "--devs", "-l", action="store_true", help="List available devices.")
@@ -210,6 +341,7 @@ class MicroPythonMagic(Magics):
     @argument("--reset", "--soft-reset", action="store_true", help="reset device.")
     @argument("--hard-reset", action="store_true", help="reset device.")
     @argument("--info", action="store_true", help="get boardinfo from device")
+    @argument("--meminfo", action="store_true", help="get the memory map from device")
     @argument("--bootloader", action="store_true", help="make the device enter its bootloader")
     @output_can_be_silenced
     def mpy_line(self, line: str):
@@ -225,10 +357,12 @@ class MicroPythonMagic(Magics):
             args.timeout = float(args.timeout)  # type: ignore
 
         # try to fixup the expression after shell and argparse mangled it
+        # options that follow the code have been parsed already
+        options = long_options(self.mpy_line)
         if args.statement and len(args.statement) >= 1:
-            args.statement = get_code(line, args.statement[0])
+            args.statement = get_code(line, args.statement[0], options)
         if args.eval and len(args.eval) >= 1:
-            args.eval = get_code(line, args.eval[0])
+            args.eval = get_code(line, args.eval[0], options)
         if isinstance(args.eval, list):
             args.eval = " ".join(args.eval)
         if args.hard_reset:  # avoid double resets
@@ -239,8 +373,10 @@ class MicroPythonMagic(Magics):
         # pre processing - these can be combined with the main processing
         if args.select:
             if len(args.select) > 1:
-                log.warning(f"{args.select=} for multiple MCUs not yet implemented")
-                return
+                if args.list:
+                    return self.list_devices()
+                # run the statement on all devices at the same time
+                return self.run_on_devices(args.select, lambda mcu: self._line_on_device(mcu, args))
             else:
                 self.select(args.select[0], verify=args.verify)
         if args.hard_reset:
@@ -255,9 +391,11 @@ class MicroPythonMagic(Magics):
             return self.list_devices()
         elif args.info:
             return self.get_fw_info(args.timeout)
+        elif args.meminfo:
+            return self.get_meminfo(args.timeout)
 
         elif args.eval:
-            return self.eval(args.eval)
+            return self.eval(args.eval, chunk_size=args.chunk)
 
         elif args.statement:
             # Assemble the command to run
@@ -271,10 +409,211 @@ class MicroPythonMagic(Magics):
                 timeout=float(args.timeout),
             )
 
+    @line_cell_magic("mpy_timeit")
+    @magic_arguments("mpy_timeit")
+    @argument("statement", nargs="*", help="Micropython code to time.", metavar="STATEMENT(S)")
+    @argument("-n", "--number", type=int, default=0, help="number of loops per run")
+    @argument("-r", "--repeat", type=int, default=7, help="number of runs")
+    @argument("-p", "--precision", type=int, default=3, help="number of digits of the timings")
+    @argument("--gc", action="store_true", help="run gc.collect() before each run")
+    @argument("-q", "--quiet", action="store_true", help="do not print the result")
+    @argument("-o", "--output", action="store_true", help="return the MCUTimeitResult")
+    @argument("--timeout", default=-1, help="maximum timeout for the timing to run")
+    def mpy_timeit(self, line: str, cell: str = ""):
+        """
+        Time the execution of Micropython code on the MCU.
+
+        The timing is done on the MCU using time.ticks_us(),
+        so it does not include the overhead of mpremote and the serial connection.
+        In cell mode the statement(s) on the first line are used as setup, and the cell is timed.
+        """
+        args = parse_argstring(self.mpy_timeit, line or "")
+        timeout = self.timeout if args.timeout == -1 else float(args.timeout)
+        options = long_options(self.mpy_timeit)
+        statement = get_code(line, args.statement[0], options) if args.statement else []
+        statement = "\n".join(statement)
+        if cell:
+            setup, stmt = statement, cell
+        else:
+            setup, stmt = "", statement
+        if not stmt.strip():
+            raise UsageError("Please specify some MicroPython code to time")
+        runtime = self.MCU.use_runtime(timeout)
+        code = timeit_code(
+            stmt, setup, number=args.number, repeat=args.repeat, collect=args.gc, runtime=runtime
+        )
+        log.trace(f"{code=}")
+        if runtime:
+            output = self.MCU.run_runtime(code, stream_out=False, timeout=timeout)
+        else:
+            output = self.MCU.run_cmd(["exec", code], stream_out=False, timeout=timeout)
+        result = MCUTimeitResult.from_output(output or [], precision=args.precision)
+        if not result:
+            return output
+        if not args.quiet:
+            print(result)
+        if args.output:
+            return result
+
+    @line_magic("mpy_stats")
+    @magic_arguments("mpy_stats")
+    @argument(
+        "--trace", type=str, help="save the spans as a Chrome trace file", metavar="FILE.JSON"
+    )
+    @argument("--clear", action="store_true", help="clear the statistics")
+    @argument("-o", "--output", action="store_true", help="return the statistics as a dict")
+    def mpy_stats(self, line: str):
+        """
+        Show the time spent in communication with the MCU, as percentiles per operation in milliseconds.
+
+        Operations are the calls to the MCU such as run_cmd and run_cell,
+        and the phases within them, such as starting mpremote or opening the serial port.
+        """
+        args = parse_argstring(self.mpy_stats, line or "")
+        if args.trace:
+            path = STATS.save_chrome_trace(args.trace)
+            print(f"Saved {len(STATS.spans)} spans to {path}")
+        summary = STATS.summary()
+        if not (args.trace or args.clear):
+            print(STATS.table())
+        if args.clear:
+            STATS.clear()
+        if args.output:
+            return summary
+
+    @line_magic("mpy_deploy")
+    @magic_arguments("mpy_deploy")
+    @argument("paths", nargs="+", help="host files and folders to copy", metavar="PATH")
+    @argument("--dest", "-d", type=str, default="", help="MCU folder to copy to", metavar=":FOLDER")
+    @argument("--workers", "-w", type=int, default=4, help="number of devices copied to at once")
+    @argument("--retries", type=int, default=2, help="number of retries for failed files")
+    @argument("--force", action="store_true", help="also copy files that are unchanged")
+    @argument("-q", "--quiet", action="store_true", help="do not print the progress and summary")
+    @argument("-o", "--output", action="store_true", help="return the DeployResult of each device")
+    @argument(
+        "--select", "-s", "--connect", nargs="+", help="serial port(s) to copy to", metavar="PORT"
+    )
+    def mpy_deploy(self, line: str):
+        """
+        Copy host files and folders to one or more devices at the same time.
+
+        Folders are copied recursively, files that are identical on the device are skipped,
+        and files that fail to copy are retried.
+        Without --select the files are copied to the current device.
+        """
+        args = parse_argstring(self.mpy_deploy, line or "")
+        devices = self.devices(args.select or [self.MCU.port])
+        results = deploy(
+            devices,
+            args.paths,
+            args.dest,
+            workers=args.workers,
+            retries=args.retries,
+            force=args.force,
+            progress=not args.quiet,
+        )
+        if not args.quiet:
+            print(summary_table(results))
+        if args.output:
+            return results
+
+    @line_magic("mpy_sync")
+    @magic_arguments("mpy_sync")
+    @argument("host_dir", help="host folder to synchronise", metavar="HOST_FOLDER")
+    @argument("device_dir", nargs="?", default="", help="MCU folder", metavar=":FOLDER")
+    @argument("--delete", action="store_true", help="delete files that are not in the host folder")
+    @argument("--dry-run", "-n", action="store_true", help="only show what would be changed")
+    @argument(
+        "--compile",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="compile .py files to .mpy with mpy-cross, defaults to the precompile setting",
+    )
+    @argument("-q", "--quiet", action="store_true", help="do not print the progress")
+    @argument("-o", "--output", action="store_true", help="return the SyncResult")
+    @argument(
+        "--select", "-s", "--connect", nargs="+", help="serial port(s) to sync", metavar="PORT"
+    )
+    def mpy_sync(self, line: str):
+        """
+        Synchronise a host folder to a folder on the MCU, copying only the files that changed.
+
+        The files on the device are listed with their size and hash in a single round trip,
+        and a manifest on the device avoids hashing files that did not change since the last sync.
+        """
+        args = parse_argstring(self.mpy_sync, line or "")
+
+        def action(mcu: MPRemote2):
+            progress = None if args.quiet else lambda msg: print(f"{mcu.output_prefix}{msg}")
+            result = sync(
+                mcu,
+                args.host_dir,
+                args.device_dir,
+                delete=args.delete,
+                dry_run=args.dry_run,
+                precompile=args.compile,
+                progress=progress,
+            )
+            if args.dry_run and not args.quiet:
+                for path in result.copied:
+                    print(f"{mcu.output_prefix}copy   {path}")
+                for path in result.deleted:
+                    print(f"{mcu.output_prefix}delete {path}")
+            return result
+
+        if args.select and len(args.select) > 1:
+            results = self.run_on_devices(args.select, action)
+            return results if args.output else None
+        if args.select:
+            self.select(args.select[0])
+        result = action(self.MCU)
+        if args.output:
+            return result
+
     # -------------------------------------------------------------------------
     # worker methods - these are called by the magics
     # -------------------------------------------------------------------------
 
+    def _cell_on_device(self, mcu: MPRemote2, cell: str, args: argparse.Namespace):
+        """Run a %%micropython cell on one of multiple devices"""
+        if args.hard_reset:
+            mcu.run_cmd(["reset"], store_output=False)
+        elif args.reset:
+            mcu.run_cmd(["soft-reset", "eval", "True"], store_output=False)
+        if args.writefile:
+            return mcu.copy_cell_to_mcu(cell, filename=args.writefile, precompile=args.compile)
+        if not cell:
+            return None
+        return mcu.run_cell(
+            cell,
+            timeout=args.timeout,
+            follow=args.follow,
+            mount=args.mount,
+            store_output=False,
+            precompile=bool(args.compile),
+        )
+
+    def _line_on_device(self, mcu: MPRemote2, args: argparse.Namespace):
+        """Run a %mpy line magic on one of multiple devices"""
+        if args.hard_reset:
+            mcu.run_cmd(["reset"], store_output=False)
+        elif args.reset:
+            mcu.run_cmd(["soft-reset", "eval", "True"], store_output=False)
+        elif args.bootloader:
+            mcu.run_cmd(["bootloader"], store_output=False)
+        if args.info:
+            return mcu.get_fw_info(args.timeout)
+        if args.eval:
+            return self.eval(args.eval, mcu=mcu)
+        if args.statement:
+            return mcu.run_cmd(
+                ["exec", "\n".join(args.statement)],
+                stream_out=bool(args.stream),
+                timeout=float(args.timeout),
+                store_output=False,
+            )
+        return None
+
     def list_devices(self) -> Optional[SList]:
         """
         Return a SList or list of the Micropython devices connected to the computer through serial ports or USB.
@@ -287,9 +626,14 @@ class MicroPythonMagic(Magics):
         Select the device to connect to by specifying the serial port name.
         """
         device = port.strip() if port else "auto"
+        # release the port if it was used by one of multiple devices
+        for mcu in self._MCU[1:]:
+            if mcu.port == device:
+                mcu.use_session = False
+        self._MCU = [self.MCU] + [mcu for mcu in self._MCU[1:] if mcu.port != device]
         return self.MCU.select_device(device, verify=verify)
 
-    def eval(self, line: str):
+    def eval(self, line: str, mcu: Optional[MPRemote2] = None, *, chunk_size: Optional[int] = None):
         """
         Run a Micropython expression on an attached device using mpremote.
         Note that the expression
@@ -298,24 +642,40 @@ class MicroPythonMagic(Magics):
 
         Runs the statement on the MCU and tries to convert the output to a python object.
         If that fails it returns the raw output as a string.
+
+        Typed buffers ( array, bytes, bytearray, memoryview ) are transferred as binary,
+        arrays are returned as a numpy array.
+
+        A tuple of expressions, or a dict display with string keys, is evaluated as a batch,
+        see eval_many.
+
+        With a chunk_size, or the chunk_size setting, the result is transferred in chunks,
+        so the MCU does not need the memory to hold the json of the whole result.
         """
         # Assemble the command to run
         statement = line.strip()
-        cmd_old = (
-            f'''exec "import json; print('{JSON_START}',json.dumps({statement}),'{JSON_END}')"'''
-        )
-        cmd = [
-            "exec",
-            f"""import json; print('{JSON_START}',json.dumps({statement}),'{JSON_END}')""",
-        ]
-        log.trace(repr(cmd))
-        output = self.MCU.run_cmd(cmd, stream_out=False)
+        if (expressions := split_expressions(statement)) is not None:
+            return self.eval_many(expressions, mcu=mcu)
+        chunk_size = self.chunk_size if chunk_size is None else chunk_size
+        if chunk_size > 0:
+            return self.eval_chunked(statement, chunk_size, mcu=mcu)
+        # the output of other devices is returned together, rather than stored per device
+        if (mcu or self.MCU).use_runtime(self.timeout):
+            call = f"{RUNTIME_NAME}.show(({statement}))"
+            output = (mcu or self.MCU).run_runtime(call, stream_out=False, store_output=mcu is None)
+        else:
+            cmd = ["exec", eval_code(statement, JSON_START, JSON_END)]
+            log.trace(repr(cmd))
+            output = (mcu or self.MCU).run_cmd(cmd, stream_out=False, store_output=mcu is None)
         if isinstance(output, SList):
             matchers = [r"^.*Error:", r"^.*Exception:"]
             for ln in output.l:
                 # check for errors and raise them
                 if any(re.match(m, ln) for m in matchers):
-                    raise MCUException(ln) from eval(ln.split(":")[0])
+                    raise MCUException(ln) from _builtin_exception(ln.split(":")[0])
+                # typed buffers are sent as binary
+                if is_binary(ln):
+                    return load_binary(ln)
                 # check for json output and try to convert it
                 if ln.startswith(JSON_START) and ln.endswith(JSON_END):
                     result = self.MCU.load_json_from_MCU(ln)
@@ -323,6 +683,40 @@ class MicroPythonMagic(Magics):
                         return result
         return output
 
+    def eval_many(self, expressions: Expressions, mcu: Optional[MPRemote2] = None):
+        """
+        Evaluate several Micropython expressions in a single execution on the device.
+        An error in one expression does not prevent the others from being evaluated.
+
+        args:
+            expressions: a list of expressions, or a dict of name -> expression
+        Returns a list or dict with the value of each expression,
+        or the MCUException for the expressions that failed.
+        """
+        return (mcu or self.MCU).eval_batch(expressions, timeout=self.timeout)
+
+    def eval_chunked(self, statement: str, chunk_size: int, mcu: Optional[MPRemote2] = None):
+        """
+        Evaluate a Micropython expression, and transfer its value in chunks of chunk_size characters.
+        The number of items received is shown while the value is transferred.
+        """
+        mcu = mcu or self.MCU
+        shown = False
+
+        def progress(done: int, total: int):
+            nonlocal shown
+            if done < total or shown:
+                shown = True
+                print(f"\r{mcu.output_prefix}received {done}/{total} items", end="", flush=True)
+
+        try:
+            return mcu.eval_stream(
+                statement, chunk_size=chunk_size, timeout=self.timeout, progress=progress
+            )
+        finally:
+            if shown:
+                print()
+
     def soft_reset(self):
         """
         Perform a soft-reset on the current Micropython device.
@@ -342,3 +736,9 @@ class MicroPythonMagic(Magics):
 
     def get_fw_info(self, timeout: float):
         return self.MCU.get_fw_info(timeout)
+
+    def get_meminfo(self, timeout: float):
+        """The memory map of the device, as a MemoryInfo object"""
+        from .memoryinfo import MemoryInfo
+
+        return MemoryInfo("\n".join(self.MCU.meminfo(timeout)))
@@ -1,17 +1,51 @@
 """parmeter processing for micropython_magic"""
 
-from typing import List, Optional
+import io
+import re
+import tokenize
+from typing import Callable, Iterable, List, Optional, Set
 
 from loguru import logger as log
 
 
-def get_code(line: str, partial: str) -> List[str]:
+def long_options(magic_func: Callable) -> Set[str]:
+    """the long options of a magic, such as --chunk"""
+    parser = getattr(magic_func, "parser")
+    return {s for action in parser._actions for s in action.option_strings if s.startswith("--")}
+
+
+def strip_options(code: str, options: Iterable[str]) -> str:
+    """remove the options that follow the code, these have already been parsed by argparse.
+    Only the tokens of the code are checked, so an option inside a string is kept.
+    """
+    options = set(options)
+    try:
+        tokens = list(tokenize.generate_tokens(io.StringIO(code).readline))
+    except (tokenize.TokenError, SyntaxError):
+        return code
+    if any(token.type == tokenize.ERRORTOKEN for token in tokens):
+        # such as an unterminated string
+        return code
+    for first, second in zip(tokens, tokens[1:]):
+        if first.string != "-" or second.string != "-" or first.end != second.start:
+            continue
+        row, col = first.start
+        start = sum(len(ln) for ln in code.splitlines(keepends=True)[: row - 1]) + col
+        if start and not code[start - 1].isspace():
+            continue
+        option = re.match(r"--[\w-]+(?=[\s=]|$)", code[start:])
+        if option and option.group() in options:
+            return code[:start].rstrip()
+    return code
+
+
+def get_code(line: str, partial: str, options: Iterable[str] = ()) -> List[str]:
     """try recover the code from the commandline after argparse has mangled it"""
     log.debug(f"{line=}, {partial=}")
     while partial not in line:
         partial = partial[:-1]
     if not partial:
         return []
-    full = line[line.find(partial) :]
+    full = strip_options(line[line.find(partial) :], options)
     log.debug(f"{full=}")
     return [full]
@@ -0,0 +1,132 @@
+"""
+Compile MicroPython source to .mpy bytecode on the host, using mpy-cross.
+
+Sending bytecode avoids compiling on the MCU, which is slow and can run out of memory
+on small heaps, and reduces the number of bytes sent over the serial connection.
+The code is compiled for the .mpy version and architecture reported by scripts/fw_info.py .
+
+Compiled files are cached on disk, keyed by the hash of the source, the name of the source
+on the device, the .mpy version, the architecture and the optimisation level.
+mpy-cross is optional: `pip install mpy-cross`, or an `mpy-cross` executable on the PATH.
+"""
+
+import hashlib
+import importlib.util
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from loguru import logger as log
+
+from .script_access import CACHE_PATH
+
+CACHE_DIR = CACHE_PATH / "mpy"
+# files that MicroPython only runs as source
+SOURCE_ONLY = {"boot.py", "main.py"}
+
+
+class MpyCrossError(Exception):
+    """mpy-cross is not available, or failed to compile the source for the device"""
+
+
+class MpyTarget(NamedTuple):
+    """The .mpy version and native architecture of a device"""
+
+    version: str  # such as "6.3"
+    arch: str = ""  # such as "armv6m", empty if unknown
+
+    @classmethod
+    def from_fw_info(cls, info: Dict[str, Any]) -> "MpyTarget":
+        if not isinstance(info, dict):
+            raise MpyCrossError(f"Could not get the firmware info of the device: {info}")
+        version = str(info.get("mpy", "")).lstrip("v")
+        if not version:
+            raise MpyCrossError("The device does not report the .mpy version it supports")
+        return cls(version, info.get("arch") or "")
+
+
+def mpy_name(filename: str) -> Optional[str]:
+    """The name of the compiled file on the device, or None if the file should not be compiled"""
+    if not filename.endswith(".py") or filename.rsplit("/", 1)[-1] in SOURCE_ONLY:
+        return None
+    return filename[:-3] + ".mpy"
+
+
+def mpy_cross_cmd(target: MpyTarget) -> List[str]:
+    """The command to run mpy-cross for the target version"""
+    if importlib.util.find_spec("mpy_cross"):
+        # the mpy-cross package includes older compilers, selected by the bytecode version
+        return [sys.executable, "-m", "mpy_cross", "-b", target.version]
+    if exe := shutil.which("mpy-cross"):
+        return [exe]
+    raise MpyCrossError("mpy-cross not found, install it using `pip install mpy-cross`")
+
+
+def check_header(data: bytes, target: MpyTarget):
+    """Check that the compiled code can be loaded by the target"""
+    major, _, minor = target.version.partition(".")
+    if len(data) < 4 or data[0] != ord("M"):
+        raise MpyCrossError("mpy-cross did not produce a .mpy file")
+    if data[1] != int(major):
+        raise MpyCrossError(
+            f"mpy-cross emits mpy v{data[1]}, the device requires v{target.version}"
+        )
+    # the sub-version is only set for native code
+    if data[2] & 3 and minor and data[2] & 3 != int(minor):
+        raise MpyCrossError(
+            f"mpy-cross emits mpy v{data[1]}.{data[2] & 3}, the device requires v{target.version}"
+        )
+
+
+def cache_key(source: bytes, name: str, target: MpyTarget, opt: int) -> str:
+    h = hashlib.sha256(source)
+    h.update(f"\0{name}\0{target.version}\0{target.arch}\0{opt}".encode())
+    return h.hexdigest()
+
+
+def compile_source(
+    source: bytes,
+    name: str,
+    target: MpyTarget,
+    *,
+    opt: int = 0,
+    cache_dir: Optional[Path] = None,
+) -> Path:
+    """Compile source code to .mpy, and return the path of the compiled file in the cache.
+    args:
+        source: the source code
+        name: the path of the source on the device, used in tracebacks
+        target: the .mpy version and architecture of the device
+        opt: the optimisation level, 0-3
+    """
+    cache_dir = Path(cache_dir or CACHE_DIR)
+    compiled = cache_dir / f"{cache_key(source, name, target, opt)}.mpy"
+    if compiled.exists():
+        log.trace(f"mpy-cross cache hit for {name}")
+        return compiled
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    cmd = mpy_cross_cmd(target) + [f"-O{opt}", "-s", name]
+    if target.arch:
+        cmd.append(f"-march={target.arch}")
+    with tempfile.TemporaryDirectory(prefix="mpy_cross_", dir=cache_dir) as tmp:
+        src, out = Path(tmp) / "source.py", Path(tmp) / "source.mpy"
+        src.write_bytes(source)
+        log.debug(f"mpy-cross {name}")
+        p = subprocess.run(cmd + ["-o", str(out), str(src)], capture_output=True, text=True)
+        if p.returncode or not out.exists():
+            raise MpyCrossError(f"mpy-cross failed to compile {name}: {p.stderr.strip()}")
+        check_header(out.read_bytes(), target)
+        # replace atomically, other kernels may share the cache
+        os.replace(out, compiled)
+    return compiled
+
+
+def compile_file(
+    path: Path, name: str, target: MpyTarget, *, opt: int = 0, cache_dir: Optional[Path] = None
+) -> Path:
+    """Compile a source file to .mpy, and return the path of the compiled file in the cache"""
+    return compile_source(Path(path).read_bytes(), name, target, opt=opt, cache_dir=cache_dir)
@@ -0,0 +1,77 @@
+"""
+Throttled rendering of streamed output.
+
+A device can print lines much faster than a notebook frontend can display them.
+Rather than printing each line as it is received, lines are batched into frames,
+and at most `refresh_rate` frames per second are written to the notebook.
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Deque, List, Optional
+
+from IPython.display import DisplayHandle, Pretty, display
+
+# output of several devices is rendered from multiple threads, one frame at a time
+_print_lock = threading.Lock()
+
+
+class FrameRenderer:
+    """Batch lines of output into frames, written at most `refresh_rate` times per second.
+
+    With `visible_lines` set, each frame replaces the previous one in a single display,
+    and only the last `visible_lines` lines are shown.
+    Otherwise each frame is appended to the output of the cell.
+    A refresh_rate of 0 renders each line as soon as it is written.
+    With a prefix, such as the port of the device, each line is prefixed.
+    """
+
+    def __init__(self, refresh_rate: float = 0, visible_lines: int = 0, prefix: str = ""):
+        self.prefix = prefix
+        self.interval = 1 / refresh_rate if refresh_rate > 0 else 0
+        self.visible: Optional[Deque[str]] = (
+            deque(maxlen=visible_lines) if visible_lines > 0 else None
+        )
+        self.pending: List[str] = []
+        self.handle: Optional[DisplayHandle] = None
+        self.last_frame = 0.0
+        self.frames = 0
+
+    def write(self, output: str):
+        """Add output to the next frame"""
+        if not self.interval and self.visible is None:
+            with _print_lock:
+                print(self.prefix + output if self.prefix else output, end="")
+            return
+        self.pending.append(output)
+        self.tick()
+
+    def tick(self):
+        """Render a frame if there is pending output, and the refresh interval has passed"""
+        if self.pending and time.monotonic() - self.last_frame >= self.interval:
+            self.render()
+
+    def flush(self):
+        """Render any pending output"""
+        if self.pending:
+            self.render()
+
+    def render(self):
+        if self.prefix:
+            text = "".join(self.prefix + line for line in self.pending)
+        else:
+            text = "".join(self.pending)
+        self.pending.clear()
+        self.last_frame = time.monotonic()
+        self.frames += 1
+        if self.visible is None:
+            with _print_lock:
+                print(text, end="", flush=True)
+            return
+        self.visible.extend(text.splitlines())
+        frame = Pretty("\n".join(self.visible))
+        if self.handle:
+            self.handle.update(frame)
+        else:
+            self.handle = display(frame, display_id=True)
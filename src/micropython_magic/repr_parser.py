@@ -0,0 +1,199 @@
+"""
+A safe and fast parser for the repr of MicroPython values.
+
+The output of the MCU is text, that must not be run as code in the kernel.
+This parser only accepts literals: None, True, False, numbers, strings, bytes,
+lists, tuples, dicts and sets, and the reprs of `bytearray`, `array`, `OrderedDict` and `set`.
+Arrays are returned as numpy arrays, or as `array.array` if numpy is not installed.
+
+Lists, tuples and arrays of numbers are converted in one step by the json decoder,
+which is much faster than `ast.literal_eval` or `eval` for large outputs.
+"""
+
+import array
+import ast
+import json
+import re
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+from .transport import TYPECODES
+
+
+class ReprError(ValueError):
+    """The text is not the repr of a MicroPython literal"""
+
+
+_TOKEN = re.compile(
+    r"""\s*(?:
+    (?P<num>[-+]?(?:(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?|inf|nan)(?![\w.]))
+    |(?P<str>b?(?:'(?:[^'\\\n]|\\.)*'|"(?:[^"\\\n]|\\.)*"))
+    |(?P<name>[A-Za-z_]\w*)
+    |(?P<punct>[\[\](){},:])
+    )""",
+    re.VERBOSE,
+)
+# the characters of a sequence of numbers, up to the closing bracket, json validates the numbers
+_NUMBERS = re.compile(r"[-+\d.eEinfa,\s]*([\])])")
+_PUNCT = re.compile(r"\s*([\[\](){},:])")
+_SPACE = re.compile(r"\s*")
+_CONSTANTS = {"None": None, "True": True, "False": False, "inf": float("inf"), "nan": float("nan")}
+
+
+def parse_repr(text: str) -> Any:
+    """Convert the repr of a MicroPython value to a python value.
+    Raises ReprError if the text is not a literal.
+    """
+    parser = _Parser(text)
+    try:
+        value = parser.value()
+    except ReprError:
+        raise
+    except (ValueError, TypeError, OverflowError, SyntaxError, RecursionError) as e:
+        # such as bytearray('x'), set(1), or a structure that is nested too deep
+        raise ReprError(f"not a valid literal: {e}") from e
+    if _SPACE.match(text, parser.pos).end() != len(text):  # type: ignore
+        raise ReprError(f"unexpected text at {parser.pos}: {text[parser.pos:parser.pos + 20]!r}")
+    return value
+
+
+def _numbers(segment: str) -> List:
+    if "n" in segment:  # inf or nan, json only knows Infinity and NaN
+        return [_number(x.strip()) for x in segment.split(",")]
+    return json.loads(f"[{segment}]")
+
+
+def _number(token: str):
+    try:
+        return int(token)
+    except ValueError:
+        return float(token)
+
+
+def _string(token: str):
+    quoted = token[1:] if token[0] == "b" else token
+    if "\\" in quoted:
+        return ast.literal_eval(token)
+    return quoted[1:-1].encode("latin-1") if token[0] == "b" else quoted[1:-1]
+
+
+def _array(typecode: str, values: Iterable = ()):
+    if typecode not in TYPECODES:
+        raise ReprError(f"unknown array typecode {typecode!r}")
+    try:
+        import numpy as np
+    except ImportError:
+        return array.array(typecode, values)
+    kind, size = TYPECODES[typecode]
+    return np.array(values, dtype=f"{kind}{size}")
+
+
+# the constructors that MicroPython uses in the repr of a value
+_CALLS: Dict[str, Callable] = {
+    "array": _array,
+    "bytearray": bytearray,
+    "OrderedDict": OrderedDict,
+    "set": set,
+    "frozenset": frozenset,
+}
+
+
+class _Parser:
+    def __init__(self, text: str):
+        self.text = text
+        self.pos = 0
+        # a single item tuple has a trailing comma
+        self._trailing_comma = False
+
+    def token(self) -> Tuple[str, str]:
+        m = _TOKEN.match(self.text, self.pos)
+        if not m or m.end() == self.pos:
+            raise ReprError(f"unexpected text at {self.pos}: {self.text[self.pos:self.pos + 20]!r}")
+        self.pos = m.end()
+        kind = m.lastgroup or ""
+        return kind, m.group(kind)
+
+    def expect(self, punct: str):
+        kind, tok = self.token()
+        if tok != punct or kind != "punct":
+            raise ReprError(f"expected {punct!r} at {self.pos}, found {tok!r}")
+
+    def peek(self, punct: str) -> bool:
+        """consume the punctuation if it is next"""
+        m = _PUNCT.match(self.text, self.pos)
+        if m and m.group(1) == punct:
+            self.pos = m.end()
+            return True
+        return False
+
+    def value(self) -> Any:
+        kind, tok = self.token()
+        if kind == "num":
+            return _number(tok)
+        if kind == "str":
+            return _string(tok)
+        if kind == "name":
+            if tok in _CONSTANTS:
+                return _CONSTANTS[tok]
+            if tok in _CALLS:
+                self.expect("(")
+                args = []
+                while not self.peek(")"):
+                    args.append(self.value())
+                    if not self.peek(","):
+                        self.expect(")")
+                        break
+                return _CALLS[tok](*args)
+            raise ReprError(f"{tok!r} is not a literal")
+        if tok == "[":
+            return self.items("]")
+        if tok == "(":
+            items = self.items(")")
+            return items[0] if len(items) == 1 and not self._trailing_comma else tuple(items)
+        if tok == "{":
+            return self.dict_or_set()
+        raise ReprError(f"unexpected {tok!r} at {self.pos}")
+
+    def items(self, close: str) -> List:
+        """the items of a list or tuple, after the opening bracket"""
+        self._trailing_comma = False
+        m = _NUMBERS.match(self.text, self.pos)
+        segment = m.group(0)[:-1].rstrip() if m else ""
+        if m and m.group(1) == close and not segment.endswith(","):
+            try:
+                values = _numbers(segment)
+            except ValueError:
+                pass
+            else:
+                self.pos = m.end()
+                return values
+        values = []
+        while not self.peek(close):
+            values.append(self.value())
+            self._trailing_comma = self.peek(",")
+            if not self._trailing_comma:
+                self.expect(close)
+                break
+        return values
+
+    def dict_or_set(self) -> Any:
+        if self.peek("}"):
+            return {}
+        first = self.value()
+        if not self.peek(":"):
+            values = {first}
+            while self.peek(","):
+                if self.peek("}"):
+                    return values
+                values.add(self.value())
+            self.expect("}")
+            return values
+        result = {first: self.value()}
+        while self.peek(","):
+            if self.peek("}"):
+                return result
+            key = self.value()
+            self.expect(":")
+            result[key] = self.value()
+        self.expect("}")
+        return result
@@ -0,0 +1,179 @@
+"""
+A helper runtime on the MCU, that is installed once and reused across calls.
+
+Without the runtime, each `--eval`, `--info` or `%mpy_timeit` sends and compiles its helper
+code on the MCU. With the runtime, the helpers are installed once as the `_mpy_rt` module,
+and later calls only send a short call such as `_mpy_rt.show(x)`.
+
+The runtime is installed:
+ - in "flash" as `/lib/_mpy_rt.py`, so it survives a reset of the MCU
+ - in "ram" for the session, it needs to be installed again after a reset
+
+The version of the runtime is the hash of its source, it is checked once per connection,
+and the runtime is only installed again when the version on the MCU differs.
+"""
+
+import hashlib
+from functools import lru_cache
+
+from .script_access import path_for_script
+from .transport import device_functions
+
+RUNTIME_NAME = "_mpy_rt"
+RUNTIME_FILE = f"/lib/{RUNTIME_NAME}.py"
+RUNTIME_MODES = ("off", "ram", "flash")
+
+# times a function `f(n)` that runs a statement n times, and measures the allocations of a loop
+TIMEIT_FUNC = """\
+def _mpy_timeit_empty(_n):
+    _t0 = time.ticks_us()
+    for _ in range(_n):
+        pass
+    return time.ticks_diff(time.ticks_us(), _t0)
+def _mpy_timeit_alloc(f):
+    gc.collect()
+    gc.disable()
+    try:
+        a = gc.mem_alloc()
+        f(1)
+        return gc.mem_alloc() - a
+    finally:
+        gc.enable()
+def _mpy_timeit_run(f, number, repeat, collect, min_run_us):
+    if not number:
+        number = 1
+        while f(number) < min_run_us and number < 1000000000:
+            number *= 10
+    runs = []
+    for _ in range(repeat):
+        if collect:
+            gc.collect()
+        runs.append(f(number))
+    alloc = max(0, _mpy_timeit_alloc(f) - _mpy_timeit_alloc(_mpy_timeit_empty))
+    print("{json_start}", json.dumps({{"loops": number, "runs": runs, "alloc": alloc}}), "{json_end}")
+"""
+
+# the functions that are called by the host
+RUNTIME_API = """\
+_BUFFERS = ("array", "bytes", "bytearray", "memoryview")
+def show(v):
+    n = type(v).__name__
+    if n in _BUFFERS:
+        _mpy_binary(v, n)
+    else:
+        print("{json_start}", json.dumps(v), "{json_end}")
+def stream(v, size):
+    n = type(v).__name__
+    if n in _BUFFERS:
+        _mpy_binary(v, n)
+    else:
+        _mpy_stream(v, size)
+def fw_info():
+    print(_info())
+def meminfo():
+    import micropython
+    print("time:", tuple(time.localtime()[:6]) + (0,))
+    micropython.mem_info(1)
+def timeit(f, number, repeat, collect, min_run_us):
+    _mpy_timeit_run(f, number, repeat, collect, min_run_us)
+"""
+
+# prints the time and the memory map, the same as meminfo() of the runtime
+MEMINFO_CODE = """\
+import micropython, time
+print("time:", tuple(time.localtime()[:6]) + (0,))
+micropython.mem_info(1)
+"""
+
+# prints the version of the runtime, or an empty string if it is not installed
+CHECK_CODE = """\
+import json
+try:
+    _mpy_rt_v = {name}.VERSION
+except NameError:
+    try:
+        import {name}
+        _mpy_rt_v = {name}.VERSION
+    except (ImportError, AttributeError):
+        _mpy_rt_v = ""
+print("{json_start}", json.dumps(_mpy_rt_v), "{json_end}")
+del _mpy_rt_v
+"""
+
+INSTALL_FLASH = """\
+import json, os, sys
+try:
+    os.mkdir("/lib")
+except OSError:
+    pass
+with open("{file}", "w") as _f:
+    _f.write({source!r})
+del _f
+sys.modules.pop("{name}", None)
+import {name}
+print("{json_start}", json.dumps({name}.VERSION), "{json_end}")
+"""
+
+# a class holds the functions, as a module cannot be created without a file
+INSTALL_RAM = """\
+import json
+class {name}:
+    pass
+_mpy_rt_ns = {{}}
+exec({source!r}, _mpy_rt_ns)
+for _k in _mpy_rt_ns:
+    setattr({name}, _k, _mpy_rt_ns[_k])
+del _mpy_rt_ns, _k
+print("{json_start}", json.dumps({name}.VERSION), "{json_end}")
+"""
+
+
+def runtime_source(json_start: str, json_end: str) -> str:
+    """The source of the runtime, including its version"""
+    body = _runtime_body(json_start, json_end)
+    return body + f'VERSION = "{runtime_version(json_start, json_end)}"\n'
+
+
+def runtime_version(json_start: str, json_end: str) -> str:
+    """The version of the runtime, the hash of its source"""
+    return hashlib.sha256(_runtime_body(json_start, json_end).encode()).hexdigest()[:12]
+
+
+@lru_cache(maxsize=None)
+def _runtime_body(json_start: str, json_end: str) -> str:
+    # the firmware info functions, without the call
+    fw_info = path_for_script("fw_info.py").read_text().split("\nprint(_info())")[0]
+    parts = [
+        "import gc, json, os, sys, time",
+        device_functions(),
+        fw_info,
+        TIMEIT_FUNC.format(json_start=json_start, json_end=json_end),
+        RUNTIME_API.format(json_start=json_start, json_end=json_end),
+    ]
+    # comments and empty lines only take space on the MCU
+    lines = [ln for ln in "\n".join(parts).splitlines() if ln.strip() and ln.strip()[0] != "#"]
+    return "\n".join(lines) + "\n"
+
+
+def check_code(json_start: str, json_end: str) -> str:
+    """The code that prints the version of the runtime on the MCU"""
+    return CHECK_CODE.format(name=RUNTIME_NAME, json_start=json_start, json_end=json_end)
+
+
+def install_code(mode: str, json_start: str, json_end: str) -> str:
+    """The code that installs the runtime on the MCU, and prints its version"""
+    template = INSTALL_FLASH if mode == "flash" else INSTALL_RAM
+    return template.format(
+        name=RUNTIME_NAME,
+        file=RUNTIME_FILE,
+        source=runtime_source(json_start, json_end),
+        json_start=json_start,
+        json_end=json_end,
+    )
+
+
+def call_code(mode: str, code: str) -> str:
+    """The code to call the runtime, that is imported from flash if needed"""
+    if mode == "flash":
+        return f"import {RUNTIME_NAME}\n{code}"
+    return code
@@ -1,6 +1,9 @@
+import os
 from pathlib    import Path 
 
 MY_PATH = Path(__file__).parent.absolute()
+# the folder for data that is kept between kernel sessions
+CACHE_PATH = Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "micropython_magic"
 
 def path_for_script(name:str):
     return MY_PATH / "scripts" / name 
\ No newline at end of file
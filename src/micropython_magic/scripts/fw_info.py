@@ -41,6 +41,7 @@ def _info():  # type:() -> dict[str, str]
             "cpu": "",
             "mpy": "",
             "arch": "",
+            "unique_id": "",
         }
     )
     try:
@@ -81,6 +82,13 @@ def _info():  # type:() -> dict[str, str]
             info["version"] = u.release
         except (IndexError, AttributeError, TypeError):
             pass
+    try:
+        import binascii
+        import machine
+
+        info["unique_id"] = binascii.hexlify(machine.unique_id()).decode()
+    except (ImportError, AttributeError):
+        pass
     # detect families
     for fam_name, mod_name, mod_thing in [
         ("pycopy", "pycopy", "const"),
@@ -0,0 +1,381 @@
+"""
+Persistent device session for MPRemote2.
+
+Rather than starting a new `mpremote` process for each magic, a session keeps a single
+mpremote transport open for the lifetime of the kernel.
+Cells, evals, file copies and resets re-use that connection, which avoids the cost of the
+interpreter startup, the mpremote import, opening the serial port and entering the raw REPL.
+
+Commands that the session does not know how to run (such as mount) are handed back to
+the mpremote subprocess.
+"""
+
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Callable, List, Optional, Union
+
+from IPython.utils.text import SList
+from loguru import logger as log
+
+from .capture import CapturedOutput
+from .interactive import DEFAULT_LOG_TAGS, POLL_INTERVAL, LogTags, OutputCollector
+from .stats import STATS
+
+# the number of arguments for the mpremote commands that can be run in a session
+SESSION_COMMANDS = {
+    "resume": 0,
+    "soft-reset": 0,
+    "reset": 0,
+    "bootloader": 0,
+    "exec": 1,
+    "eval": 1,
+    "run": 1,
+    "cp": 2,
+}
+
+RESET_CODE = "import time, machine; time.sleep_ms(100); machine.reset()"
+BOOTLOADER_CODE = "import time, machine; time.sleep_ms(100); machine.bootloader()"
+
+
+@contextmanager
+def _read_timeout(serial, timeout: float):
+    """Limit the time a read from the serial port blocks.
+    The transport reads a pseudo-terminal without checking for waiting data first.
+    """
+    saved = serial.timeout
+    serial.timeout = timeout
+    try:
+        yield
+    finally:
+        serial.timeout = saved
+
+
+def split_commands(cmd: List[str]) -> Optional[List[List[str]]]:
+    """Split a list of mpremote commands into the individual commands and their arguments.
+    Returns None if the list contains a command or option that cannot be run in a session.
+    """
+    commands = []
+    i = 0
+    while i < len(cmd):
+        name = cmd[i]
+        if name == "+":  # explicit command separator
+            i += 1
+            continue
+        if name not in SESSION_COMMANDS:
+            return None
+        n_args = SESSION_COMMANDS[name]
+        args = cmd[i + 1 : i + 1 + n_args]
+        if len(args) != n_args or any(a.startswith("-") for a in args if name != "exec"):
+            return None
+        commands.append([name] + args)
+        i += 1 + n_args
+    return commands
+
+
+class MCUSession:
+    """A persistent connection to a MCU, built on mpremote's own transport classes"""
+
+    def __init__(self, port: str = "auto"):
+        self.port = port
+        self.state = None  # mpremote.main.State
+
+    @property
+    def connected(self) -> bool:
+        return bool(self.state and self.state.transport)
+
+    def connect(self, port: Optional[str] = None):
+        """Open the transport to the device, if not already connected"""
+        # only import mpremote when a session is actually used
+        from mpremote.commands import CommandError, do_connect
+        from mpremote.main import State
+
+        port = port or self.port
+        if self.connected and port == self.port:
+            return
+        self.close()
+        self.port = port
+        self.state = State()
+        log.debug(f"session connect to {port}")
+        try:
+            with STATS.span("connect", port=port):
+                do_connect(self.state, SimpleNamespace(device=[port or "auto"]))
+        except CommandError as e:
+            self.state = None
+            raise ConnectionError(str(e)) from e
+
+    def close(self):
+        """Close the transport, and release the serial port"""
+        if not self.state:
+            return
+        from mpremote.commands import do_disconnect
+
+        log.debug(f"session disconnect from {self.port}")
+        try:
+            do_disconnect(self.state)
+        except Exception as e:  # the device may already be gone after a reset
+            log.trace(e)
+        self.state = None
+
+    @staticmethod
+    def can_run(cmd: List[str]) -> bool:
+        """Check if all commands can be run in the session"""
+        return split_commands(cmd) is not None
+
+    def run_cmd(
+        self,
+        cmd: List[str],
+        *,
+        port: Optional[str] = None,
+        resume: bool = True,
+        stream_out: bool = True,
+        timeout: Union[int, float] = 0,
+        follow: bool = True,
+        hide_meminfo: bool = False,
+        store_output: bool = True,
+        log_errors: bool = True,
+        tags: LogTags = DEFAULT_LOG_TAGS,
+        capture_lines: int = 0,
+        refresh_rate: float = 0,
+        visible_lines: int = 0,
+        prefix: str = "",
+        on_line: Optional[Callable[[str], bool]] = None,
+    ) -> Optional[Union[SList, CapturedOutput]]:
+        """Run a list of mpremote commands over the session's transport.
+        The output is handled in the same way as the output of the mpremote subprocess.
+        """
+        commands = split_commands(cmd)
+        if commands is None:
+            raise ValueError(f"Cannot run {cmd} in a session")
+        collector = self._prepare(
+            port=port,
+            resume=resume,
+            stream_out=stream_out,
+            hide_meminfo=hide_meminfo,
+            log_errors=log_errors,
+            tags=tags,
+            capture_lines=capture_lines,
+            refresh_rate=refresh_rate,
+            visible_lines=visible_lines,
+            prefix=prefix,
+            on_line=on_line,
+        )
+        try:
+            for command in commands:
+                if not self._run_one(command, collector, timeout=timeout, follow=follow):
+                    return None
+            collector.flush()
+            return collector.result(store_output)
+        finally:
+            collector.close()
+
+    def run_code(
+        self,
+        code: Union[str, bytes],
+        *,
+        port: Optional[str] = None,
+        resume: bool = True,
+        stream_out: bool = True,
+        timeout: Union[int, float] = 0,
+        follow: bool = True,
+        hide_meminfo: bool = False,
+        store_output: bool = True,
+        log_errors: bool = True,
+        tags: LogTags = DEFAULT_LOG_TAGS,
+        capture_lines: int = 0,
+        refresh_rate: float = 0,
+        visible_lines: int = 0,
+        prefix: str = "",
+        on_line: Optional[Callable[[str], bool]] = None,
+    ) -> Optional[Union[SList, CapturedOutput]]:
+        """Run a block of source code directly on the device, without a temporary file.
+        The source is sent using the raw-paste mode of the raw REPL, which uses flow control
+        to avoid overrunning the serial buffers of the device.
+        """
+        collector = self._prepare(
+            port=port,
+            resume=resume,
+            stream_out=stream_out,
+            hide_meminfo=hide_meminfo,
+            log_errors=log_errors,
+            tags=tags,
+            capture_lines=capture_lines,
+            refresh_rate=refresh_rate,
+            visible_lines=visible_lines,
+            prefix=prefix,
+            on_line=on_line,
+        )
+        if isinstance(code, str):
+            code = code.encode("utf-8")
+        try:
+            if not self.execute(code, collector, timeout=timeout, follow=follow):
+                return None
+            collector.flush()
+            return collector.result(store_output)
+        finally:
+            collector.close()
+
+    def _prepare(
+        self,
+        *,
+        port: Optional[str],
+        resume: bool,
+        stream_out: bool,
+        hide_meminfo: bool,
+        log_errors: bool,
+        tags: LogTags,
+        capture_lines: int,
+        refresh_rate: float,
+        visible_lines: int,
+        prefix: str,
+        on_line: Optional[Callable[[str], bool]] = None,
+    ) -> OutputCollector:
+        """Connect to the device, and create a collector for the output"""
+        self.connect(port)
+        assert self.state
+        # without resume mpremote soft-resets the device before the first command
+        self.state._auto_soft_reset = not resume
+        return OutputCollector(
+            stream_out=stream_out,
+            hide_meminfo=hide_meminfo,
+            log_errors=log_errors,
+            tags=tags,
+            capture_lines=capture_lines,
+            refresh_rate=refresh_rate,
+            visible_lines=visible_lines,
+            prefix=prefix,
+            on_line=on_line,
+        )
+
+    def _run_one(
+        self,
+        command: List[str],
+        collector: OutputCollector,
+        *,
+        timeout: Union[int, float],
+        follow: bool,
+    ) -> bool:
+        """Run a single command, return False if the output should not be followed"""
+        from mpremote.transport import TransportError
+
+        assert self.state
+        name, args = command[0], command[1:]
+        if name == "resume":
+            self.state._auto_soft_reset = False
+        elif name == "soft-reset":
+            self.state.ensure_raw_repl(soft_reset=True)
+        elif name in ("reset", "bootloader"):
+            self.state.ensure_raw_repl()
+            self.state.transport.exec_raw_no_follow(
+                RESET_CODE if name == "reset" else BOOTLOADER_CODE
+            )
+            # the device will disconnect, reconnect on the next command
+            self.close()
+        elif name == "cp":
+            try:
+                self.state.ensure_raw_repl()
+                self._copy(*args)
+            except (OSError, TransportError) as e:
+                log.warning(f"cp {args[0]} {args[1]} failed: {e}")
+        else:
+            if name == "run":
+                code = Path(args[0]).read_bytes()
+            elif name == "eval":
+                code = f"print({args[0]})".encode()
+            else:
+                code = args[0].encode()
+            return self.execute(code, collector, timeout=timeout, follow=follow)
+        return True
+
+    def _copy(self, src: str, dest: str):
+        """copy a single file to or from the device"""
+        assert self.state
+        transport = self.state.transport
+        if dest.startswith(":"):
+            data = Path(src).read_bytes()
+            with STATS.span("transfer", file=dest, size=len(data)):
+                transport.fs_writefile(dest[1:], data)
+        elif src.startswith(":"):
+            with STATS.span("transfer", file=src) as args:
+                data = transport.fs_readfile(src[1:])
+                args["size"] = len(data)
+            Path(dest).write_bytes(data)
+        else:
+            raise OSError(f"cp: one of {src} or {dest} must be a device path")
+
+    def execute(
+        self,
+        code: bytes,
+        collector: OutputCollector,
+        *,
+        timeout: Union[int, float] = 0,
+        follow: bool = True,
+    ) -> bool:
+        """Execute code on the device, and feed the output to the collector"""
+        assert self.state
+        with STATS.span("raw_repl"):
+            self.state.ensure_raw_repl()
+        transport = self.state.transport
+        with STATS.span("transfer", size=len(code)):
+            transport.exec_raw_no_follow(code)
+        if not transport.use_raw_paste:
+            log.debug("device does not support raw-paste mode, code was sent in raw REPL mode")
+        if not follow:
+            # the next command will interrupt the code if it is still running
+            transport.in_raw_repl = False
+            return False
+
+        # errors detected in the output are raised once the output has been drained
+        # to keep the transport in sync with the raw REPL
+        raised: List[Exception] = []
+
+        def consumer(data: bytes):
+            if raised:
+                return
+            try:
+                collector.feed(data.replace(b"\x04", b""))
+            except Exception as e:
+                raised.append(e)
+
+        deadline = None if timeout == 0 else time.monotonic() + abs(timeout)
+        try:
+            # wait for normal output, then for the error output
+            with STATS.span("execute"), _read_timeout(transport.serial, POLL_INTERVAL):
+                while True:
+                    # return when the device is quiet, to render the pending output
+                    data = transport.read_until(
+                        1,
+                        b"\x04",
+                        timeout=POLL_INTERVAL,
+                        data_consumer=consumer,
+                        timeout_overall=deadline and max(0, deadline - time.monotonic()),
+                    )
+                    if data.endswith(b"\x04") or (deadline and time.monotonic() >= deadline):
+                        break
+                    if not raised:
+                        collector.tick()
+            if not data.endswith(b"\x04"):
+                log.warning(f"Command timed out after {timeout} seconds")
+                self.interrupt()
+                return True
+            with STATS.span("drain"):
+                data_err = transport.read_until(1, b"\x04", timeout=10)
+            if not raised:
+                collector.flush()
+                collector.feed(data_err[:-1] if data_err.endswith(b"\x04") else data_err)
+        except KeyboardInterrupt:  # pragma: no cover
+            log.warning("Keyboard interrupt detected")
+            self.interrupt()
+        if raised:
+            raise raised[0]
+        return True
+
+    def interrupt(self):
+        """Interrupt the code running on the device"""
+        if not self.connected:
+            return
+        assert self.state
+        self.state.transport.serial.write(b"\x03")
+        # force re-entry of the raw REPL on the next command
+        self.state.transport.in_raw_repl = False
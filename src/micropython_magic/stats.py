@@ -0,0 +1,139 @@
+"""
+Timing statistics for the communication with the MCU.
+
+Operations such as `run_cmd` or `run_cell`, and the phases within them such as starting mpremote,
+opening the serial port or transferring a file, are recorded as timed spans in a statistics store.
+The spans can be summarized as percentiles per operation,
+or exported as a Chrome trace-event file to be viewed in chrome://tracing or https://ui.perfetto.dev .
+"""
+
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, Iterator, List, Union
+
+# the number of spans kept in the store, older spans are discarded
+MAX_SPANS = 10_000
+PERCENTILES = (50, 90, 99)
+
+
+@dataclass
+class Span:
+    name: str
+    category: str
+    start: float  # seconds, time.perf_counter()
+    duration: float  # seconds
+    thread: int = 0
+    args: Dict[str, Any] = field(default_factory=dict)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """The nearest-rank percentile of a sorted list of values"""
+    if not values:
+        return 0.0
+    rank = max(1, -(-len(values) * pct // 100))  # ceil
+    return values[int(rank) - 1]
+
+
+class SpanStore:
+    """A bounded, thread-safe store of timed spans"""
+
+    def __init__(self, max_spans: int = MAX_SPANS):
+        self.spans: Deque[Span] = deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+
+    def record(self, name: str, start: float, duration: float, category: str = "phase", **args):
+        """Record a span that started at `start` ( time.perf_counter() ) and took `duration` seconds"""
+        span = Span(name, category, start, duration, threading.get_ident(), args)
+        with self._lock:
+            self.spans.append(span)
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str = "phase", **args) -> Iterator[Dict[str, Any]]:
+        """Time the body of a with statement as a span.
+        The yielded dict can be used to add arguments to the span.
+        """
+        start = time.perf_counter()
+        try:
+            yield args
+        finally:
+            self.record(name, start, time.perf_counter() - start, category, **args)
+
+    def clear(self):
+        with self._lock:
+            self.spans.clear()
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """The count, mean, percentiles and max duration in seconds per operation"""
+        with self._lock:
+            spans = list(self.spans)
+        durations: Dict[str, List[float]] = {}
+        for span in spans:
+            durations.setdefault(span.name, []).append(span.duration)
+        result = {}
+        for name, values in durations.items():
+            values.sort()
+            stats = {"count": len(values), "mean": sum(values) / len(values)}
+            for pct in PERCENTILES:
+                stats[f"p{pct}"] = percentile(values, pct)
+            stats["max"] = values[-1]
+            result[name] = stats
+        return result
+
+    def table(self) -> str:
+        """The summary as a text table, with durations in milliseconds"""
+        columns = ["count", "mean"] + [f"p{pct}" for pct in PERCENTILES] + ["max"]
+        lines = [f"{'operation':<20}" + "".join(f"{c:>10}" for c in columns)]
+        for name, stats in self.summary().items():
+            row = f"{stats['count']:>10}" + "".join(
+                f"{stats[c] * 1000:>10.1f}" for c in columns[1:]
+            )
+            lines.append(f"{name:<20}{row}")
+        return "\n".join(lines)
+
+    def chrome_trace(self) -> Dict[str, Any]:
+        """The spans in the Chrome trace-event format, as complete events with times in microseconds"""
+        with self._lock:
+            spans = list(self.spans)
+        pid = os.getpid()
+        events = [
+            {
+                "name": span.name,
+                "cat": span.category,
+                "ph": "X",
+                "ts": round(span.start * 1_000_000, 1),
+                "dur": round(span.duration * 1_000_000, 1),
+                "pid": pid,
+                "tid": span.thread,
+                "args": span.args,
+            }
+            for span in spans
+        ]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def save_chrome_trace(self, filename: Union[str, Path]) -> Path:
+        """Write the spans to a Chrome trace-event JSON file"""
+        path = Path(filename)
+        path.write_text(json.dumps(self.chrome_trace(), default=str))
+        return path
+
+
+# the statistics store of the kernel
+STATS = SpanStore()
+
+
+def timed(func: Callable) -> Callable:
+    """Record each call of a method of MPRemote2 as an operation span, with the port as argument"""
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        with STATS.span(func.__name__, "operation", port=getattr(self, "port", "")):
+            return func(self, *args, **kwargs)
+
+    return wrapper
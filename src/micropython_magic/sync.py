@@ -0,0 +1,260 @@
+"""
+Incremental synchronisation of a host folder to a folder on the MCU, similar to rsync.
+
+A single round trip lists all files on the device recursively, with their size and hash.
+Only the files that differ from the host are copied, missing folders are created,
+and optionally the files and folders that are not on the host are removed.
+
+A manifest with the size, hash and modification time of each file is kept on the device.
+Files that have the same size and modification time as in the manifest are not hashed again,
+so the listing is cheap when little has changed since the last sync.
+"""
+
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Union
+
+from loguru import logger as log
+
+from .deploy import BATCH_FILES, IGNORE, device_folders
+from .filehash import HASH_FUNC, FileHash, same_file
+from .mpr import DONT_KNOW, JSON_END, JSON_START, MPRemote2
+from .precompile import MpyTarget, compile_file, mpy_name
+
+# the manifest file, in the root of the synchronised folder on the device
+MANIFEST = ".mpy_sync.json"
+
+# prints {"files": {path: [size, algo, digest]}, "dirs": [path]} relative to the root folder
+LIST_CODE = HASH_FUNC + """\
+def _mpy_sync_list(root, manifest):
+    pre = root + "/" if root else ""
+    try:
+        with open(pre + manifest) as fp:
+            known = json.load(fp)
+    except (OSError, ValueError):
+        known = {{}}
+    files, dirs, todo = {{}}, [], [""]
+    while todo:
+        rel = todo.pop()
+        try:
+            entries = list(os.ilistdir((pre + rel).rstrip("/")))
+        except OSError:
+            continue
+        for entry in entries:
+            path = rel + "/" + entry[0] if rel else entry[0]
+            if entry[1] & 0x4000:
+                dirs.append(path)
+                todo.append(path)
+            elif path != manifest:
+                st = os.stat(pre + path)
+                k = known.get(path)
+                if k and st[8] and k[0] == st[6] and k[3] == st[8]:
+                    files[path] = k[:3]
+                else:
+                    files[path] = _mpy_hash(pre + path)
+    return {{"files": files, "dirs": dirs}}
+print("{json_start}", json.dumps(_mpy_sync_list({root!r}, {manifest!r})), "{json_end}")
+del _mpy_hash, _mpy_sync_list
+"""
+
+# creates and removes folders and files, relative to the root folder
+PREPARE_CODE = """\
+import os
+def _mpy_sync_prepare(root, mkdirs, rmfiles, rmdirs):
+    pre = root + "/" if root else ""
+    for path in rmfiles:
+        os.remove(pre + path)
+    for path in rmdirs:
+        os.rmdir(pre + path)
+    for path in mkdirs:
+        try:
+            os.mkdir(pre + path if path else root)
+        except OSError:
+            pass
+_mpy_sync_prepare({root!r}, {mkdirs!r}, {rmfiles!r}, {rmdirs!r})
+del _mpy_sync_prepare
+"""
+
+# hashes the copied files, writes the manifest, and prints the hashes of the copied files
+MANIFEST_CODE = HASH_FUNC + """\
+def _mpy_sync_manifest(root, manifest, known, copied):
+    pre = root + "/" if root else ""
+    for path in copied:
+        known[path] = _mpy_hash(pre + path)
+    m = {{}}
+    for path, k in known.items():
+        try:
+            m[path] = k[:3] + [os.stat(pre + path)[8]]
+        except OSError:
+            pass
+    with open(pre + manifest, "w") as fp:
+        json.dump(m, fp)
+    return {{path: known[path] for path in copied}}
+print("{json_start}", json.dumps(_mpy_sync_manifest({root!r}, {manifest!r}, {known!r}, {copied!r})), "{json_end}")
+del _mpy_hash, _mpy_sync_manifest
+"""
+
+
+@dataclass
+class SyncResult:
+    """The result of synchronising a host folder to a device"""
+
+    port: str
+    copied: List[str] = field(default_factory=list)  # files copied to the device
+    unchanged: int = 0  # number of files that were already identical
+    deleted: List[str] = field(default_factory=list)  # files and folders removed from the device
+    created: List[str] = field(default_factory=list)  # folders created on the device
+    failed: List[str] = field(default_factory=list)  # files that differ after copying
+    size: int = 0  # number of bytes copied
+    seconds: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed
+
+    def __str__(self):
+        return (
+            f"{len(self.copied)} copied, {self.unchanged} unchanged, {len(self.deleted)} deleted, "
+            f"{len(self.failed)} failed, {self.size:,} bytes in {self.seconds:.1f}s"
+        )
+
+
+def host_tree(host_dir: Union[str, Path]) -> Dict[str, Path]:
+    """The files in a host folder, by their posix path relative to the folder"""
+    root = Path(host_dir)
+    if not root.is_dir():
+        raise NotADirectoryError(f"sync: {root} is not a folder")
+    return {
+        f.relative_to(root).as_posix(): f
+        for f in sorted(root.rglob("*"))
+        if f.is_file() and not IGNORE.intersection(f.relative_to(root).parts)
+    }
+
+
+def compile_tree(
+    host: Dict[str, Path], target: MpyTarget, device_dir: str = "", opt: int = 0
+) -> Dict[str, Path]:
+    """Replace the .py files in a host tree by their compiled .mpy files"""
+    pre = device_dir + "/" if device_dir else ""
+    tree = {}
+    for path, src in host.items():
+        if name := mpy_name(path):
+            tree[name] = compile_file(src, pre + path, target, opt=opt)
+        else:
+            tree[path] = src
+    return tree
+
+
+def sync(
+    mcu: MPRemote2,
+    host_dir: Union[str, Path],
+    device_dir: str = "",
+    *,
+    delete: bool = False,
+    dry_run: bool = False,
+    precompile: Optional[bool] = None,
+    progress: Optional[Callable[[str], None]] = None,
+) -> SyncResult:
+    """Synchronise a host folder to a folder on the device.
+    args:
+        mcu: the device
+        host_dir: the host folder
+        device_dir: the folder on the device, created if needed
+        delete: remove the files and folders on the device that are not in the host folder
+        dry_run: only determine what would be copied and deleted
+        precompile: compile .py files to .mpy files, defaults to the precompile setting of the mcu
+        progress: called with a message after each step
+    """
+    root = device_dir.lstrip(":").strip("/")
+    pre = root + "/" if root else ""
+    result = SyncResult(mcu.port)
+    start = time.perf_counter()
+    host = host_tree(host_dir)
+    compiled = []
+    if mcu.precompile if precompile is None else precompile:
+        compiled = [path for path in host if mpy_name(path)]
+        host = compile_tree(host, mcu.mpy_target(mcu.timeout), root, mcu.optimize)
+    sizes = {path: src.stat().st_size for path, src in host.items()}
+    # allow for about 2KB/s on a slow serial connection
+    timeout = max(mcu.timeout, 60 + sum(sizes.values()) / 2000)
+
+    listing = mcu.run_json(
+        LIST_CODE.format(root=root, manifest=MANIFEST, json_start=JSON_START, json_end=JSON_END),
+        timeout=timeout,
+    )
+    if listing == DONT_KNOW:
+        raise ConnectionError(f"sync: could not list {device_dir or '/'} on {mcu.port}")
+    on_device = {path: FileHash(*h) for path, h in listing["files"].items()}
+    dirs = set(listing["dirs"])
+
+    changed = []
+    for path, src in host.items():
+        if path in on_device and same_file(src, on_device[path]):
+            result.unchanged += 1
+            mcu.file_hashes[pre + path] = on_device[path]
+        else:
+            changed.append(path)
+    result.created = [d for d in device_folders(host) if d not in dirs]
+    if root and not listing["files"] and not dirs:
+        # the root folder may not exist yet
+        result.created.insert(0, "")
+    # the device imports a .py file before the .mpy file it was compiled to
+    rmfiles, rmdirs = sorted(path for path in compiled if path in on_device), []
+    if delete:
+        rmfiles = sorted(path for path in on_device if path not in host)
+        needed = set(device_folders(host))
+        rmdirs = sorted((d for d in dirs if d not in needed), key=lambda d: -d.count("/"))
+    result.deleted = rmfiles + rmdirs
+    if progress:
+        progress(
+            f"{len(changed)} to copy, {result.unchanged} unchanged, {len(result.deleted)} to delete"
+        )
+    if dry_run:
+        result.copied = changed
+        result.seconds = time.perf_counter() - start
+        return result
+
+    if rmfiles or rmdirs or result.created:
+        for path in rmfiles:
+            mcu.file_hashes.pop(pre + path, None)
+        code = PREPARE_CODE.format(root=root, mkdirs=result.created, rmfiles=rmfiles, rmdirs=rmdirs)
+        mcu.run_cmd(["exec", code], stream_out=False, timeout=timeout, store_output=False)
+    for i in range(0, len(changed), BATCH_FILES):
+        batch = changed[i : i + BATCH_FILES]
+        try:
+            mcu.copy_files_to_mcu(
+                {str(host[path]): pre + path for path in batch}, timeout=timeout, force=True
+            )
+        except (OSError, ConnectionError) as e:
+            log.warning(f"{mcu.port}: {e}")
+        if progress:
+            progress(f"copied {min(i + BATCH_FILES, len(changed))}/{len(changed)} files")
+
+    # the manifest keeps the device hashes of the unchanged files, and rehashes the copied files
+    known = {path: list(on_device[path]) for path in host if path not in changed}
+    copied = mcu.run_json(
+        MANIFEST_CODE.format(
+            root=root,
+            manifest=MANIFEST,
+            known=known,
+            copied=changed,
+            json_start=JSON_START,
+            json_end=JSON_END,
+        ),
+        timeout=timeout,
+    )
+    if copied == DONT_KNOW:
+        copied = {}
+    for path in changed:
+        hashed = FileHash(*copied[path]) if path in copied else FileHash(-1)
+        if same_file(host[path], hashed):
+            mcu.file_hashes[pre + path] = hashed
+            result.copied.append(path)
+            result.size += sizes[path]
+        else:
+            result.failed.append(path)
+    result.seconds = time.perf_counter() - start
+    if progress:
+        progress(str(result))
+    return result
@@ -0,0 +1,219 @@
+"""
+Transfer the result of an expression from the MCU to the host.
+
+Scalars, lists and dicts are sent as json.
+Typed buffers ( `array`, `bytes`, `bytearray` and `memoryview` ) are sent as their raw bytes,
+encoded as base64, which is about a third larger than the data,
+rather than 3-5 times larger for the decimal text of json.
+The buffer is encoded in small slices, so the MCU does not need to allocate a copy of it.
+
+On the host arrays are decoded directly into a numpy array, without an intermediate list.
+If numpy is not installed, a python `array.array` is returned.
+
+Large lists and dicts can be streamed: the MCU walks the object and prints its json in chunks
+of a bounded size, rather than building the whole json string in its memory.
+The host reassembles the chunks as they are received.
+"""
+
+import array
+import binascii
+import json
+import sys
+from typing import Any, Callable, List, Optional
+
+BIN_START = "<bin~"
+BIN_END = "~bin>"
+PART_START = "<part~"
+PART_END = "~part>"
+
+# items per slice, a multiple of 3 so that each slice is base64 encoded without padding
+BIN_SLICE = 384
+
+# prints a typed buffer as base64 of its raw bytes, in slices
+BINARY_FUNC = """\
+def _mpy_binary(v, n):
+    import binascii, sys
+    m = memoryview(v)
+    t = repr(v[:0])[7] if n == "array" else "B"
+    print("{bin_start}", n, t, len(m), sys.byteorder, end=" ")
+    for i in range(0, len(m), {bin_slice}):
+        print(binascii.b2a_base64(m[i : i + {bin_slice}])[:-1].decode(), end="")
+    print("", "{bin_end}")
+"""
+
+# evaluates the statement and prints it as binary, or else runs the {other} line
+EVAL_CODE = """\
+import json
+{binary_func}_v = ({statement})
+_n = type(_v).__name__
+if _n in ("array", "bytes", "bytearray", "memoryview"):
+    _mpy_binary(_v, _n)
+else:
+    {other}
+del _v, _n, _mpy_binary
+"""
+
+# walks an object and prints its json in chunks of at least `size` characters,
+# each chunk with the number of top level items sent, and the total number of top level items
+STREAM_FUNC = """\
+def _mpy_walk(v, top=False):
+    if isinstance(v, dict):
+        yield "{{"
+        for i, k in enumerate(v):
+            yield (", " if i else "") + json.dumps(k if isinstance(k, str) else str(k)) + ": "
+            yield from _mpy_walk(v[k])
+            if top:
+                yield None
+        yield "}}"
+    elif isinstance(v, (list, tuple)) or type(v).__name__ == "array":
+        yield "["
+        for i, x in enumerate(v):
+            if i:
+                yield ", "
+            yield from _mpy_walk(x)
+            if top:
+                yield None
+        yield "]"
+    else:
+        yield json.dumps(v)
+        if top:
+            yield None
+def _mpy_stream(v, size):
+    seq = isinstance(v, (dict, list, tuple)) or type(v).__name__ == "array"
+    total, done, n, buf = len(v) if seq else 1, 0, 0, []
+    for s in _mpy_walk(v, True):
+        if s is None:
+            done += 1
+            continue
+        buf.append(s)
+        n += len(s)
+        if n >= size:
+            print("{part_start}", done, total, "".join(buf), "{part_end}")
+            n, buf = 0, []
+    print("{part_start}", done, total, "".join(buf), "{part_end}")
+"""
+
+# the kind and default size of the array typecodes of MicroPython
+TYPECODES = {
+    "b": ("i", 1),
+    "B": ("u", 1),
+    "h": ("i", 2),
+    "H": ("u", 2),
+    "i": ("i", 4),
+    "I": ("u", 4),
+    "l": ("i", 4),
+    "L": ("u", 4),
+    "q": ("i", 8),
+    "Q": ("u", 8),
+    "f": ("f", 4),
+    "d": ("f", 8),
+}
+
+
+def eval_code(statement: str, json_start: str, json_end: str) -> str:
+    """The MicroPython code to evaluate a statement and print its value as binary or as json"""
+    other = f'print("{json_start}", json.dumps(_v), "{json_end}")'
+    return _eval_code(statement, other)
+
+
+def stream_code(statement: str, chunk_size: int) -> str:
+    """The MicroPython code to evaluate a statement and print its value in chunks.
+    Typed buffers are sent as binary, other values as json in chunks of about chunk_size characters.
+    """
+    walk = STREAM_FUNC.format(part_start=PART_START, part_end=PART_END)
+    code = _eval_code(statement, f"_mpy_stream(_v, {max(1, int(chunk_size))})")
+    return f"{walk}{code}del _mpy_walk, _mpy_stream\n"
+
+
+def device_functions() -> str:
+    """The MicroPython functions that print values as binary or as json chunks"""
+    binary = BINARY_FUNC.format(bin_start=BIN_START, bin_end=BIN_END, bin_slice=BIN_SLICE)
+    return binary + STREAM_FUNC.format(part_start=PART_START, part_end=PART_END)
+
+
+def _eval_code(statement: str, other: str) -> str:
+    binary = BINARY_FUNC.format(bin_start=BIN_START, bin_end=BIN_END, bin_slice=BIN_SLICE)
+    return EVAL_CODE.format(statement=statement, other=other, binary_func=binary)
+
+
+def is_binary(line: str) -> bool:
+    return line.startswith(BIN_START) and line.endswith(BIN_END)
+
+
+def load_binary(line: str) -> Any:
+    """Decode a buffer sent by the MCU.
+    bytes and bytearray are returned as such, arrays and memoryviews as a numpy array.
+    """
+    header = line[len(BIN_START) : -len(BIN_END)].split()
+    if len(header) == 4:
+        header.append("")  # an empty buffer
+    name, typecode, count, byteorder, encoded = header
+    data = binascii.a2b_base64(encoded)
+    if name == "bytes":
+        return data
+    if name == "bytearray":
+        return bytearray(data)
+    kind, size = TYPECODES.get(typecode, ("u", 1))
+    if int(count):
+        # the size of int and long depends on the port
+        size = len(data) // int(count)
+    return to_array(data, kind, size, byteorder)
+
+
+class ChunkAssembler:
+    """Reassemble a value that the MCU sends in chunks, as the lines of output are received"""
+
+    def __init__(self, progress: Optional[Callable[[int, int], None]] = None):
+        self.parts: List[str] = []
+        self.binary = ""
+        self.done = self.total = 0
+        self.size = 0  # the number of characters received
+        self.progress = progress
+
+    @property
+    def complete(self) -> bool:
+        return bool(self.binary) or (bool(self.parts) and self.done == self.total)
+
+    def feed(self, line: str) -> bool:
+        """Consume a line of output, returns False if the line is not part of the value"""
+        line = line.strip()
+        if is_binary(line):
+            self.binary = line
+            self.size += len(line)
+            return True
+        if not (line.startswith(PART_START) and line.endswith(PART_END)):
+            return False
+        done, total, payload = line[len(PART_START) + 1 : -len(PART_END) - 1].split(" ", 2)
+        self.done, self.total = int(done), int(total)
+        self.parts.append(payload)
+        self.size += len(payload)
+        if self.progress:
+            self.progress(self.done, self.total)
+        return True
+
+    def result(self) -> Any:
+        """The value that was received"""
+        if self.binary:
+            return load_binary(self.binary)
+        return json.loads("".join(self.parts))
+
+
+def to_array(data: bytes, kind: str, size: int, byteorder: str = "little"):
+    """Create a numpy array, or an array.array if numpy is not installed, from raw data"""
+    try:
+        import numpy as np
+    except ImportError:
+        return _to_pyarray(data, kind, size, byteorder)
+    dtype = np.dtype(f"{'<' if byteorder == 'little' else '>'}{kind}{size}")
+    return np.frombuffer(data, dtype=dtype)
+
+
+def _to_pyarray(data: bytes, kind: str, size: int, byteorder: str) -> array.array:
+    for typecode in "bBhHiIlLqQfd":
+        if TYPECODES[typecode][0] == kind and array.array(typecode).itemsize == size:
+            result = array.array(typecode)
+            result.frombytes(data)
+            if byteorder != sys.byteorder:
+                result.byteswap()
+            return result
+    raise ValueError(f"Cannot convert an array of {kind}{size} items")
@@ -0,0 +1,13 @@
+"""Benchmark the time to import the extension in a new interpreter"""
+
+import subprocess
+import sys
+
+import pytest
+
+
+@pytest.mark.parametrize("module", ["IPython", "micropython_magic", "micropython_magic.memoryinfo"])
+def test_import(benchmark, module):
+    benchmark.group = "import in a new interpreter"
+    cmd = [sys.executable, "-c", f"import {module}"]
+    benchmark.pedantic(subprocess.run, args=(cmd,), kwargs={"check": True}, rounds=5, iterations=1)
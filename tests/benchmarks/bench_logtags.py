@@ -0,0 +1,62 @@
+"""
+Benchmark the classification of device output by the compiled LogTags matcher,
+against the previous implementation that scanned the tags one by one.
+"""
+
+import re
+
+import pytest
+from fake_mcu import captured_log
+
+from micropython_magic.interactive import DEFAULT_LOG_TAGS, LineKind, LogTags
+from micropython_magic.memoryinfo import RE_ALL
+
+LOG = captured_log(4 * 1024 * 1024)
+
+
+def classify_legacy(output: str, tags: LogTags, hide_meminfo=False) -> LineKind:
+    """The classification as done by do_output before the tags were compiled"""
+    kind = LineKind.NONE
+    if any(tag in output for tag in tags.reset_tags):
+        kind |= LineKind.RESET
+    if any(tag in output for tag in tags.error_tags):
+        kind |= LineKind.ERROR
+    if any(tag in output for tag in tags.trace_tags) or any(
+        re.match(rx, output) for rx in tags.trace_res
+    ):
+        kind |= LineKind.TRACE
+    if any(tag in output for tag in tags.warning_tags):
+        kind |= LineKind.WARNING
+    if any(tag in output for tag in tags.success_tags):
+        kind |= LineKind.SUCCESS
+    if any(tag in output for tag in tags.ignore_tags):
+        kind |= LineKind.IGNORE
+    if hide_meminfo and output and any(rx.match(output) for rx in RE_ALL):
+        kind |= LineKind.MEMINFO
+    return kind
+
+
+def classify_compiled(output: str, tags: LogTags, hide_meminfo=False) -> LineKind:
+    return tags.classify(output, meminfo=hide_meminfo and bool(output))
+
+
+def test_same_result():
+    for line in LOG:
+        for hide in (False, True):
+            assert classify_compiled(line, DEFAULT_LOG_TAGS, hide) == classify_legacy(
+                line, DEFAULT_LOG_TAGS, hide
+            ), line
+
+
+@pytest.mark.parametrize("hide_meminfo", [False, True], ids=["show_meminfo", "hide_meminfo"])
+@pytest.mark.parametrize(
+    "classifier", [classify_legacy, classify_compiled], ids=["legacy", "compiled"]
+)
+def test_classify_log(benchmark, classifier, hide_meminfo):
+    benchmark.group = f"classify {len(LOG)} lines, hide_meminfo={hide_meminfo}"
+
+    def run():
+        for line in LOG:
+            classifier(line, DEFAULT_LOG_TAGS, hide_meminfo)
+
+    benchmark.pedantic(run, rounds=3, iterations=1)
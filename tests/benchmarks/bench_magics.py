@@ -0,0 +1,74 @@
+"""
+Benchmark the magics against the fake MCU, using the mpremote subprocess and a device session.
+The fake MCU runs at full speed, so the results show the overhead on the host side.
+"""
+
+import pytest
+from fake_mcu import HEAP_SIZES, FakeMCU, mem_info_dump
+
+from micropython_magic.memoryinfo import MemoryInfo
+
+CELL = "\n".join(f"print('line {n}')" for n in range(20))
+MODULE = "\n".join(f"def function_{n}(a, b):\n    return a * b + {n}\n" for n in range(100))
+
+
+def test_eval(benchmark, mpy_shell):
+    benchmark.group = "%mpy --eval"
+    result = benchmark.pedantic(
+        mpy_shell.run_line_magic, args=("mpy", "--eval 1 + 1"), rounds=5, iterations=1
+    )
+    assert result == 2
+
+
+def test_cell(benchmark, mpy_shell, capsys):
+    benchmark.group = "%%micropython, 20 lines of output"
+    benchmark.pedantic(
+        mpy_shell.run_cell_magic, args=("micropython", "", CELL), rounds=5, iterations=1
+    )
+    assert "line 19" in capsys.readouterr().out
+
+
+def test_writefile(benchmark, mpy_shell, fake_mcu):
+    benchmark.group = f"%%micropython --writefile, {len(MODULE)} bytes"
+    benchmark.pedantic(
+        mpy_shell.run_cell_magic,
+        args=("micropython", "--writefile module.py", MODULE),
+        rounds=5,
+        iterations=1,
+    )
+    assert (fake_mcu.root / "module.py").read_text().endswith(MODULE)
+
+
+def test_readfile(benchmark, mpy_shell, fake_mcu):
+    benchmark.group = f"readfile, {len(MODULE)} bytes"
+    (fake_mcu.root / "module.py").write_text(MODULE)
+    magics = mpy_shell.magics_manager.registry["MicroPythonMagic"]
+    code = benchmark.pedantic(
+        magics.MCU.cell_from_mcu_file, args=("module.py",), rounds=5, iterations=1
+    )
+    assert code == MODULE
+
+
+@pytest.mark.parametrize("heap", HEAP_SIZES.keys())
+def test_mem_info(benchmark, ipy, heap):
+    """Retrieve and parse a memory map of the given heap size"""
+    benchmark.group = f"mem_info(1), {heap} heap"
+    with FakeMCU(heap_dump=mem_info_dump(HEAP_SIZES[heap])) as mcu:
+        ipy.run_line_magic("config", "MicroPythonMagic.session = True")
+        ipy.run_line_magic("mpy", f"--select {mcu.port}")
+
+        def run():
+            output = ipy.run_line_magic("mpy", "import micropython; micropython.mem_info(1)")
+            return MemoryInfo(output)
+
+        mem_info = benchmark.pedantic(run, rounds=3, iterations=1)
+    assert mem_info.total == HEAP_SIZES[heap]
+
+
+@pytest.mark.parametrize("heap", HEAP_SIZES.keys())
+def test_mem_info_parse(benchmark, heap):
+    """Parse a memory map of the given heap size"""
+    benchmark.group = f"MemoryInfo.parse, {heap} heap"
+    dump = mem_info_dump(HEAP_SIZES[heap]).splitlines()
+    mem_info = benchmark.pedantic(MemoryInfo, args=(dump,), rounds=3, iterations=1)
+    assert mem_info.total == HEAP_SIZES[heap]
@@ -0,0 +1,100 @@
+"""
+Benchmark parsing the memory map of a heap of 8K, 256K and 4M into MemoryInfo,
+against the previous implementation that joined the lines of the map as a str
+and inserted the free lines one list slice at a time.
+Benchmark rendering the map as colored text in runs of blocks, against rendering it block by block,
+and as a PNG image, and the diff engine against classifying the blocks one by one.
+"""
+
+import pytest
+from fake_mcu import HEAP_SIZES, mem_info_dump
+from test_memoryinfo_render import render, render_blockwise
+
+from micropython_magic.memoryinfo import RE_BLOCK, RE_FREE, MemoryInfo
+
+DUMPS = {heap: mem_info_dump(HEAP_SIZES[heap], used_pct=0.9) for heap in HEAP_SIZES}
+
+
+def parse_legacy(mem_info: str) -> str:
+    """The map as parsed by MemoryInfo.parse before it was stored as bytes"""
+    _raw_map = RE_BLOCK.findall(mem_info)
+    if RE_FREE.search(mem_info):
+        lines = mem_info.split("\n")
+        l1 = 0
+        for line in lines:
+            if RE_BLOCK.match(line):
+                l1 += 1
+                continue
+            match_free = RE_FREE.search(line)
+            if match_free:
+                lines_free = int(match_free.groups(0)[0])
+                _raw_map[l1:l1] = ["." * 64] * lines_free
+                l1 += lines_free
+    return "".join(_raw_map)
+
+
+def parse(mem_info: str) -> MemoryInfo:
+    info = MemoryInfo()
+    info.show_free = True
+    return info.parse(mem_info)
+
+
+@pytest.mark.parametrize("heap", HEAP_SIZES.keys())
+def test_same_map(heap):
+    assert parse(DUMPS[heap]).mmap == parse_legacy(DUMPS[heap])
+
+
+@pytest.mark.parametrize("heap", HEAP_SIZES.keys())
+@pytest.mark.parametrize("parser", [parse, parse_legacy], ids=["parse", "legacy"])
+def test_parse(benchmark, parser, heap):
+    benchmark.group = f"MemoryInfo.parse, {heap} heap, free lines expanded"
+    benchmark.pedantic(parser, args=(DUMPS[heap],), rounds=5, iterations=1)
+
+
+@pytest.mark.parametrize("heap", ["256K", "4M"])
+@pytest.mark.parametrize("renderer", [render, render_blockwise], ids=["runs", "blockwise"])
+def test_render(benchmark, renderer, heap):
+    benchmark.group = f"MemoryInfo._repr_pretty_, {heap} heap"
+    info = parse(DUMPS[heap])
+    info.rainbow = True
+    benchmark.pedantic(renderer, args=(info,), rounds=3, iterations=1)
+
+
+@pytest.mark.parametrize("heap", ["256K", "4M"])
+@pytest.mark.parametrize("renderer", [render, render_blockwise], ids=["runs", "blockwise"])
+def test_render_diff(benchmark, renderer, heap):
+    benchmark.group = f"MemoryInfo._repr_pretty_diff_, {heap} heap"
+    info, other = parse(DUMPS[heap]), parse(mem_info_dump(HEAP_SIZES[heap], used_pct=0.5))
+    benchmark.pedantic(renderer, args=(info, other), rounds=3, iterations=1)
+
+
+@pytest.mark.parametrize("heap", ["256K", "4M"])
+@pytest.mark.parametrize("diff", [False, True], ids=["map", "diff"])
+def test_render_png(benchmark, heap, diff):
+    benchmark.group = f"MemoryInfo.png, {heap} heap"
+    info, other = parse(DUMPS[heap]), parse(mem_info_dump(HEAP_SIZES[heap], used_pct=0.5))
+    image = benchmark.pedantic(
+        info.png, kwargs={"zoom": 2, "other": other if diff else None}, rounds=3, iterations=1
+    )
+    assert len(image.data) < 1024 * 1024
+
+
+def diff_blockwise(info: MemoryInfo, other: MemoryInfo) -> dict:
+    """Classify each block with diff_color, as the diff view did before"""
+    counts: dict = {}
+    for i, c in enumerate(info.mmap):
+        color = info.diff_color(c, other.mmap[i] if i < len(other.mmap) else "")
+        counts[color] = counts.get(color, 0) + 1
+    return counts
+
+
+@pytest.mark.parametrize("engine", ["diff", "blockwise"])
+def test_diff(benchmark, engine):
+    benchmark.group = "diff of two 1M heaps"
+    heap = 1024 * 1024
+    info, other = parse(mem_info_dump(heap, used_pct=0.9)), parse(mem_info_dump(heap, used_pct=0.5))
+    if engine == "diff":
+        diff = benchmark.pedantic(info.diff, args=(other,), rounds=5, iterations=1)
+        assert sum(diff.counts.values()) == len(info.mmap)
+    else:
+        benchmark.pedantic(diff_blockwise, args=(info, other), rounds=3, iterations=1)
@@ -0,0 +1,44 @@
+"""
+Benchmark the parser for the repr of MicroPython values, against `ast.literal_eval` and `eval`
+on multi-megabyte outputs, as printed by the MCU.
+"""
+
+import ast
+import random
+
+import pytest
+
+from micropython_magic.repr_parser import parse_repr
+
+random.seed(42)
+OUTPUTS = {
+    # 200k ADC readings, about 1.2 MB
+    "ints": repr([random.randrange(4096) for _ in range(200_000)]),
+    # 200k sensor readings, about 4 MB
+    "floats": repr(tuple(random.random() * 100 for _ in range(200_000))),
+    # 20k records of mixed values, about 1.5 MB
+    "records": repr(
+        [
+            {"id": n, "name": f"sensor {n}", "raw": bytes([n % 256] * 8), "xy": (n, -n / 7)}
+            for n in range(20_000)
+        ]
+    ),
+}
+OUTPUTS["array"] = f"array('f', {OUTPUTS['floats'].replace('(', '[').replace(')', ']')})"
+
+
+def test_same_result():
+    for name in ("ints", "floats", "records"):
+        assert parse_repr(OUTPUTS[name]) == ast.literal_eval(OUTPUTS[name])
+
+
+@pytest.mark.parametrize("name", OUTPUTS.keys())
+@pytest.mark.parametrize(
+    "parser", [parse_repr, ast.literal_eval, eval], ids=["parse_repr", "literal_eval", "eval"]
+)
+def test_parse(benchmark, parser, name):
+    text = OUTPUTS[name]
+    benchmark.group = f"parse {name}, {len(text) / 1e6:.1f} MB"
+    if name == "array" and parser is not parse_repr:
+        pytest.skip("only parse_repr converts arrays")
+    benchmark.pedantic(parser, args=(text,), rounds=3, iterations=1)
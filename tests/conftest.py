@@ -0,0 +1,56 @@
+"""Fixtures to run the magics against a fake MicroPython device, no MCU needed."""
+
+import sys
+
+import pytest
+
+if sys.platform != "win32":
+    from fake_mcu import FakeMCU
+
+
+@pytest.fixture(autouse=True)
+def cache_path(tmp_path, monkeypatch):
+    """Keep the data cached by the tests out of the cache folder of the user"""
+    from micropython_magic import precompile
+    from micropython_magic.fw_cache import FW_INFO_STORE
+
+    monkeypatch.setattr(precompile, "CACHE_DIR", tmp_path / "cache" / "mpy")
+    monkeypatch.setattr(FW_INFO_STORE, "path", tmp_path / "cache" / "fw_info.json")
+    return tmp_path / "cache"
+
+
+@pytest.fixture
+def fake_mcu():
+    """A fake MicroPython device on a pseudo-terminal"""
+    if sys.platform == "win32":  # pragma: no cover
+        pytest.skip("The fake MCU requires a posix pseudo-terminal")
+    with FakeMCU() as mcu:
+        yield mcu
+
+
+@pytest.fixture
+def ipy():
+    """An IPython shell with the micropython_magic extension loaded"""
+    from IPython.core.getipython import get_ipython
+    from IPython.testing.globalipapp import start_ipython
+
+    # only the first call starts the shell
+    start_ipython()
+    shell = get_ipython()
+    shell.extension_manager.load_extension("micropython_magic")
+    yield shell
+    shell.run_line_magic("config", "MicroPythonMagic.session = False")
+    shell.run_line_magic("config", "MicroPythonMagic.runtime = 'off'")
+    # the next fake MCU may re-use the same port
+    for mcu in shell.magics_manager.registry["MicroPythonMagic"]._MCU:
+        mcu.file_hashes.clear()
+        mcu.fw_info = None
+        mcu.runtime_ready = ""
+
+
+@pytest.fixture(params=[False, True], ids=["mpremote", "session"])
+def mpy_shell(request, ipy, fake_mcu):
+    """An IPython shell connected to a fake MCU, using the mpremote subprocess or a device session"""
+    ipy.run_line_magic("config", f"MicroPythonMagic.session = {request.param}")
+    ipy.run_line_magic("mpy", f"--select {fake_mcu.port}")
+    yield ipy
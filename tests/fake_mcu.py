@@ -0,0 +1,602 @@
+"""
+A fake MicroPython device on a pseudo-terminal.
+
+The device speaks enough of the MicroPython REPL protocols (friendly REPL, raw REPL,
+raw-paste and soft-reset) for mpremote to connect to it as if it was a real MCU.
+Code that is sent to the device is run in a sandboxed CPython namespace that provides
+a small subset of the MicroPython specific modules (micropython, machine, gc, time, os).
+
+This is used by the tests and benchmarks, and is not part of the installed package.
+"""
+
+from __future__ import annotations
+
+import builtins
+import ctypes
+import hashlib
+import os
+import queue
+import select
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import types
+from pathlib import Path
+from typing import List, Optional
+
+if sys.platform == "win32":  # pragma: no cover
+    raise ImportError("The fake MCU requires a posix pseudo-terminal")
+
+import pty
+import tty
+
+CTRL_A = b"\x01"
+CTRL_B = b"\x02"
+CTRL_C = b"\x03"
+CTRL_D = b"\x04"
+CTRL_E = b"\x05"
+
+BANNER = b'MicroPython v1.24.0 on 2024-10-25; Fake MCU with CPython\r\nType "help()" for more information.\r\n'
+RAW_BANNER = b"raw REPL; CTRL-B to exit\r\n"
+
+HEAP_SIZES = {"8K": 8 * 1024, "256K": 256 * 1024, "4M": 4 * 1024 * 1024}
+
+# sys.implementation._mpy for mpy v6.3 and armv6m
+FAKE_MPY = 6 | 3 << 8 | 4 << 10
+
+# modules from the CPython stdlib that behave close enough to their MicroPython counterpart
+PASSTHROUGH_MODULES = {
+    "array",
+    "binascii",
+    "collections",
+    "errno",
+    "hashlib",
+    "io",
+    "json",
+    "math",
+    "random",
+    "re",
+    "struct",
+}
+
+
+def mem_info_dump(heap_size: int = 8 * 1024, *, used_pct: float = 0.25, bytes_per_block=16) -> str:
+    """Generate a `micropython.mem_info(1)` style dump for a heap of `heap_size` bytes"""
+    blocks = heap_size // bytes_per_block
+    used_blocks = int(blocks * used_pct)
+    pattern = "hTLDFBMSA" + "=" * 7 + "h==m.."
+    lines = [
+        "stack: 548 out of 7936",
+        f"GC: total: {heap_size}, used: {used_blocks * bytes_per_block}, free: {(blocks - used_blocks) * bytes_per_block}",
+        f" No. of 1-blocks: {used_blocks // 4}, 2-blocks: {used_blocks // 8}, max blk sz: 64, max free sz: {blocks - used_blocks}",
+        "GC memory layout; from 20006e40:",
+    ]
+    addr = 0x20006E40
+    row_bytes = 64 * bytes_per_block
+    rows = blocks // 64
+    used_rows = (used_blocks + 63) // 64
+    row = (pattern * (64 // len(pattern) + 1))[:64]
+    for n in range(used_rows):
+        # vary the rows a little, so the maps are not all the same
+        shift = n % len(pattern)
+        lines.append(f"{addr + n * row_bytes:08x}: {row[shift:] + row[:shift]}")
+    free_rows = rows - used_rows - 1
+    if free_rows > 0:
+        lines.append(f"       ({free_rows} lines all free)")
+    if rows > used_rows:
+        lines.append(f"{addr + (rows - 1) * row_bytes:08x}: " + "." * 64)
+    return "\n".join(lines) + "\n"
+
+
+def captured_log(heap_size: int = 4 * 1024 * 1024, *, used_pct: float = 0.9) -> List[str]:
+    """A captured console log with a memory map of a (large) heap, and some other output"""
+    lines = ["MicroPython v1.24.0 on 2024-10-25; ESP32 module (spiram) with ESP32\n"]
+    lines += [f"sensor: {n}, {n * 0.5:.2f}\n" for n in range(1000)]
+    lines += ["*** Memory info: test ***\n"]
+    lines += mem_info_dump(heap_size, used_pct=used_pct).splitlines(keepends=True)
+    lines += ["*********************\n", "WARNING: low memory\n", "SUCCESS~ done\n"]
+    return lines
+
+
+class _DeviceInterrupt(BaseException):
+    """Raised when the device needs to stop the code that is running"""
+
+
+class _Stdout:
+    """stdout of the fake device, writes to the serial port"""
+
+    def __init__(self, mcu: "FakeMCU"):
+        self.mcu = mcu
+
+    def write(self, s):
+        if isinstance(s, str):
+            s = s.encode("utf-8")
+        self.mcu._write(bytes(s).replace(b"\n", b"\r\n"))
+        return len(s)
+
+    def flush(self):
+        pass
+
+
+class FakeMCU:
+    """A MicroPython device simulated on a pseudo-terminal."""
+
+    def __init__(
+        self,
+        *,
+        baudrate: int = 0,
+        latency: float = 0.0,
+        window_size: int = 128,
+        raw_paste: bool = True,
+        heap_dump: Optional[str] = None,
+        unique_id: Optional[bytes] = b"\xe6\x61\x38\x52\x83\x3a\x2b\x2e",
+    ):
+        """
+        args:
+            baudrate: emulate the transfer rate of a serial line, 0 for full speed
+            latency: seconds to wait before responding to a command
+            window_size: raw-paste flow control window size
+            raw_paste: support raw-paste mode
+            heap_dump: the output of `micropython.mem_info(1)`, defaults to a small generated heap
+            unique_id: the unique id of the device, None for a port without `machine.unique_id`
+        """
+        self.baudrate = baudrate
+        self.latency = latency
+        self.window_size = window_size
+        self.raw_paste = raw_paste
+        self.heap_dump = heap_dump or mem_info_dump()
+        self.unique_id = unique_id
+        self.root = Path(tempfile.mkdtemp(prefix="fake_mcu_"))
+        (self.root / "lib").mkdir()
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+        self.stats = {"soft_resets": 0, "hard_resets": 0, "executions": 0, "bytes_in": 0}
+        self._input: queue.Queue[bytes] = queue.Queue()
+        self._running = False
+        self._executing = False
+        self._exec_thread_id = 0
+        self._write_lock = threading.Lock()
+        self._threads: list[threading.Thread] = []
+        self._reset_namespace()
+
+    # -------------------------------------------------------------------------
+    # life cycle
+    # -------------------------------------------------------------------------
+    def start(self):
+        self._running = True
+        for target in (self._reader, self._protocol):
+            t = threading.Thread(target=target, daemon=True, name=f"FakeMCU{target.__name__}")
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def stop(self):
+        self._running = False
+        self._input.put(b"")
+        for t in self._threads:
+            t.join(timeout=2)
+        for fd in (self.master, self.slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # -------------------------------------------------------------------------
+    # serial line
+    # -------------------------------------------------------------------------
+    def _write(self, data: bytes):
+        if not data:
+            return
+        if self.baudrate:
+            # 10 bits per byte on the wire
+            time.sleep(len(data) * 10 / self.baudrate)
+        with self._write_lock:
+            view = memoryview(data)
+            while view:
+                try:
+                    n = os.write(self.master, view)
+                except BlockingIOError:  # pragma: no cover
+                    time.sleep(0.001)
+                    continue
+                except OSError:
+                    return
+                view = view[n:]
+
+    def _reader(self):
+        """read the bytes from the host, and handle interrupts while code is running"""
+        while self._running:
+            try:
+                ready, _, _ = select.select([self.master], [], [], 0.05)
+                if not ready:
+                    continue
+                data = os.read(self.master, 4096)
+            except OSError:
+                break
+            if not data:
+                continue
+            self.stats["bytes_in"] += len(data)
+            for i in range(len(data)):
+                c = data[i : i + 1]
+                if c == CTRL_C and self._executing:
+                    self._interrupt()
+                    continue
+                self._input.put(c)
+
+    def _interrupt(self):
+        ctypes.pythonapi.PyThreadState_SetAsyncExc(
+            ctypes.c_ulong(self._exec_thread_id), ctypes.py_object(KeyboardInterrupt)
+        )
+
+    def _read(self) -> bytes:
+        c = self._input.get()
+        if not self._running:
+            raise _DeviceInterrupt()
+        return c
+
+    # -------------------------------------------------------------------------
+    # REPL protocols
+    # -------------------------------------------------------------------------
+    def _protocol(self):
+        self._exec_thread_id = threading.get_ident()
+        mode = "friendly"
+        self._write(BANNER + b">>> ")
+        try:
+            while self._running:
+                if mode == "friendly":
+                    mode = self._friendly_repl()
+                else:
+                    mode = self._raw_repl()
+        except _DeviceInterrupt:
+            pass
+
+    def _friendly_repl(self) -> str:
+        line = bytearray()
+        while True:
+            c = self._read()
+            if c == CTRL_A:
+                self._write(b"\r\n" + RAW_BANNER)
+                return "raw"
+            if c == CTRL_B:
+                self._write(b"\r\n" + BANNER + b">>> ")
+                line = bytearray()
+            elif c == CTRL_C:
+                self._write(b"\r\nKeyboardInterrupt\r\n>>> ")
+                line = bytearray()
+            elif c == CTRL_D:
+                self._soft_reset()
+                self._write(BANNER + b">>> ")
+                line = bytearray()
+            elif c in (b"\r", b"\n"):
+                self._write(b"\r\n")
+                if line.strip():
+                    self._execute(line.decode("utf-8"), friendly=True)
+                self._write(b">>> ")
+                line = bytearray()
+            else:
+                self._write(c)
+                line += c
+
+    def _raw_repl(self) -> str:
+        line = bytearray()
+        self._write(b">")
+        while True:
+            c = self._read()
+            if c == CTRL_A:
+                if len(line) == 2 and line[0:1] == CTRL_E:
+                    if self.raw_paste:
+                        self._raw_paste()
+                        line = bytearray()
+                        self._write(b">")
+                        continue
+                # firmware without raw-paste support just resets the raw REPL
+                self._write(RAW_BANNER)
+                return "raw"
+            if c == CTRL_B:
+                self._write(b"\r\n" + BANNER + b">>> ")
+                return "friendly"
+            if c == CTRL_C:
+                line = bytearray()
+            elif c == CTRL_D:
+                self._write(b"OK")
+                if not line:
+                    self._write(b"\r\n")
+                    self._soft_reset()
+                    self._write(RAW_BANNER)
+                    return "raw"
+                self._respond(line.decode("utf-8"))
+                line = bytearray()
+                self._write(b">")
+            else:
+                line += c
+
+    def _raw_paste(self):
+        window = self.window_size
+        self._write(b"R\x01" + window.to_bytes(2, "little"))
+        data = bytearray()
+        remain = window
+        while True:
+            c = self._read()
+            if c == CTRL_D:
+                self._write(CTRL_D)
+                break
+            data += c
+            remain -= 1
+            if remain == 0:
+                # ask for the next window of data
+                remain = window
+                self._write(b"\x01")
+        self._respond(data.decode("utf-8"))
+
+    def _respond(self, code: str):
+        if self.latency:
+            time.sleep(self.latency)
+        error = self._execute(code)
+        self._write(CTRL_D)
+        self._write(error.replace(b"\n", b"\r\n"))
+        self._write(CTRL_D)
+
+    # -------------------------------------------------------------------------
+    # the sandbox
+    # -------------------------------------------------------------------------
+    def _reset_namespace(self):
+        self.modules: dict[str, types.ModuleType] = {}
+        self._allocated = 0
+        self.namespace = {"__name__": "__main__", "__builtins__": self._builtins()}
+
+    def _soft_reset(self):
+        self.stats["soft_resets"] += 1
+        self._write(b"MPY: soft reboot\r\n")
+        self._reset_namespace()
+
+    def _execute(self, code: str, friendly=False) -> bytes:
+        """run the code, return the MicroPython formatted traceback if it fails"""
+        self.stats["executions"] += 1
+        self._executing = True
+        try:
+            try:
+                if friendly:
+                    try:
+                        result = eval(compile(code, "<stdin>", "eval"), self.namespace)
+                        if result is not None:
+                            self.namespace["print"](repr(result))
+                        return b""
+                    except SyntaxError:
+                        pass
+                exec(compile(code, "<stdin>", "exec"), self.namespace)
+            finally:
+                self._executing = False
+        except SystemExit:
+            return b""
+        except BaseException as e:  # noqa
+            if isinstance(e, _DeviceInterrupt):
+                raise
+            return self._format_exception(e)
+        return b""
+
+    @staticmethod
+    def _format_exception(e: BaseException) -> bytes:
+        lines = ["Traceback (most recent call last):"]
+        for frame in traceback.extract_tb(e.__traceback__):
+            if frame.filename == "<stdin>" or frame.filename.startswith("/"):
+                if "fake_mcu" in frame.filename:
+                    continue
+                name = "<module>" if frame.name == "<module>" else frame.name
+                lines.append(
+                    f'  File "{Path(frame.filename).name if frame.filename != "<stdin>" else "<stdin>"}", line {frame.lineno}, in {name}'
+                )
+        msg = str(e)
+        if isinstance(e, OSError) and e.errno:
+            # MicroPython raises a plain OSError with the errno name
+            import errno
+
+            lines.append(f"OSError: [Errno {e.errno}] {errno.errorcode.get(e.errno, '')}")
+            return ("\n".join(lines) + "\n").encode("utf-8")
+        if isinstance(e, NameError):
+            msg = msg.replace("is not defined", "isn't defined")
+        lines.append(f"{type(e).__name__}: {msg}" if msg else type(e).__name__)
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+    def _path(self, path) -> Path:
+        path = str(path)
+        return self.root / path.lstrip("/")
+
+    def _builtins(self) -> dict:
+        b = dict(builtins.__dict__)
+        stdout = _Stdout(self)
+
+        def _print(*args, sep=" ", end="\n", file=None):
+            (file or stdout).write(sep.join(str(a) for a in args) + end)
+
+        def _open(path, mode="r", *args, **kwargs):
+            return open(self._path(path), mode, *args, **kwargs)
+
+        def _exec(code, globals=None, locals=None):
+            # code run with exec uses the builtins of the device
+            if globals is None:
+                caller = sys._getframe(1)
+                globals, locals = caller.f_globals, caller.f_locals if locals is None else locals
+            globals.setdefault("__builtins__", b)
+            return exec(code, globals, locals)
+
+        b["print"] = _print
+        b["open"] = _open
+        b["exec"] = _exec
+        b["__import__"] = self._import
+        b["input"] = None
+        b["exit"] = b["quit"] = None
+        self._stdout = stdout
+        return b
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        top = name.split(".")[0]
+        if top in self.modules:
+            return self.modules[top]
+        factory = getattr(self, f"_mod_{top}", None)
+        if factory:
+            mod = factory()
+        elif top in PASSTHROUGH_MODULES:
+            mod = __import__(top, globals, locals, fromlist, level)
+        else:
+            mod = self._import_file(top)
+        self.modules[top] = mod
+        return mod
+
+    def _import_file(self, name: str) -> types.ModuleType:
+        for folder in ("", "lib"):
+            src = self._path(f"{folder}/{name}.py")
+            if src.exists():
+                mod = types.ModuleType(name)
+                mod.__dict__["__builtins__"] = self.namespace["__builtins__"]
+                exec(compile(src.read_text(), f"/{name}.py", "exec"), mod.__dict__)
+                return mod
+        raise ImportError(f"no module named '{name}'")
+
+    # fake MicroPython modules
+    def _mod_sys(self):
+        mod = types.ModuleType("sys")
+        mod.platform = "rp2"
+        mod.version = "3.4.0; MicroPython v1.24.0 on 2024-10-25"
+        mod.implementation = types.SimpleNamespace(
+            name="micropython",
+            version=(1, 24, 0, ""),
+            _machine="Fake MCU with RP2040",
+            _mpy=FAKE_MPY,
+        )
+        mod.stdout = self._stdout
+        mod.modules = self.modules
+        mod.path = ["", "/lib"]
+        mod.maxsize = 2**30 - 1
+        mod.byteorder = "little"
+        mod.print_exception = lambda e, file=None: (file or self._stdout).write(
+            self._format_exception(e).decode()
+        )
+        return mod
+
+    def _mod_micropython(self):
+        mod = types.ModuleType("micropython")
+
+        def mem_info(verbose=None):
+            lines = self.heap_dump.splitlines(keepends=True)
+            text = "".join(lines if verbose else lines[:3])
+            self._stdout.write(text)
+
+        mod.mem_info = mem_info
+        mod.const = lambda x: x
+        mod.opt_level = lambda *a: 0
+        mod.alloc_emergency_exception_buf = lambda n: None
+        return mod
+
+    def _mod_gc(self):
+        mod = types.ModuleType("gc")
+        mod.collect = lambda: None
+        mod.enable = lambda: None
+        mod.disable = lambda: None
+        mod.isenabled = lambda: True
+        mod.mem_alloc = lambda: self._allocated
+        mod.mem_free = lambda: 192 * 1024 - self._allocated
+        mod.threshold = lambda *a: -1
+        return mod
+
+    def _mod_time(self):
+        mod = types.ModuleType("time")
+        t0 = time.perf_counter_ns()
+        period = 2**30
+
+        def sleep(s):
+            end = time.monotonic() + s
+            while time.monotonic() < end:
+                time.sleep(min(0.01, max(0, end - time.monotonic())))
+
+        mod.sleep = sleep
+        mod.sleep_ms = lambda ms: sleep(ms / 1000)
+        mod.sleep_us = lambda us: sleep(us / 1_000_000)
+        mod.ticks_us = lambda: ((time.perf_counter_ns() - t0) // 1000) % period
+        mod.ticks_ms = lambda: ((time.perf_counter_ns() - t0) // 1_000_000) % period
+        mod.ticks_cpu = mod.ticks_us
+        mod.ticks_add = lambda t, d: (t + d) % period
+        mod.ticks_diff = lambda a, b: ((a - b + period // 2) % period) - period // 2
+        mod.time = lambda: int(time.time())
+        mod.time_ns = time.time_ns
+        mod.localtime = lambda *a: time.localtime(*a)[:8]
+        mod.gmtime = lambda *a: time.gmtime(*a)[:8]
+        return mod
+
+    def _mod_machine(self):
+        mod = types.ModuleType("machine")
+
+        def reset():
+            self.stats["hard_resets"] += 1
+            self._reset_namespace()
+            raise SystemExit()
+
+        mod.reset = reset
+        mod.soft_reset = reset
+        mod.bootloader = reset
+        if self.unique_id is not None:  # not all ports have a unique id
+            mod.unique_id = lambda: self.unique_id
+        mod.freq = lambda *a: 125_000_000
+        return mod
+
+    def _mod_os(self):
+        mod = types.ModuleType("os")
+        mcu = self
+
+        def stat(path):
+            st = os.stat(mcu._path(path))
+            mode = 0x4000 if Path(mcu._path(path)).is_dir() else 0x8000
+            return (
+                mode,
+                0,
+                0,
+                0,
+                0,
+                0,
+                st.st_size,
+                int(st.st_mtime),
+                int(st.st_mtime),
+                int(st.st_mtime),
+            )
+
+        def ilistdir(path=""):
+            for p in sorted(mcu._path(path).iterdir()):
+                yield (
+                    p.name,
+                    0x4000 if p.is_dir() else 0x8000,
+                    0,
+                    0 if p.is_dir() else p.stat().st_size,
+                )
+
+        mod.stat = stat
+        mod.ilistdir = ilistdir
+        mod.listdir = lambda path="": sorted(p.name for p in mcu._path(path).iterdir())
+        mod.mkdir = lambda path: os.mkdir(mcu._path(path))
+        mod.remove = lambda path: os.remove(mcu._path(path))
+        mod.rmdir = lambda path: os.rmdir(mcu._path(path))
+        mod.rename = lambda a, b: os.rename(mcu._path(a), mcu._path(b))
+        mod.getcwd = lambda: "/"
+        mod.chdir = lambda path: None
+        mod.sync = lambda: None
+        mod.uname = lambda: types.SimpleNamespace(
+            sysname="rp2",
+            nodename="rp2",
+            release="1.24.0",
+            version="v1.24.0 on 2024-10-25",
+            machine="Fake MCU with RP2040",
+        )
+        mod.statvfs = lambda path: (4096, 4096, 352, 300, 300, 0, 0, 0, 0, 255)
+        return mod
+
+    def file_hash(self, path: str) -> str:
+        """sha256 of a file on the fake device"""
+        return hashlib.sha256(self._path(path).read_bytes()).hexdigest()
@@ -0,0 +1,84 @@
+import os
+import sys
+
+from IPython.utils.text import SList
+
+from micropython_magic.capture import CaptureBuffer, CapturedOutput
+from micropython_magic.interactive import ipython_run
+
+
+def test_fits_in_memory():
+    buffer = CaptureBuffer(10)
+    buffer.append("one\n")
+    buffer.append("two\r\nthree")
+    result = buffer.result()
+    assert isinstance(result, SList)
+    assert result == ["one", "two", "three"]
+
+
+def test_spill_to_disk(tmp_path):
+    buffer = CaptureBuffer(3, spill_dir=str(tmp_path))
+    for i in range(10):
+        buffer.append(f"line {i} – é\n")
+    assert len(buffer.ring) == 3
+    result = buffer.result()
+    assert isinstance(result, CapturedOutput)
+    assert result.spilled == 7
+    expected = [f"line {i} – é" for i in range(10)]
+    assert len(result) == 10
+    assert list(result) == expected
+    assert result[0] == expected[0]
+    assert result[6] == expected[6]
+    assert result[-1] == expected[-1]
+    assert result[2:8] == expected[2:8]
+    assert result.tail(2) == expected[-2:]
+    assert result.n == "\n".join(expected)
+    # the file is removed with the output
+    path = result.path
+    assert os.path.exists(path)
+    del result
+    assert not os.path.exists(path)
+
+
+def test_ipython_run_capture_lines():
+    cmd = [sys.executable, "-c", "for i in range(1000): print(i)"]
+    output = ipython_run(cmd, stream_out=False, store_output=False, capture_lines=100)
+    assert isinstance(output, CapturedOutput)
+    assert output.spilled == 900
+    assert list(output) == [str(i) for i in range(1000)]
+
+
+def test_spill_file_removed_without_result(tmp_path):
+    buffer = CaptureBuffer(2, spill_dir=str(tmp_path))
+    buffer.append("\n".join(str(i) for i in range(10)))
+    assert len(os.listdir(tmp_path)) == 1
+    buffer.close()
+    assert not os.listdir(tmp_path)
+    # also when the buffer is dropped after an error
+    buffer = CaptureBuffer(2, spill_dir=str(tmp_path))
+    buffer.append("\n".join(str(i) for i in range(10)))
+    del buffer
+    assert not os.listdir(tmp_path)
+    # a result keeps its file after close
+    buffer = CaptureBuffer(2, spill_dir=str(tmp_path))
+    buffer.append("\n".join(str(i) for i in range(10)))
+    result = buffer.result()
+    buffer.close()
+    assert list(result) == [str(i) for i in range(10)]
+
+
+def test_ipython_run_error_removes_spill_file(tmp_path, monkeypatch):
+    import pytest
+
+    from micropython_magic import capture
+    from micropython_magic.logger import MCUException
+
+    monkeypatch.setattr(capture.tempfile, "tempdir", str(tmp_path))
+    code = "for i in range(1000): print(i)\nprint('ValueError: oops')"
+    try:
+        ipython_run([sys.executable, "-c", code], stream_out=False, capture_lines=100)
+    except MCUException:
+        # while the traceback still refers to the output collector
+        assert not os.listdir(tmp_path)
+    else:
+        pytest.fail("MCUException not raised")
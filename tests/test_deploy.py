@@ -0,0 +1,127 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+from micropython_magic.deploy import DeployResult, collect_files, device_folders, summary_table
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="requires the fake MCU")
+
+
+@pytest.fixture
+def project(tmp_path: Path) -> Path:
+    """A small host project with a package folder"""
+    (tmp_path / "main.py").write_text("print('main')\n")
+    pkg = tmp_path / "mypkg"
+    (pkg / "sub").mkdir(parents=True)
+    (pkg / "__pycache__").mkdir()
+    (pkg / "__init__.py").write_text("VALUE = 42\n")
+    (pkg / "sub" / "data.bin").write_bytes(bytes(range(256)) * 8)
+    (pkg / "__pycache__" / "x.pyc").write_bytes(b"ignored")
+    return tmp_path
+
+
+def test_collect_files(project: Path):
+    files = collect_files([project / "main.py", project / "mypkg"], ":lib/")
+    assert sorted(files.values()) == [
+        "lib/main.py",
+        "lib/mypkg/__init__.py",
+        "lib/mypkg/sub/data.bin",
+    ]
+    assert device_folders(files.values()) == ["lib", "lib/mypkg", "lib/mypkg/sub"]
+    with pytest.raises(FileNotFoundError):
+        collect_files([project / "missing.py"])
+
+
+def test_summary_table():
+    results = {
+        "COM3": DeployResult("COM3", files=2, skipped=1, size=2048, seconds=2.0, attempts=1),
+        "COM4": DeployResult("COM4", attempts=3, failed=["lib/a.py"]),
+    }
+    table = summary_table(results).splitlines()
+    assert table[0].split() == [
+        "port",
+        "files",
+        "skipped",
+        "KB",
+        "seconds",
+        "KB/s",
+        "attempts",
+        "failed",
+    ]
+    assert table[1].split() == ["COM3", "2", "1", "2.0", "2.0", "1.0", "1"]
+    assert table[2].split()[-1] == "lib/a.py"
+    assert results["COM3"].ok and not results["COM4"].ok
+
+
+@pytest.mark.parametrize("session", [False, True], ids=["mpremote", "session"])
+def test_deploy_fleet(ipy, project: Path, session: bool, capsys):
+    from fake_mcu import FakeMCU
+
+    fleet = [FakeMCU().start() for _ in range(2)]
+    try:
+        ipy.run_line_magic("config", f"MicroPythonMagic.session = {session}")
+        ports = [mcu.port for mcu in fleet]
+        results = ipy.run_line_magic(
+            "mpy_deploy",
+            f"{project / 'main.py'} {project / 'mypkg'} -d :lib -o -s {' '.join(ports)}",
+        )
+        assert list(results) == ports
+        for mcu in fleet:
+            result = results[mcu.port]
+            assert result.ok, result
+            assert (result.files, result.attempts) == (3, 1)
+            assert (mcu.root / "lib/main.py").read_text() == "print('main')\n"
+            assert (mcu.root / "lib/mypkg/sub/data.bin").read_bytes() == bytes(range(256)) * 8
+            assert not (mcu.root / "lib/mypkg/__pycache__").exists()
+        out = capsys.readouterr().out
+        assert f"{ports[0]} | attempt 1: 3/3 files, 0 unchanged" in out
+        assert "attempts" in out.splitlines()[-3]
+        # a second deploy skips the unchanged files
+        (project / "main.py").write_text("print('changed')\n")
+        line = f"{project / 'main.py'} {project / 'mypkg'} -d :lib -q -o -s {' '.join(ports)}"
+        for result in ipy.run_line_magic("mpy_deploy", line).values():
+            assert (result.files, result.skipped) == (1, 2)
+        assert (fleet[0].root / "lib/main.py").read_text() == "print('changed')\n"
+        for result in ipy.run_line_magic("mpy_deploy", line + " --force").values():
+            assert (result.files, result.skipped) == (3, 0)
+    finally:
+        for mcu in fleet:
+            mcu.stop()
+
+
+def test_deploy_failed_files(ipy, fake_mcu, project: Path):
+    # a file on the device where a folder is needed
+    (fake_mcu.root / "lib" / "mypkg").write_text("not a folder")
+    ipy.run_line_magic("config", "MicroPythonMagic.session = True")
+    results = ipy.run_line_magic(
+        "mpy_deploy",
+        f"{project / 'main.py'} {project / 'mypkg'} -d lib --retries 1 -q -o -s {fake_mcu.port}",
+    )
+    result = results[fake_mcu.port]
+    assert not result.ok
+    assert result.attempts == 2
+    assert result.files == 1
+    assert result.failed == ["lib/mypkg/__init__.py", "lib/mypkg/sub/data.bin"]
+
+
+def test_deploy_hash_round_trips(ipy, fake_mcu, project: Path, monkeypatch):
+    from micropython_magic.mpr import MPRemote2
+
+    queries = []
+    device_hashes = MPRemote2.device_hashes
+    monkeypatch.setattr(
+        MPRemote2,
+        "device_hashes",
+        lambda self, files, **kw: queries.append(list(files)) or device_hashes(self, files, **kw),
+    )
+    ipy.run_line_magic("config", "MicroPythonMagic.session = True")
+    line = f"{project / 'main.py'} {project / 'mypkg'} -d lib -q -o -s {fake_mcu.port}"
+    assert ipy.run_line_magic("mpy_deploy", line)[fake_mcu.port].files == 3
+    # all files before the copy, then only the copied files are verified
+    assert len(queries) == 2 and len(queries[1]) == 3
+    queries.clear()
+    (project / "main.py").write_text("print('changed')\n")
+    assert ipy.run_line_magic("mpy_deploy", line)[fake_mcu.port].files == 1
+    # the hashes of the deployed files are known
+    assert queries == [["lib/main.py"], ["lib/main.py"]]
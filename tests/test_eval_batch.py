@@ -0,0 +1,59 @@
+import sys
+
+import pytest
+
+from micropython_magic.eval_batch import batch_code, batch_result, split_expressions
+from micropython_magic.logger import MCUException
+
+
+@pytest.mark.parametrize(
+    "line, expected",
+    [
+        ("1 + 1", None),
+        ("[1, 2]", None),
+        ("{1: 2}", None),
+        ("1 +", None),
+        ("a, b.c(1, 2)", ["a", "b.c(1, 2)"]),
+        ("(x, )", ["x"]),
+        ('{"t": temp(), "h": sensor.hum(1)}', {"t": "temp()", "h": "sensor.hum(1)"}),
+    ],
+)
+def test_split_expressions(line, expected):
+    assert split_expressions(line) == expected
+
+
+def test_batch_code_skips_syntax_errors():
+    code = batch_code({"a": "1 +", "b": "2"}, "<json~", "~json>")
+    assert "1 +" not in code
+    assert "_v = (2)" in code
+    compile(code, "<batch>", "exec")
+    result = batch_result({"a": "1 +", "b": "2"}, {"b": [1, "2"]})
+    assert isinstance(result["a"], MCUException)
+    assert result["b"] == 2
+
+
+def test_batch_result_repr():
+    results = {"0": [2, "bytearray(b'ab')"], "1": [2, "OrderedDict({'a': 1})"], "2": [2, "<obj>"]}
+    result = batch_result(["ba", "od", "obj"], results)
+    assert result == [bytearray(b"ab"), {"a": 1}, "<obj>"]
+    assert type(result[1]).__name__ == "OrderedDict"
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="requires the fake MCU")
+def test_eval_batch(mpy_shell, fake_mcu):
+    mpy_shell.run_line_magic("mpy", "-- x = 21")
+    executions = fake_mcu.stats["executions"]
+    assert mpy_shell.run_line_magic("mpy", "--eval x * 2, 'abc', [1, 2]") == [42, "abc", [1, 2]]
+    assert fake_mcu.stats["executions"] == executions + 1
+
+    result = mpy_shell.run_line_magic("mpy", '--eval {"x": x, "bad": 1 / 0, "raw": b"ab"}')
+    assert list(result) == ["x", "bad", "raw"]
+    assert result["x"] == 21
+    assert isinstance(result["bad"], MCUException)
+    assert str(result["bad"]).startswith("ZeroDivisionError")
+    assert result["raw"] == b"ab"
+
+    magic = mpy_shell.magics_manager.registry["MicroPythonMagic"]
+    assert magic.eval_many(["x + 1", "undefined"])[0] == 22
+    # a single expression is evaluated as before
+    assert mpy_shell.run_line_magic("mpy", "--eval x + 1") == 22
@@ -0,0 +1,123 @@
+"""Run the magics against the fake MCU, using both the mpremote subprocess and a device session"""
+
+import sys
+import time
+
+import pytest
+
+from micropython_magic.logger import MCUException
+from micropython_magic.memoryinfo import MemoryInfo
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="requires a pseudo-terminal")
+
+
+def test_eval(mpy_shell):
+    assert mpy_shell.run_line_magic("mpy", "--eval 21 * 2") == 42
+    assert mpy_shell.run_line_magic("mpy", "--eval {'a': [1, 2]}") == {"a": [1, 2]}
+
+
+def test_cell(mpy_shell, capsys):
+    mpy_shell.run_cell_magic("micropython", "", "for i in range(3):\n    print('line', i)")
+    assert capsys.readouterr().out.splitlines()[-3:] == ["line 0", "line 1", "line 2"]
+
+
+def test_state_is_kept(mpy_shell):
+    mpy_shell.run_line_magic("mpy", "counter = 41")
+    assert mpy_shell.run_line_magic("mpy", "--eval counter + 1") == 42
+
+
+def test_error(mpy_shell):
+    with pytest.raises(MCUException, match="ZeroDivisionError"):
+        mpy_shell.run_line_magic("mpy", "1/0")
+
+
+def test_writefile_readfile(mpy_shell, fake_mcu):
+    mpy_shell.run_cell_magic("micropython", "--writefile lib/blink.py", "led = 1\n")
+    assert (fake_mcu.root / "lib/blink.py").read_text().endswith("led = 1\n")
+    magics = mpy_shell.magics_manager.registry["MicroPythonMagic"]
+    assert magics.MCU.cell_from_mcu_file("lib/blink.py").endswith("led = 1\n")
+    # modules can be imported from /lib
+    assert mpy_shell.run_line_magic("mpy", "--eval __import__('blink').led") == 1
+
+
+def test_soft_reset(mpy_shell, fake_mcu):
+    mpy_shell.run_line_magic("mpy", "gone = 1")
+    mpy_shell.run_line_magic("mpy", "--reset")
+    assert fake_mcu.stats["soft_resets"] >= 1
+    with pytest.raises(MCUException, match="NameError"):
+        mpy_shell.run_line_magic("mpy", "print(gone)")
+
+
+def test_mem_info(mpy_shell, fake_mcu):
+    output = mpy_shell.run_line_magic("mpy", "import micropython; micropython.mem_info(1)")
+    mem_info = MemoryInfo(output)
+    assert mem_info.total == 8 * 1024
+    assert mem_info.used == 2048
+
+
+def test_raw_paste_fallback(ipy, capsys):
+    """Cells are still sent to devices without raw-paste support"""
+    from fake_mcu import FakeMCU
+
+    with FakeMCU(raw_paste=False) as mcu:
+        ipy.run_line_magic("config", "MicroPythonMagic.session = True")
+        ipy.run_line_magic("mpy", f"--select {mcu.port}")
+        ipy.run_cell_magic("micropython", "", "print('x' * 500)")
+    assert capsys.readouterr().out.splitlines()[-1] == "x" * 500
+
+
+@pytest.fixture
+def fleet():
+    """Three fake devices that take 0.5 seconds to respond"""
+    from fake_mcu import FakeMCU
+
+    devices = [FakeMCU(latency=0.5).start() for _ in range(3)]
+    yield devices
+    for mcu in devices:
+        mcu.stop()
+
+
+def test_multiple_devices(ipy, fleet, capsys):
+    ipy.run_line_magic("config", "MicroPythonMagic.session = True")
+    ports = [mcu.port for mcu in fleet]
+    start = time.monotonic()
+    result = ipy.run_cell_magic("micropython", f"--select {' '.join(ports)}", "print('hello')")
+    # the devices run at the same time
+    assert time.monotonic() - start < 1.4
+    assert list(result) == ports
+    assert all(output == ["hello"] for output in result.values())
+    out = capsys.readouterr().out.splitlines()
+    for port in ports:
+        assert f"{port} | hello" in out
+    assert ipy.run_line_magic("mpy", f"--select {' '.join(ports)} --eval 6 * 7") == {
+        port: 42 for port in ports
+    }
+
+
+def test_multiple_devices_error(ipy, fleet):
+    ports = [mcu.port for mcu in fleet[:2]]
+    fleet[1].namespace["fail"] = True
+    code = "if 'fail' in globals(): raise ValueError('oops')"
+    result = ipy.run_line_magic("mpy", f"--select {' '.join(ports)} -- {code}")
+    assert result[ports[0]] == []
+    assert isinstance(result[ports[1]], MCUException)
+
+
+def test_session_renders_output_while_device_is_quiet(fake_mcu, monkeypatch):
+    """Pending output is rendered while the device sleeps, not held back until it prints again"""
+    from micropython_magic.render import FrameRenderer
+    from micropython_magic.session import MCUSession
+
+    frames = []
+    render = FrameRenderer.render
+    monkeypatch.setattr(
+        FrameRenderer, "render", lambda self: frames.append(list(self.pending)) or render(self)
+    )
+    session = MCUSession(fake_mcu.port)
+    try:
+        code = "import time\nprint('a')\nprint('b')\ntime.sleep(1.5)\nprint('c')"
+        output = session.run_code(code, store_output=False, refresh_rate=1)
+    finally:
+        session.close()
+    assert list(output) == ["a", "b", "c"]
+    assert ["b\r\n"] in frames
@@ -0,0 +1,71 @@
+import contextlib
+import sys
+import types
+import zlib
+
+import pytest
+
+from micropython_magic.filehash import FileHash, host_hash, same_file
+from micropython_magic.logger import MCUException
+
+
+def test_host_hash(tmp_path):
+    f = tmp_path / "a.py"
+    f.write_bytes(b"print('hello')\n")
+    assert host_hash(f).size == 15
+    assert host_hash(f, "crc32") == FileHash(15, "crc32", f"{zlib.crc32(f.read_bytes()):08x}")
+    assert host_hash(f, "unknown") == FileHash(15)
+    assert same_file(f, host_hash(f))
+    assert same_file(f, host_hash(f, "crc32"))
+    assert not same_file(f, FileHash(-1))
+    assert not same_file(f, FileHash(15))
+    assert not same_file(f, FileHash(15, "sha256", "0" * 64))
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="requires the fake MCU")
+@pytest.mark.parametrize("sha256", [True, False], ids=["sha256", "crc32"])
+def test_device_hashes(mpy_shell, fake_mcu, tmp_path, sha256):
+    if not sha256:
+        # firmware without hashlib.sha256
+        fake_mcu.modules["hashlib"] = types.ModuleType("hashlib")
+    mcu = mpy_shell.magics_manager.registry["MicroPythonMagic"].MCU
+    src = tmp_path / "a.py"
+    src.write_bytes(b"x = 1\n" * 100)
+    mcu.copy_files_to_mcu({str(src): "lib/a.py"})
+    hashes = mcu.device_hashes(["lib/a.py", "missing.py"])
+    assert hashes["lib/a.py"] == host_hash(src, "sha256" if sha256 else "crc32")
+    assert hashes["missing.py"].size == -1
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="requires the fake MCU")
+def test_writefile_skips_unchanged(mpy_shell, fake_mcu):
+    cell = "print('hello')\n"
+    mpy_shell.run_cell_magic("micropython", "--writefile hello.py", cell)
+    assert (fake_mcu.root / "hello.py").read_text().endswith(cell)
+    mtime = (fake_mcu.root / "hello.py").stat().st_mtime_ns
+    # the hash of the copied file is known, the file is not copied again
+    executions = fake_mcu.stats["executions"]
+    mpy_shell.run_cell_magic("micropython", "--writefile hello.py", cell)
+    assert fake_mcu.stats["executions"] == executions
+    assert (fake_mcu.root / "hello.py").stat().st_mtime_ns == mtime
+    # after a reset the device is asked for the hash, and the file is not copied
+    mpy_shell.run_line_magic("mpy", "--reset")
+    executions = fake_mcu.stats["executions"]
+    mpy_shell.run_cell_magic("micropython", "--writefile hello.py", cell)
+    assert fake_mcu.stats["executions"] == executions + 1
+    assert (fake_mcu.root / "hello.py").stat().st_mtime_ns == mtime
+    # a changed cell is copied
+    mpy_shell.run_cell_magic("micropython", "--writefile hello.py", "print('changed')\n")
+    assert (fake_mcu.root / "hello.py").read_text().endswith("print('changed')\n")
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="requires the fake MCU")
+def test_writefile_failed_copy_is_not_cached(mpy_shell, fake_mcu):
+    cell = "print('hello')\n"
+    # the folder does not exist, the copy fails
+    with contextlib.suppress(MCUException):
+        mpy_shell.run_cell_magic("micropython", "--writefile nodir/a.py", cell)
+    assert not (fake_mcu.root / "nodir" / "a.py").exists()
+    mpy_shell.run_line_magic("mpy", "import os; os.mkdir('nodir')")
+    mpy_shell.run_cell_magic("micropython", "--writefile nodir/a.py", cell)
+    assert (fake_mcu.root / "nodir" / "a.py").read_text().endswith(cell)
@@ -0,0 +1,69 @@
+import sys
+
+import pytest
+
+from micropython_magic.fw_cache import FW_INFO_STORE, FWInfoStore
+
+
+def test_store(tmp_path):
+    store = FWInfoStore(tmp_path / "fw_info.json")
+    assert store.get("e661", "COM3") is None
+    store.put("COM3", {"unique_id": "e661", "port": "rp2"})
+    store.put("COM4", {"unique_id": "e662", "port": "esp32"})
+    store.put("COM5", {"unique_id": "", "port": "esp32"})  # no unique id, not stored
+    # a new store reads the same file
+    store = FWInfoStore(tmp_path / "fw_info.json")
+    assert store.get("e661", "COM3") == {"unique_id": "e661", "port": "rp2"}
+    assert store.get("e661", "COM4") is None
+    assert store.get("", "COM5") is None
+    assert store.has_port("COM3") and not store.has_port("COM5")
+    store.forget("COM3")
+    assert store.get("e661", "COM3") is None
+    assert store.get("e662", "COM4") is not None
+    (tmp_path / "fw_info.json").write_text("not json")
+    assert store.get("e662", "COM4") is None
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="requires the fake MCU")
+def test_fw_info_cached(mpy_shell, fake_mcu):
+    # an unknown device is not probed for its unique id first
+    executions = fake_mcu.stats["executions"]
+    info = mpy_shell.run_line_magic("mpy", "--info")
+    assert fake_mcu.stats["executions"] == executions + 1
+    assert info["unique_id"] == fake_mcu.unique_id.hex()
+    assert info["arch"] == "armv6m"
+    assert FW_INFO_STORE.get(info["unique_id"], fake_mcu.port)["mpy"] == "v6.3"
+    # later lookups need no round trip
+    executions = fake_mcu.stats["executions"]
+    assert mpy_shell.run_line_magic("mpy", "--info") == info
+    assert fake_mcu.stats["executions"] == executions
+
+    # after a kernel restart only the unique id of the device is read
+    mpy_shell.magics_manager.registry["MicroPythonMagic"].MCU.fw_info = None
+    assert mpy_shell.run_line_magic("mpy", "--info") == info
+    assert fake_mcu.stats["executions"] == executions + 1
+
+    # a hard reset forgets the info
+    mpy_shell.run_line_magic("mpy", "--hard-reset")
+    assert FW_INFO_STORE.get(info["unique_id"], fake_mcu.port) is None
+    executions = fake_mcu.stats["executions"]
+    assert mpy_shell.run_line_magic("mpy", "--info") == info
+    # a session may retry while the device restarts
+    assert fake_mcu.stats["executions"] >= executions + 1
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="requires the fake MCU")
+def test_fw_info_without_unique_id(mpy_shell, fake_mcu):
+    """a device without machine.unique_id is not cached, and the probe logs no error"""
+    from loguru import logger
+
+    FW_INFO_STORE.put(fake_mcu.port, {"unique_id": "0123", "port": "rp2"})
+    fake_mcu.unique_id = None
+    messages = []
+    sink = logger.add(messages.append, level="WARNING", format="{message}")
+    try:
+        info = mpy_shell.run_line_magic("mpy", "--info")
+    finally:
+        logger.remove(sink)
+    assert info["unique_id"] == ""
+    assert not messages
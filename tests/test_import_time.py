@@ -0,0 +1,49 @@
+"""Loading the extension should not import numpy, matplotlib or mpremote"""
+
+import json
+import subprocess
+import sys
+
+# seconds for `import micropython_magic` in a new interpreter, this includes importing IPython
+IMPORT_BUDGET = 1.5
+HEAVY_MODULES = ["numpy", "matplotlib", "mpremote"]
+
+
+def run_python(code: str) -> str:
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    return result.stdout
+
+
+def imported_after(code: str) -> list:
+    check = f"import sys, json\n{code}\nprint(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    return json.loads(run_python(check).splitlines()[-1])
+
+
+def test_no_heavy_imports():
+    assert imported_after("import micropython_magic") == []
+
+
+def test_meminfo_rendering_without_numpy():
+    code = (
+        "from IPython.lib.pretty import pretty\n"
+        "from micropython_magic.memoryinfo import MemoryInfo\n"
+        "pretty(MemoryInfo('GC: total: 1024, used: 16, free: 1008\\n20006e40: hT..'))"
+    )
+    assert imported_after(code) == []
+
+
+def test_numpy_on_demand():
+    code = (
+        "from micropython_magic.memoryinfo import DT_MEMINFO, MemoryInfoList\n"
+        "assert 'total' in DT_MEMINFO.names"
+    )
+    assert imported_after(code) == ["numpy"]
+
+
+def test_import_budget():
+    code = "import time; t = time.perf_counter(); import micropython_magic; print(time.perf_counter() - t)"
+    # the best of a few runs, to be less sensitive to a busy machine
+    best = min(float(run_python(code)) for _ in range(3))
+    assert best < IMPORT_BUDGET, f"import took {best:.3f}s, budget is {IMPORT_BUDGET}s"
@@ -0,0 +1,98 @@
+import sys
+import time
+
+from micropython_magic.interactive import OutputCollector, ipython_run
+
+
+def test_output_lines():
+    cmd = [sys.executable, "-c", "print('one'); print('two', end='')"]
+    output = ipython_run(cmd, stream_out=False, store_output=False)
+    assert output == ["one", "two"]
+
+
+def test_chatty_stderr_does_not_block():
+    # more than fits in the pipe buffer
+    code = "import sys; sys.stderr.write('x\\n' * 200_000); sys.stderr.flush(); print('done')"
+    output = ipython_run(
+        [sys.executable, "-c", code],
+        stream_out=False,
+        store_output=False,
+        log_errors=False,
+        timeout=20,
+    )
+    assert output == ["done"]
+
+
+def test_timeout():
+    code = "import time; print('started', flush=True); time.sleep(10)"
+    start = time.monotonic()
+    output = ipython_run(
+        [sys.executable, "-c", code], stream_out=False, store_output=False, timeout=0.5
+    )
+    assert time.monotonic() - start < 5
+    assert output == ["started"]
+
+
+def test_refresh_rate_batches_lines(capsys):
+    code = "import time\nfor i in range(20):\n    print(i, flush=True)\n    time.sleep(0.01)"
+    output = ipython_run(
+        [sys.executable, "-c", code], stream_out=True, store_output=False, refresh_rate=5
+    )
+    assert output == [str(i) for i in range(20)]
+    # every line is printed, in fewer frames
+    assert capsys.readouterr().out.splitlines() == output
+
+
+def test_long_line_in_chunks():
+    collector = OutputCollector(stream_out=False)
+    line = b"x" * 4_000_000
+    start = time.monotonic()
+    for i in range(0, len(line), 4096):
+        collector.feed(line[i : i + 4096])
+    collector.feed(b"\nnext\nlast")
+    assert time.monotonic() - start < 2
+    assert list(collector.all_out.result()) == [line.decode(), "next"]
+    collector.flush()
+    assert list(collector.all_out.result()) == [line.decode(), "next", "last"]
+
+
+def test_exit_code_is_reaped_and_logged(monkeypatch):
+    from loguru import logger
+
+    import micropython_magic.interactive as interactive
+
+    exit_codes = []
+    reap = interactive.reap
+    monkeypatch.setattr(interactive, "reap", lambda p: exit_codes.append(reap(p)) or exit_codes[-1])
+    messages = []
+    sink = logger.add(messages.append, level="WARNING", format="{message}")
+    try:
+        cmd = [sys.executable, "-c", "print('failed'); raise SystemExit(3)"]
+        output = ipython_run(cmd, stream_out=False, store_output=False)
+    finally:
+        logger.remove(sink)
+    assert output == ["failed"]
+    assert exit_codes == [3]
+    assert any("exited with code 3" in m for m in messages)
+
+
+def test_error_in_output_kills_the_process(monkeypatch):
+    import pytest
+
+    import micropython_magic.interactive as interactive
+    from micropython_magic.logger import MCUException
+
+    processes = []
+    popen = interactive.subprocess.Popen
+    monkeypatch.setattr(
+        interactive.subprocess,
+        "Popen",
+        lambda *a, **kw: processes.append(popen(*a, **kw)) or processes[-1],
+    )
+    code = "import time; print('ValueError: oops', flush=True); time.sleep(30)"
+    start = time.monotonic()
+    with pytest.raises(MCUException):
+        ipython_run([sys.executable, "-c", code], stream_out=False, store_output=False)
+    assert time.monotonic() - start < 10
+    assert processes[0].returncode is not None
+    assert processes[0].stdout.closed
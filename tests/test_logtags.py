@@ -0,0 +1,71 @@
+import pytest
+
+from micropython_magic.interactive import DEFAULT_LOG_TAGS, LineKind, LogTags, do_output
+from micropython_magic.logger import MCUException
+
+
+@pytest.mark.parametrize(
+    "line, meminfo, expected",
+    [
+        ("hello world\n", False, LineKind.NONE),
+        ("", True, LineKind.NONE),
+        ("ets Jun  8 2016 rst cause:1, boot mode:(3,6)\n", False, LineKind.RESET),
+        ("NameError: name 'x' isn't defined\n", False, LineKind.ERROR),
+        ("CRIT  : something bad\n", False, LineKind.ERROR),
+        ("Traceback (most recent call last):\n", False, LineKind.TRACE),
+        ('  File "<stdin>", line 3, in <module>\n', False, LineKind.TRACE),
+        ('  File "main.py", line 3, in foo\n', False, LineKind.TRACE),
+        # regexes only match at the start of the line
+        ('x File "main.py", line 3, in foo\n', False, LineKind.NONE),
+        ("WARNING: low battery\n", False, LineKind.WARNING),
+        ("SUCCESS~ all done WARN  : but\n", False, LineKind.WARNING | LineKind.SUCCESS),
+        ("GC: total: 8192, used: 2048, free: 6144\n", True, LineKind.MEMINFO),
+        ("GC: total: 8192, used: 2048, free: 6144\n", False, LineKind.NONE),
+        ("20006e40: hTLDFBMSA=======h==m..\n", True, LineKind.MEMINFO),
+        ("       (12 lines all free)\n", True, LineKind.NONE),
+        ("(12 lines all free)\n", True, LineKind.MEMINFO),
+        ("*** Memory info: test ***\n", True, LineKind.MEMINFO),
+    ],
+)
+def test_classify(line, meminfo, expected):
+    assert DEFAULT_LOG_TAGS.classify(line, meminfo=meminfo) == expected
+
+
+def test_classify_custom_tags():
+    tags = LogTags(
+        reset_tags=[],
+        error_tags=["FAIL"],
+        warning_tags=[],
+        success_tags=["PASS"],
+        ignore_tags=["DEBUG"],
+        trace_tags=[],
+        trace_res=[],
+    )
+    assert tags.classify("test_x PASS") == LineKind.SUCCESS
+    assert tags.classify("DEBUG: x=1") == LineKind.IGNORE
+    assert tags.classify("test_y FAIL (.*)") == LineKind.ERROR
+    assert not do_output("DEBUG: x=1", tags)
+    with pytest.raises(MCUException):
+        do_output("test_y FAIL", tags)
+
+
+def test_do_output():
+    assert do_output("hello\n", DEFAULT_LOG_TAGS)
+    assert not do_output("Traceback (most recent call last):\n", DEFAULT_LOG_TAGS)
+    assert not do_output("stack: 548 out of 7936\n", DEFAULT_LOG_TAGS, hide_meminfo=True)
+    assert do_output("stack: 548 out of 7936\n", DEFAULT_LOG_TAGS, hide_meminfo=False)
+    with pytest.raises(RuntimeError):
+        do_output("rst cause:1, boot mode:(3,6)", DEFAULT_LOG_TAGS)
+
+
+def test_overlapping_tags():
+    tags = LogTags(
+        reset_tags=[],
+        error_tags=["Error"],
+        warning_tags=["MemoryError"],
+        success_tags=[],
+        ignore_tags=[],
+        trace_tags=[],
+        trace_res=[],
+    )
+    assert tags.classify("MemoryError: out of memory") == LineKind.ERROR | LineKind.WARNING
@@ -0,0 +1,85 @@
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from micropython_magic.mcu_timeit import MCUTimeitResult, timeit_code
+
+
+@pytest.fixture
+def mpy_modules(monkeypatch):
+    """Provide the MicroPython specific functions used by the harness"""
+    allocated = [0]
+    fake_time = SimpleNamespace(
+        ticks_us=lambda: time.perf_counter_ns() // 1000,
+        ticks_diff=lambda a, b: a - b,
+    )
+    fake_gc = SimpleNamespace(
+        collect=lambda: None,
+        enable=lambda: None,
+        disable=lambda: None,
+        mem_alloc=lambda: allocated[0],
+    )
+    monkeypatch.setitem(sys.modules, "time", fake_time)
+    monkeypatch.setitem(sys.modules, "gc", fake_gc)
+    return allocated
+
+
+def run_harness(code: str, capsys) -> MCUTimeitResult:
+    exec(code, {})
+    result = MCUTimeitResult.from_output(capsys.readouterr().out.splitlines())
+    assert result
+    return result
+
+
+def test_fixed_loops(mpy_modules, capsys):
+    code = timeit_code("x = [1] * 10", number=5, repeat=3, collect=True)
+    result = run_harness(code, capsys)
+    assert result.loops == 5
+    assert result.repeat == 3
+    assert len(result.all_runs) == 3
+    assert result.best <= result.average <= result.worst
+    assert result.allocated == 0
+
+
+def test_auto_loops_with_setup(mpy_modules, capsys, monkeypatch):
+    monkeypatch.setattr("micropython_magic.mcu_timeit.MIN_RUN_US", 1000)
+    code = timeit_code("y = sum(data)\nz = y * 2", "data = list(range(100))", repeat=2)
+    result = run_harness(code, capsys)
+    assert result.loops >= 10
+    assert result.repeat == 2
+
+
+@pytest.mark.parametrize("runtime", [False, True])
+def test_setup_names_are_global(runtime):
+    code = timeit_code("x += 1\ny = x", "x = 0\nimport os", number=1, runtime=runtime)
+    assert "    global x\n" in code
+    # a statement that only reads the setup needs no declaration
+    assert "global" not in timeit_code("y = sum(data)", "data = [1, 2]", number=1)
+    # nor do the names of another scope
+    code = timeit_code("f = lambda y: y\nz = [y for y in data]", "def f(y):\n    y = 1\ndata = []")
+    assert "    global f\n" in code
+
+
+def test_setup_assigned_in_stmt(mpy_modules, capsys):
+    namespace = {}
+    exec(timeit_code("x += 1", "x = 0", number=5, repeat=2), namespace)
+    assert MCUTimeitResult.from_output(capsys.readouterr().out.splitlines())
+    # 2 runs of 5 loops, and 1 loop to measure the allocations
+    assert namespace["x"] == 11
+
+
+def test_allocations(mpy_modules, capsys):
+    def alloc():
+        mpy_modules[0] += 32
+
+    code = timeit_code("alloc()", number=1, repeat=1)
+    exec(code, {"alloc": alloc})
+    result = MCUTimeitResult.from_output(capsys.readouterr().out.splitlines())
+    assert result and result.allocated == 32
+    assert "32 bytes allocated per loop" in str(result)
+
+
+def test_no_result():
+    assert MCUTimeitResult.from_output(["Traceback (most recent call last):"]) is None
@@ -0,0 +1,51 @@
+import numpy as np
+from fake_mcu import mem_info_dump
+
+from micropython_magic.memoryinfo import MemoryInfo, MemoryInfoList
+from micropython_magic.memoryinfo_diff import diff_maps, object_types
+
+
+def blocks(text: str) -> np.ndarray:
+    return np.frombuffer(text.encode(), dtype=np.uint8)
+
+
+def test_object_types():
+    assert bytes(object_types(blocks("==T==.S=h="))) == b"hhTTT.SShh"
+
+
+def test_classify_blocks():
+    before = blocks("hT==..LL=S")
+    after = blocks("hT=.D=LD=")
+    diff = diff_maps(before, after)
+    assert diff.unchanged.tolist() == [1, 1, 1, 0, 0, 0, 1, 0, 0]
+    assert diff.freed.tolist() == [0, 0, 0, 1, 0, 0, 0, 0, 0]
+    assert diff.allocated.tolist() == [0, 0, 0, 0, 1, 1, 0, 0, 0]
+    # a tail of another object, and a tail of the same code after a new head
+    assert diff.type_changed.tolist() == [0, 0, 0, 0, 0, 0, 0, 1, 1]
+    assert diff.counts == {"allocated": 2, "freed": 1, "type_changed": 2, "unchanged": 4}
+    assert diff.by_type["D"] == {
+        "allocated": 4,
+        "freed": 0,
+        "allocated_bytes": 64,
+        "freed_bytes": 0,
+    }
+    assert diff.by_type["T"]["freed"] == 1
+    assert diff.by_type["L"]["freed"] == 2
+
+
+def test_longer_map():
+    # blocks beyond the end of the earlier map were free
+    diff = diff_maps(blocks("h"), blocks("h.S"), block_size=32)
+    assert diff.unchanged.tolist() == [1, 1, 0]
+    assert diff.by_type["S"]["allocated_bytes"] == 32
+
+
+def test_memoryinfo_diff():
+    maps = MemoryInfoList([mem_info_dump(64 * 1024, used_pct=p) for p in (0.25, 0.5)])
+    diff = maps.diff()
+    assert len(diff.unchanged) == len(maps[-1].mmap)
+    assert diff.counts["allocated"] > 0
+    assert sum(diff.counts.values()) == len(maps[-1].mmap)
+    assert maps[-1].diff(maps[0]).counts == diff.counts
+    same = MemoryInfo(mem_info_dump(8 * 1024))
+    assert same.diff(same).unchanged.all()
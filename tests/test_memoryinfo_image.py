@@ -0,0 +1,82 @@
+import struct
+import zlib
+
+import numpy as np
+from fake_mcu import mem_info_dump
+
+from micropython_magic.memoryinfo import COL_WIDTH, MemoryInfo, MemoryInfoList
+from micropython_magic.memoryinfo_image import (
+    ALLOCATED_RGB,
+    BLOCK_RGB,
+    FREED_RGB,
+    PADDING_RGB,
+    map_image,
+)
+
+
+def decode_png(data: bytes) -> np.ndarray:
+    """Decode the RGB images without filters that png_bytes writes"""
+    assert data[:8] == b"\x89PNG\r\n\x1a\n"
+    pos, chunks = 8, {}
+    while pos < len(data):
+        (length,) = struct.unpack(">I", data[pos : pos + 4])
+        kind, body = data[pos + 4 : pos + 8], data[pos + 8 : pos + 8 + length]
+        assert struct.unpack(">I", data[pos + 8 + length : pos + 12 + length])[0] == zlib.crc32(
+            kind + body
+        )
+        chunks[kind] = chunks.get(kind, b"") + body
+        pos += 12 + length
+    width, height, depth, color_type = struct.unpack(">IIBB", chunks[b"IHDR"][:10])
+    assert (depth, color_type) == (8, 2)
+    raw = np.frombuffer(zlib.decompress(chunks[b"IDAT"]), dtype=np.uint8)
+    raw = raw.reshape(height, 1 + width * 3)
+    assert not raw[:, 0].any()
+    return raw[:, 1:].reshape(height, width, 3)
+
+
+def test_image_colors():
+    info = MemoryInfo()
+    info.mmap = "=hT=L.." + "S" * 70
+    image = decode_png(info.png().data)
+    assert image.shape == (1, COL_WIDTH * 4, 3)
+    assert tuple(image[0, 0]) == BLOCK_RGB["h"]  # a tail at the start
+    assert tuple(image[0, 3]) == BLOCK_RGB["T"]  # a tail has the color of its head
+    assert tuple(image[0, 5]) == BLOCK_RGB["."]
+    assert tuple(image[0, 10]) == BLOCK_RGB["S"]
+    assert tuple(image[0, len(info.mmap)]) == PADDING_RGB
+
+
+def test_zoom_and_diff():
+    before, after = MemoryInfo(), MemoryInfo()
+    before.mmap, after.mmap = "hT..", "h.S."
+    image = map_image(after.blocks, 4, zoom=3, other=before.blocks)
+    assert image.shape == (3, 12, 3)
+    assert tuple(image[2, 2]) == tuple(int(c * 0.3) for c in BLOCK_RGB["h"])
+    assert tuple(image[0, 3]) == FREED_RGB
+    assert tuple(image[0, 6]) == ALLOCATED_RGB
+    assert (image[:, 9:] < 60).all()  # the same free block, dimmed
+
+
+def test_image_mode():
+    maps = MemoryInfoList([mem_info_dump(8 * 1024, used_pct=p) for p in (0.25, 0.5)])
+    assert maps._repr_png_() is None
+    assert maps[-1]._repr_png_() is None
+    maps.image, maps.zoom = True, 2
+    assert decode_png(maps._repr_png_()).shape == (2 * 2, COL_WIDTH * 4 * 2, 3)
+    maps.diff_with = (0, 1)
+    diff = decode_png(maps._repr_png_())
+    assert (diff == ALLOCATED_RGB).all(axis=-1).any()
+
+
+def test_image_mode_prints_only_the_header():
+    from IPython.lib.pretty import pretty
+
+    maps = MemoryInfoList([mem_info_dump(64 * 1024, used_pct=p) for p in (0.25, 0.5)])
+    text = pretty(maps)
+    maps.image = True
+    header = pretty(maps)
+    assert "Memory used:" in header
+    assert len(header) < 1000 < len(text)
+    maps.diff_with = (0, 1)
+    assert "Memory used:" in pretty(maps)
+    assert len(pretty(maps)) < 1000
@@ -132,5 +132,28 @@ def test_parse_log_with_multiple_entries():
     assert result[1].used == 20000
 
 
+def test_parse_map_free_lines():
+    """The map is stored one byte per block, with the free lines expanded when shown"""
+    from micropython_magic.memoryinfo import MemoryInfo
+
+    dump = "\n".join(
+        [
+            "GC: total: 4096, used: 64, free: 4032",
+            "20000000: hTL=....",
+            "       (2 lines all free)",
+            "20000c00: ..DA",
+        ]
+    )
+    info = MemoryInfo(dump)
+    assert info.mmap == "hTL=......DA"
+    info.show_free = True
+    info.parse(dump)
+    assert info.mmap == "hTL=...." + "." * 128 + "..DA"
+    assert bytes(info.blocks[:4]) == b"hTL="
+    assert len(info.blocks) == len(info.mmap)
+    info.mmap = "hS=="
+    assert list(info.blocks) == [ord(c) for c in "hS=="]
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
@@ -0,0 +1,74 @@
+import io
+import random
+
+import pytest
+from colorama import Fore, Style
+from fake_mcu import mem_info_dump
+from IPython.lib.pretty import PrettyPrinter
+
+from micropython_magic.memoryinfo import COL_WIDTH, MemoryInfo, MemoryInfoList
+
+
+def render_blockwise(info: MemoryInfo, other=None) -> str:
+    """Render the map block by block with pcolor and diff_color, as MemoryInfo did before"""
+    info._color_num = 0
+    width = COL_WIDTH * info.columns
+    text, color = "", Fore.WHITE
+    for i, c in enumerate(info.mmap):
+        if other is not None:
+            color = info.diff_color(c, other.mmap[i] if i < len(other.mmap) else "")
+        elif c != "=":
+            color = info.pcolor(c)
+        text += color + c
+        if (i + 1) % COL_WIDTH == 0:
+            text += f"{Style.RESET_ALL} "
+        if (i + 1) % width == 0:
+            text += Style.RESET_ALL + "\n"
+    return text
+
+
+def render(info: MemoryInfo, other=None) -> str:
+    out = io.StringIO()
+    pp = PrettyPrinter(out, max_width=1 << 30)
+    if other is None:
+        info._repr_pretty_(pp)
+    else:
+        info._repr_pretty_diff_(pp, False, other)
+    pp.flush()
+    return out.getvalue()[len(info._header()) :]
+
+
+def random_map(n: int) -> str:
+    return "".join(random.choice("==..hTLDFBMSAm=") for _ in range(n))
+
+
+@pytest.mark.parametrize("rainbow", [False, True])
+@pytest.mark.parametrize("columns", [1, 3, 4])
+def test_same_as_blockwise(rainbow, columns):
+    random.seed(columns)
+    info = MemoryInfo(mem_info_dump(64 * 1024), cols=columns)
+    info.rainbow = rainbow
+    assert render(info) == render_blockwise(info)
+    for n in (0, 1, COL_WIDTH, COL_WIDTH * columns, 1000):
+        info.mmap = "=" + random_map(n)
+        assert render(info) == render_blockwise(info)
+
+
+@pytest.mark.parametrize("columns", [1, 4])
+def test_diff_same_as_blockwise(columns):
+    random.seed(columns)
+    info, other = MemoryInfo(cols=columns), MemoryInfo()
+    for n, m in ((0, 10), (100, 100), (1000, 900), (512, 600)):
+        info.mmap, other.mmap = random_map(n), random_map(m)
+        assert render(info, other) == render_blockwise(info, other)
+
+
+def test_diff_list():
+    maps = MemoryInfoList([mem_info_dump(8 * 1024, used_pct=p) for p in (0.25, 0.5)])
+    before, after = maps
+    diff = after - before
+    out = io.StringIO()
+    pp = PrettyPrinter(out, max_width=1 << 30)
+    diff._repr_pretty_(pp, False)
+    pp.flush()
+    assert out.getvalue().endswith(render_blockwise(after, before))
@@ -0,0 +1,22 @@
+from micropython_magic.param_fixup import get_code, strip_options
+
+OPTIONS = {"--chunk", "--timeout", "--hard-reset"}
+
+
+def test_strip_options():
+    assert strip_options("x --chunk 100", OPTIONS) == "x"
+    assert strip_options("x --chunk=100 --timeout 5", OPTIONS) == "x"
+    assert strip_options("f(1) --hard-reset", OPTIONS) == "f(1)"
+    # options in strings, unknown options and subtractions are part of the code
+    assert strip_options("s.split(' --chunk ')", OPTIONS) == "s.split(' --chunk ')"
+    assert strip_options("x --other 1", OPTIONS) == "x --other 1"
+    assert strip_options("x --chunked", OPTIONS) == "x --chunked"
+    assert strip_options("x--chunk", OPTIONS) == "x--chunk"
+    # code that cannot be tokenized is left to the MCU
+    assert strip_options("'x --chunk 1", OPTIONS) == "'x --chunk 1"
+
+
+def test_get_code():
+    assert get_code("--eval x --chunk 100", "x", OPTIONS) == ["x"]
+    assert get_code("--eval x --chunk 100", "x") == ["x --chunk 100"]
+    assert get_code("--chunk 100 --eval [1, 2]", "[1,", OPTIONS) == ["[1, 2]"]
@@ -0,0 +1,126 @@
+import shutil
+import sys
+from importlib.util import find_spec
+from pathlib import Path
+
+import pytest
+
+from micropython_magic import precompile
+from micropython_magic.precompile import (
+    MpyCrossError,
+    MpyTarget,
+    cache_key,
+    check_header,
+    compile_source,
+    mpy_name,
+)
+
+needs_mpy_cross = pytest.mark.skipif(
+    not (find_spec("mpy_cross") or shutil.which("mpy-cross")), reason="mpy-cross not installed"
+)
+TARGET = MpyTarget("6.3", "armv6m")
+
+
+@pytest.fixture
+def cache_dir(cache_path) -> Path:
+    return precompile.CACHE_DIR
+
+
+def test_mpy_name():
+    assert mpy_name("lib/foo.py") == "lib/foo.mpy"
+    assert mpy_name("main.py") is None
+    assert mpy_name("lib/boot.py") is None
+    assert mpy_name("data.json") is None
+
+
+def test_target_from_fw_info():
+    assert MpyTarget.from_fw_info({"mpy": "v6.3", "arch": "armv6m"}) == TARGET
+    assert MpyTarget.from_fw_info({"mpy": "v6.1", "arch": ""}) == MpyTarget("6.1")
+    with pytest.raises(MpyCrossError):
+        MpyTarget.from_fw_info({"mpy": "", "arch": ""})
+
+
+def test_check_header():
+    check_header(b"M\x06\x00\x1f", TARGET)
+    check_header(b"M\x06\x13\x1f", TARGET)  # armv6m native code, v6.3
+    with pytest.raises(MpyCrossError):
+        check_header(b"M\x05\x00\x1f", TARGET)
+    with pytest.raises(MpyCrossError):
+        check_header(b"M\x06\x16\x1f", TARGET)
+    with pytest.raises(MpyCrossError):
+        check_header(b"print(1)", TARGET)
+
+
+def test_cache_key():
+    key = cache_key(b"x = 1", "foo.py", TARGET, 0)
+    assert key == cache_key(b"x = 1", "foo.py", TARGET, 0)
+    assert key != cache_key(b"x = 2", "foo.py", TARGET, 0)
+    assert key != cache_key(b"x = 1", "bar.py", TARGET, 0)
+    assert key != cache_key(b"x = 1", "foo.py", MpyTarget("6.3", "xtensa"), 0)
+    assert key != cache_key(b"x = 1", "foo.py", MpyTarget("6.1", "armv6m"), 0)
+    assert key != cache_key(b"x = 1", "foo.py", TARGET, 2)
+
+
+@needs_mpy_cross
+def test_compile_source(cache_dir: Path):
+    compiled = compile_source(b"x = 1\n", "lib/foo.py", TARGET)
+    assert compiled.parent == cache_dir
+    assert compiled.read_bytes()[:2] == b"M\x06"
+    assert b"lib/foo.py" in compiled.read_bytes()
+    mtime = compiled.stat().st_mtime_ns
+    # a cache hit does not compile again
+    assert compile_source(b"x = 1\n", "lib/foo.py", TARGET) == compiled
+    assert compiled.stat().st_mtime_ns == mtime
+    assert len(list(cache_dir.glob("*.mpy"))) == 1
+    with pytest.raises(MpyCrossError, match="foo.py"):
+        compile_source(b"x = = 1\n", "lib/foo.py", TARGET)
+
+
+@needs_mpy_cross
+@pytest.mark.skipif(sys.platform == "win32", reason="requires the fake MCU")
+def test_writefile_precompiled(mpy_shell, fake_mcu):
+    (fake_mcu.root / "lib" / "foo.py").write_text("old = True\n")
+    mpy_shell.run_cell_magic("micropython", "--writefile lib/foo.py --compile", "x = 1\n")
+    assert (fake_mcu.root / "lib" / "foo.mpy").read_bytes()[:2] == b"M\x06"
+    assert not (fake_mcu.root / "lib" / "foo.py").exists()
+    # main.py is always copied as source
+    mpy_shell.run_cell_magic("micropython", "--writefile main.py --compile", "x = 1\n")
+    assert (fake_mcu.root / "main.py").read_text().endswith("x = 1\n")
+
+
+@needs_mpy_cross
+@pytest.mark.skipif(sys.platform == "win32", reason="requires the fake MCU")
+def test_sync_precompiled(mpy_shell, fake_mcu, tmp_path: Path):
+    project = tmp_path / "project"
+    (project / "app").mkdir(parents=True)
+    (project / "main.py").write_text("import app\n")
+    (project / "app" / "__init__.py").write_text("VERSION = 1\n")
+    # an earlier source version on the device, that would be imported before the .mpy file
+    (fake_mcu.root / "proj" / "app").mkdir(parents=True)
+    (fake_mcu.root / "proj" / "app" / "__init__.py").write_text("VERSION = 0\n")
+    result = mpy_shell.run_line_magic("mpy_sync", f"{project} :proj --compile -q -o")
+    assert sorted(result.copied) == ["app/__init__.mpy", "main.py"]
+    assert (fake_mcu.root / "proj" / "app" / "__init__.mpy").read_bytes()[:2] == b"M\x06"
+    # also without --delete
+    assert result.deleted == ["app/__init__.py"]
+    assert not (fake_mcu.root / "proj" / "app" / "__init__.py").exists()
+    # the compiled files are cached, and unchanged on the device
+    result = mpy_shell.run_line_magic("mpy_sync", f"{project} :proj --compile -q -o")
+    assert (result.copied, result.unchanged) == ([], 2)
+
+
+@needs_mpy_cross
+@pytest.mark.skipif(sys.platform == "win32", reason="requires the fake MCU")
+def test_run_precompiled_cleans_up(mpy_shell, fake_mcu):
+    from IPython.core.error import UsageError
+
+    from micropython_magic.logger import MCUException
+
+    # the fake MCU cannot import .mpy files, the cleanup still runs
+    with pytest.raises(MCUException):
+        mpy_shell.run_cell_magic("micropython", "--compile", "x = 1\n")
+    assert not (fake_mcu.root / "_jupyter_cell.mpy").exists()
+    assert "_k" not in fake_mcu.namespace
+    assert "_jupyter_cell" not in fake_mcu.namespace
+    with pytest.raises(UsageError):
+        mpy_shell.run_cell_magic("micropython", f"--compile --mount {fake_mcu.root}", "x = 1\n")
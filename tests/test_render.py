@@ -0,0 +1,26 @@
+from micropython_magic.render import FrameRenderer
+
+
+def test_each_line(capsys):
+    renderer = FrameRenderer()
+    renderer.write("one\n")
+    assert capsys.readouterr().out == "one\n"
+
+
+def test_batched_frames(capsys):
+    renderer = FrameRenderer(refresh_rate=1)
+    for i in range(100):
+        renderer.write(f"{i}\n")
+    # the first line is rendered immediately, the rest waits for the next frame
+    assert capsys.readouterr().out == "0\n"
+    renderer.flush()
+    assert capsys.readouterr().out == "".join(f"{i}\n" for i in range(1, 100))
+    assert renderer.frames == 2
+
+
+def test_visible_lines():
+    renderer = FrameRenderer(refresh_rate=1, visible_lines=3)
+    for i in range(10):
+        renderer.write(f"{i}\n")
+    renderer.flush()
+    assert list(renderer.visible) == ["7", "8", "9"]
@@ -0,0 +1,95 @@
+import math
+from collections import OrderedDict
+
+import numpy as np
+import pytest
+
+from micropython_magic.mpr import MPRemote2
+from micropython_magic.repr_parser import ReprError, parse_repr
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("None", None),
+        ("True", True),
+        ("-12", -12),
+        ("1.5e-07", 1.5e-07),
+        ("-inf", -math.inf),
+        ("'it\\'s'", "it's"),
+        ('"tab\\there"', "tab\there"),
+        ("'héllo'", "héllo"),
+        ("b'\\x00ab'", b"\x00ab"),
+        ("bytearray(b'ab')", bytearray(b"ab")),
+        ("()", ()),
+        ("(1,)", (1,)),
+        ("(inf,)", (math.inf,)),
+        ("(1)", 1),
+        ("((1, 2))", (1, 2)),
+        ("[1, 2.5, -3]", [1, 2.5, -3]),
+        ("[1, 'a', [None, (2, 3)]]", [1, "a", [None, (2, 3)]]),
+        ("{}", {}),
+        ("{1, 2}", {1, 2}),
+        ("set()", set()),
+        ("{'a': (1, 2), 3: {b'x': []}}", {"a": (1, 2), 3: {b"x": []}}),
+        ("OrderedDict({'b': 1, 'a': 2})", OrderedDict([("b", 1), ("a", 2)])),
+        ("(2024, 10, 25, 4, 12, 0, 0, 0)", (2024, 10, 25, 4, 12, 0, 0, 0)),
+    ],
+)
+def test_parse_repr(text, expected):
+    result = parse_repr(text)
+    assert result == expected
+    assert type(result) == type(expected)
+
+
+def test_parse_nan():
+    assert math.isnan(parse_repr("nan"))
+    assert math.isnan(parse_repr("[1.0, nan]")[1])
+
+
+@pytest.mark.parametrize(
+    "text, dtype, values",
+    [
+        ("array('f', [1.5, -2.0])", np.float32, [1.5, -2.0]),
+        ("array('H', [1, 65535])", np.uint16, [1, 65535]),
+        ("array('b')", np.int8, []),
+    ],
+)
+def test_parse_array(text, dtype, values):
+    result = parse_repr(text)
+    assert isinstance(result, np.ndarray)
+    assert result.dtype == dtype
+    assert result.tolist() == values
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "__import__('os').system('ls')",
+        "print(1)",
+        "[1, 2",
+        "1 2",
+        "<function f at 0x20003>",
+        "array('z', [1])",
+        "{1: 2, 3}",
+        "",
+        # the constructors reject their arguments
+        "set(1)",
+        "bytearray('x')",
+    ],
+)
+def test_not_a_literal(text):
+    with pytest.raises(ReprError):
+        parse_repr(text)
+
+
+def test_nested_too_deep():
+    with pytest.raises(ReprError):
+        parse_repr("[" * 100_000 + "]" * 100_000)
+
+
+def test_load_json_from_mcu():
+    assert MPRemote2.load_json_from_MCU("<json~ [1, 2] ~json>") == [1, 2]
+    assert MPRemote2.load_json_from_MCU("<json~ (1, b'a') ~json>") == (1, b"a")
+    assert MPRemote2.load_json_from_MCU("<json~ __import__('os') ~json>") == "<~?~>"
+    assert MPRemote2.load_json_from_MCU("<json~ set(1) ~json>") == "<~?~>"
@@ -0,0 +1,90 @@
+import sys
+
+import pytest
+
+from micropython_magic.mpr import JSON_END, JSON_START
+from micropython_magic.runtime import (
+    RUNTIME_FILE,
+    install_code,
+    runtime_source,
+    runtime_version,
+)
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="requires the fake MCU")
+
+
+def magic(shell):
+    return shell.magics_manager.registry["MicroPythonMagic"]
+
+
+def test_runtime_source():
+    source = runtime_source(JSON_START, JSON_END)
+    compile(source, "_mpy_rt.py", "exec")
+    assert f'VERSION = "{runtime_version(JSON_START, JSON_END)}"' in source
+    assert runtime_version(JSON_START, JSON_END) == runtime_version(JSON_START, JSON_END)
+    assert runtime_version("<a", "b>") != runtime_version(JSON_START, JSON_END)
+    for mode in ("ram", "flash"):
+        compile(install_code(mode, JSON_START, JSON_END), "<install>", "exec")
+
+
+@pytest.mark.parametrize("mode", ["ram", "flash"])
+def test_runtime_same_results(mpy_shell, fake_mcu, mode):
+    expected = {
+        "eval": mpy_shell.run_line_magic("mpy", "--eval [1, 'two', {'three': 3.0}]"),
+        "bytes": mpy_shell.run_line_magic("mpy", "--eval bytes(range(10))"),
+        "stream": mpy_shell.run_line_magic("mpy", "--chunk 100 --eval list(range(300))"),
+    }
+    mpy_shell.run_line_magic("config", f"MicroPythonMagic.runtime = '{mode}'")
+    assert mpy_shell.run_line_magic("mpy", "--eval [1, 'two', {'three': 3.0}]") == expected["eval"]
+    assert mpy_shell.run_line_magic("mpy", "--eval bytes(range(10))") == expected["bytes"]
+    stream = mpy_shell.run_line_magic("mpy", "--chunk 100 --eval list(range(300))")
+    assert stream == expected["stream"]
+    magic(mpy_shell).MCU.fw_info = None
+    assert mpy_shell.run_line_magic("mpy", "--info")["unique_id"] == fake_mcu.unique_id.hex()
+    info = mpy_shell.run_line_magic("mpy", "--meminfo")
+    assert info.total > 0 and info.mmap
+    result = mpy_shell.run_line_magic("mpy_timeit", "-o -n 3 -r 2 x = [1] * 10")
+    assert result.loops == 3
+    assert (fake_mcu.root / RUNTIME_FILE.lstrip("/")).exists() == (mode == "flash")
+
+
+@pytest.mark.parametrize("mode", ["ram", "flash"])
+def test_runtime_installed_once(mpy_shell, fake_mcu, mode):
+    mpy_shell.run_line_magic("config", f"MicroPythonMagic.runtime = '{mode}'")
+    mcu = magic(mpy_shell).MCU
+    assert mpy_shell.run_line_magic("mpy", "--eval 1 + 1") == 2
+    assert mcu.runtime_ready
+    # later calls only send the call
+    executions = fake_mcu.stats["executions"]
+    assert mpy_shell.run_line_magic("mpy", "--eval 2 + 2") == 4
+    assert fake_mcu.stats["executions"] == executions + 1
+
+    # a soft reset removes the runtime from ram, it is installed again
+    mpy_shell.run_line_magic("mpy", "--soft-reset")
+    assert mpy_shell.run_line_magic("mpy", "--eval 3 + 3") == 6
+
+    # a different version on the MCU is replaced
+    if mode == "flash":
+        (fake_mcu.root / RUNTIME_FILE.lstrip("/")).write_text('VERSION = "old"\n')
+        mpy_shell.run_line_magic("mpy", "--soft-reset")
+    else:
+        mpy_shell.run_line_magic("mpy", "_mpy_rt.VERSION = 'old'")
+        mcu.runtime_ready = ""
+    executions = fake_mcu.stats["executions"]
+    assert mpy_shell.run_line_magic("mpy", "--eval 5 + 5") == 10
+    # check the version, install the runtime and evaluate
+    assert fake_mcu.stats["executions"] == executions + 3
+    if mode == "flash":
+        source = (fake_mcu.root / RUNTIME_FILE.lstrip("/")).read_text()
+        assert source == runtime_source(JSON_START, JSON_END)
+
+
+@pytest.mark.parametrize("mode", ["ram", "flash"])
+def test_runtime_without_resume(mpy_shell, fake_mcu, monkeypatch, mode):
+    mpy_shell.run_line_magic("config", f"MicroPythonMagic.runtime = '{mode}'")
+    mcu = magic(mpy_shell).MCU
+    monkeypatch.setattr(mcu, "resume", False)
+    assert mpy_shell.run_line_magic("mpy", "--eval 1 + 1") == 2
+    # without resume the MCU is reset before each command, and loses a runtime in ram
+    assert mcu.runtime_ready == ("" if mode == "ram" else "flash")
+    assert (fake_mcu.root / RUNTIME_FILE.lstrip("/")).exists() == (mode == "flash")
@@ -0,0 +1,27 @@
+import pytest
+
+from micropython_magic.session import split_commands
+
+
+@pytest.mark.parametrize(
+    "cmd, expected",
+    [
+        (["exec", "print(1)"], [["exec", "print(1)"]]),
+        (["eval", "1+1"], [["eval", "1+1"]]),
+        (["soft-reset", "eval", "True"], [["soft-reset"], ["eval", "True"]]),
+        (["cp", "foo.py", ":foo.py"], [["cp", "foo.py", ":foo.py"]]),
+        (["resume", "run", "script.py"], [["resume"], ["run", "script.py"]]),
+        (
+            ["cp", "a.py", ":a.py", "+", "cp", "b.py", ":b.py"],
+            [["cp", "a.py", ":a.py"], ["cp", "b.py", ":b.py"]],
+        ),
+        (["reset"], [["reset"]]),
+        # not supported in a session
+        (["mount", "folder", "run", "script.py"], None),
+        (["cp", "-r", "folder", ":"], None),
+        (["exec", "--no-follow", "print(1)"], None),
+        (["exec"], None),
+    ],
+)
+def test_split_commands(cmd, expected):
+    assert split_commands(cmd) == expected
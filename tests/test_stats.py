@@ -0,0 +1,70 @@
+import json
+import sys
+import time
+
+from micropython_magic.interactive import ipython_run
+from micropython_magic.stats import STATS, SpanStore, percentile, timed
+
+
+def test_percentile():
+    values = [float(i) for i in range(1, 101)]
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile(values, 100) == 100
+    assert percentile([3.0], 90) == 3
+    assert percentile([], 50) == 0
+
+
+def test_span_and_summary():
+    store = SpanStore(max_spans=100)
+    for _ in range(3):
+        with store.span("run_cmd", "operation", port="COM1") as args:
+            args["extra"] = 1
+            time.sleep(0.001)
+    store.record("spawn", time.perf_counter(), 0.5)
+    summary = store.summary()
+    assert summary["run_cmd"]["count"] == 3
+    assert summary["run_cmd"]["p50"] >= 0.001
+    assert summary["spawn"]["max"] == 0.5
+    assert store.spans[0].args == {"port": "COM1", "extra": 1}
+    assert "run_cmd" in store.table()
+
+
+def test_bounded():
+    store = SpanStore(max_spans=10)
+    for i in range(20):
+        store.record(f"op{i}", 0, 0)
+    assert len(store.spans) == 10
+    assert store.spans[0].name == "op10"
+
+
+def test_chrome_trace(tmp_path):
+    store = SpanStore()
+    store.record("connect", 1.0, 0.25, port="COM1")
+    path = store.save_chrome_trace(tmp_path / "trace.json")
+    trace = json.loads(path.read_text())
+    (event,) = trace["traceEvents"]
+    assert event["ph"] == "X"
+    assert event["ts"] == 1_000_000
+    assert event["dur"] == 250_000
+    assert event["args"] == {"port": "COM1"}
+
+
+def test_timed():
+    class Device:
+        port = "COM2"
+
+        @timed
+        def get_fw_info(self):
+            return 42
+
+    STATS.clear()
+    assert Device().get_fw_info() == 42
+    (span,) = STATS.spans
+    assert (span.name, span.category, span.args) == ("get_fw_info", "operation", {"port": "COM2"})
+
+
+def test_ipython_run_phases():
+    STATS.clear()
+    ipython_run([sys.executable, "-c", "print('hello')"], stream_out=False, store_output=False)
+    assert {"spawn", "startup", "output"} <= set(STATS.summary())
@@ -0,0 +1,72 @@
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+from micropython_magic.sync import MANIFEST, host_tree
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="requires the fake MCU")
+
+
+@pytest.fixture
+def project(tmp_path: Path) -> Path:
+    """A host project folder"""
+    (tmp_path / "app" / "drivers").mkdir(parents=True)
+    (tmp_path / "app" / "__pycache__").mkdir()
+    (tmp_path / "main.py").write_text("import app\n")
+    (tmp_path / "app" / "__init__.py").write_text("VERSION = 1\n")
+    (tmp_path / "app" / "drivers" / "led.py").write_text("PIN = 25\n")
+    (tmp_path / "app" / "__pycache__" / "x.pyc").write_bytes(b"ignored")
+    return tmp_path
+
+
+def test_host_tree(project: Path):
+    assert list(host_tree(project)) == ["app/__init__.py", "app/drivers/led.py", "main.py"]
+    with pytest.raises(NotADirectoryError):
+        host_tree(project / "main.py")
+
+
+def test_sync(mpy_shell, fake_mcu, project: Path, capsys):
+    root = fake_mcu.root / "proj"
+    result = mpy_shell.run_line_magic("mpy_sync", f"{project} :proj -o")
+    assert result.ok
+    assert sorted(result.copied) == ["app/__init__.py", "app/drivers/led.py", "main.py"]
+    assert result.created == ["", "app", "app/drivers"]
+    assert (root / "app" / "drivers" / "led.py").read_text() == "PIN = 25\n"
+    assert not (root / "app" / "__pycache__").exists()
+    manifest = json.loads((root / MANIFEST).read_text())
+    assert sorted(manifest) == sorted(result.copied)
+    assert "3 copied, 0 unchanged" in capsys.readouterr().out
+
+    # only the changed file is copied, extra files are kept
+    (project / "main.py").write_text("import app\napp.run()\n")
+    (root / "extra.py").write_text("extra")
+    (root / "old").mkdir()
+    (root / "old" / "x.py").write_text("old")
+    result = mpy_shell.run_line_magic("mpy_sync", f"{project} :proj -q -o")
+    assert (result.copied, result.unchanged, result.deleted) == (["main.py"], 2, [])
+    assert (root / "main.py").read_text() == "import app\napp.run()\n"
+    assert (root / "extra.py").exists()
+
+    # a dry run does not change the device
+    result = mpy_shell.run_line_magic("mpy_sync", f"{project} :proj --delete --dry-run -o")
+    assert result.deleted == ["extra.py", "old/x.py", "old"]
+    assert "delete old/x.py" in capsys.readouterr().out
+    assert (root / "old" / "x.py").exists()
+
+    result = mpy_shell.run_line_magic("mpy_sync", f"{project} :proj --delete -q -o")
+    assert (result.copied, result.unchanged) == ([], 3)
+    assert not (root / "extra.py").exists() and not (root / "old").exists()
+    assert sorted(p.name for p in root.iterdir()) == [MANIFEST, "app", "main.py"]
+
+
+def test_sync_uses_manifest(mpy_shell, fake_mcu, project: Path):
+    mpy_shell.run_line_magic("mpy_sync", f"{project} -q")
+    assert (fake_mcu.root / "main.py").exists()
+    # a file changed on the device, with the same size and time, is trusted from the manifest
+    manifest = json.loads((fake_mcu.root / MANIFEST).read_text())
+    manifest["main.py"][2] = "0" * len(manifest["main.py"][2])
+    (fake_mcu.root / MANIFEST).write_text(json.dumps(manifest))
+    result = mpy_shell.run_line_magic("mpy_sync", f"{project} -q -o")
+    assert result.copied == ["main.py"]
@@ -0,0 +1,137 @@
+import array
+import json
+import sys
+
+import numpy as np
+import pytest
+
+from micropython_magic.logger import MCUException
+from micropython_magic.transport import (
+    BIN_END,
+    BIN_START,
+    ChunkAssembler,
+    _to_pyarray,
+    eval_code,
+    load_binary,
+    stream_code,
+    to_array,
+)
+
+
+def run_on_host(statement: str) -> str:
+    """run the device code in CPython, and return the printed line"""
+    out = []
+
+    def _print(*args, sep=" ", end="\n"):
+        out.append(sep.join(str(a) for a in args) + end)
+
+    exec(eval_code(statement, "<json~", "~json>"), {"print": _print, "array": array.array})
+    lines = "".join(out).splitlines()
+    assert len(lines) == 1
+    return lines[0]
+
+
+@pytest.mark.parametrize(
+    "statement, expected",
+    [
+        ("array('h', range(-500, 500))", np.arange(-500, 500, dtype=np.int16)),
+        ("array('f', [1.5, -2.25])", np.array([1.5, -2.25], dtype=np.float32)),
+        ("array('d', [])", np.array([], dtype=np.float64)),
+        ("memoryview(b'abc')", np.array([97, 98, 99], dtype=np.uint8)),
+    ],
+)
+def test_binary_arrays(statement, expected):
+    line = run_on_host(statement)
+    assert line.startswith(BIN_START) and line.endswith(BIN_END)
+    result = load_binary(line)
+    assert isinstance(result, np.ndarray)
+    assert result.dtype == expected.dtype
+    assert np.array_equal(result, expected)
+
+
+def test_binary_bytes():
+    assert load_binary(run_on_host("bytes(range(256)) * 3")) == bytes(range(256)) * 3
+    assert load_binary(run_on_host("bytearray(b'')")) == bytearray()
+    assert run_on_host("[1, 2]") == "<json~ [1, 2] ~json>"
+
+
+def test_binary_size():
+    # 1000 floats as base64 is much smaller than as json text
+    line = run_on_host("array('f', [i / 7 for i in range(1000)])")
+    assert len(line) < 4000 * 1.4
+    assert len(repr([i / 7 for i in range(1000)])) > 4000 * 4
+
+
+def test_to_array_byteorder():
+    data = array.array("i", [1, -2]).tobytes()
+    if sys.byteorder == "little":
+        assert list(to_array(data, "i", 4, "little")) == [1, -2]
+    # a long on a 64 bit port
+    assert list(to_array(array.array("q", [3]).tobytes(), "i", 8, sys.byteorder)) == [3]
+    # without numpy
+    swapped = _to_pyarray(
+        array.array("H", [1]).tobytes(), "u", 2, "big" if sys.byteorder == "little" else "little"
+    )
+    assert swapped == array.array("H", [256])
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="requires the fake MCU")
+def test_eval_binary(mpy_shell, fake_mcu):
+    mpy_shell.run_line_magic("mpy", "-- from array import array; adc = array('H', range(2000))")
+    samples = mpy_shell.run_line_magic("mpy", "--eval adc")
+    assert isinstance(samples, np.ndarray)
+    assert samples.dtype == np.uint16
+    assert np.array_equal(samples, np.arange(2000))
+    assert mpy_shell.run_line_magic("mpy", "--eval b'\\x00\\xff'") == b"\x00\xff"
+    assert mpy_shell.run_line_magic("mpy", "--eval {'a': 1}") == {"a": 1}
+
+
+def stream_on_host(statement: str, chunk_size: int):
+    out = []
+
+    def _print(*args, sep=" ", end="\n"):
+        out.append(sep.join(str(a) for a in args) + end)
+
+    exec(stream_code(statement, chunk_size), {"print": _print, "array": array.array})
+    return "".join(out).splitlines()
+
+
+@pytest.mark.parametrize(
+    "statement",
+    [
+        "[i / 3 for i in range(500)]",
+        "{'a': [1, 2, {'b': None}], 'c': 'text with ~part> in it', 1: True}",
+        "(1, (2, 3))",
+        "[]",
+        "'a string'",
+    ],
+)
+def test_stream(statement):
+    expected = json.loads(json.dumps(eval(statement), default=list))
+    if isinstance(expected, dict):
+        expected = {str(k): v for k, v in expected.items()}
+    progress = []
+    assembler = ChunkAssembler(lambda done, total: progress.append((done, total)))
+    lines = stream_on_host(statement, 64)
+    for line in lines:
+        assert assembler.feed(line + "\r\n")
+        assert not assembler.feed("other output")
+    assert assembler.complete
+    assert assembler.result() == expected
+    # each chunk is bounded by the chunk size, plus the largest item
+    assert all(len(line) < 64 + 40 for line in lines)
+    assert progress[-1][0] == progress[-1][1]
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="requires the fake MCU")
+def test_eval_chunked(mpy_shell, fake_mcu, capsys):
+    mpy_shell.run_line_magic("mpy", "-- data = [i * 1.5 for i in range(2000)]")
+    data = mpy_shell.run_line_magic("mpy", "--chunk 256 --eval data")
+    assert data == [i * 1.5 for i in range(2000)]
+    assert "received 2000/2000 items" in capsys.readouterr().out
+    assert mpy_shell.run_line_magic("mpy", "--chunk 256 --eval bytes(3)") == bytes(3)
+    # options can also follow the expression
+    assert mpy_shell.run_line_magic("mpy", "--eval len(data) --chunk 256") == 2000
+    assert mpy_shell.run_line_magic("mpy", "--eval '--chunk' --chunk 256") == "--chunk"
+    with pytest.raises(MCUException):
+        mpy_shell.run_line_magic("mpy", "--chunk 256 --eval undefined_name")